@@ -0,0 +1,79 @@
+// The template puts the service worker's URL on the <script> tag.
+const SERVICE_WORKER_URL = document.currentScript.dataset.serviceWorker;
+
+const modal = document.getElementById('signupModal');
+const openBtn = document.getElementById('openSignup');
+const closeBtn = document.getElementById('closeModal');
+const submitBtn = document.getElementById('submitSignup');
+
+// Open modal
+openBtn.onclick = () => modal.style.display = 'flex';
+
+// Close modal
+closeBtn.onclick = () => modal.style.display = 'none';
+
+// Close when clicking outside
+window.onclick = (e) => {
+  if (e.target === modal) modal.style.display = 'none';
+};
+
+// -----------------------------
+// SIGNUP PROCESS
+// -----------------------------
+submitBtn.onclick = async () => {
+  const username = document.getElementById("username").value.trim();
+  const email = document.getElementById("email").value.trim();
+  const password = document.getElementById("password").value.trim();
+  const dob = document.getElementById("dob").value;
+
+  if (!username || !email || !password || !dob) {
+    alert("Please fill all fields before continuing.");
+    return;
+  }
+
+  // -----------------------------
+  // LOCAL STORAGE PART (CLIENT ONLY)
+  // -----------------------------
+  localStorage.setItem("heartnote_username", username);
+  localStorage.setItem("email", email);
+  localStorage.setItem("dob", dob);
+
+  // Calculate age
+  const birth = new Date(dob);
+  const today = new Date();
+  let age = today.getFullYear() - birth.getFullYear();
+  const m = today.getMonth() - birth.getMonth();
+  if (m < 0 || (m === 0 && today.getDate() < birth.getDate())) {
+    age--;
+  }
+
+  localStorage.setItem("age", age);
+  localStorage.setItem("mode", age < 18 ? "under18" : "adult");
+
+  // -----------------------------
+  // SEND ONLY SERVER DATA
+  // -----------------------------
+  const form = new FormData();
+  form.append("username", username);
+  form.append("email", email);
+  form.append("password", password);
+
+  const res = await fetch("/api/signup/", {
+    method: "POST",
+    body: form
+  });
+
+  const data = await res.json();
+
+  if (data.error) {
+    alert(data.error);
+    return;
+  }
+
+  // SUCCESS → Redirect
+  window.location.href = "/dashboard/";
+
+  if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register(SERVICE_WORKER_URL);
+  }
+};
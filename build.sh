@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+# Render build command. The minified bundles in static/ are committed
+# (manage.py build_assets), so this only fingerprints them for
+# WhiteNoise and applies any new migrations to db.sqlite3.
+set -o errexit
+
+pip install -r requirements.txt
+python manage.py collectstatic --no-input
+python manage.py migrate --no-input
@@ -0,0 +1,21 @@
+# Picked up automatically by `gunicorn hearnoteai.wsgi` from the project root.
+import os
+
+
+def on_starting(server):
+    # Prometheus sample files from a previous run would be summed into the
+    # new counters; start every deploy from an empty directory, and keep
+    # the workers' files when they restart (child_exit marks them dead).
+    from write import metrics_dir
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics")
+    metrics_dir.prepare(path, clean=True)
+    metrics_dir.claim(path)
+
+
+def child_exit(server, worker):
+    # Imported here: prometheus_client must not be loaded in the master
+    # before PROMETHEUS_MULTIPROC_DIR is set, or forked workers inherit
+    # its single-process value store.
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
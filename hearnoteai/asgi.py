@@ -3,6 +3,13 @@ ASGI config for hearnoteai project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving through this module routes the generation APIs to their async
+views (HEARTNOTE_ASYNC=1), and lets each process run as many Gemini
+calls at once as its async connection pool holds (see
+write/scheduler.py), e.g.:
+
+    uvicorn hearnoteai.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +19,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hearnoteai.settings')
+os.environ.setdefault('HEARTNOTE_ASYNC', '1')
 
 application = get_asgi_application()
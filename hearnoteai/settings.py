@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,11 +21,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
+IS_PRODUCTION = os.environ.get("RENDER", False)
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-crl!8gk0w!b2o(ikyj@7p*+*t&o!jymdh1w2#=ev0^l^v3mae7'
+# The fallback below is public (it is in this repo) and only for local
+# development; production refuses to start without DJANGO_SECRET_KEY.
+SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "")
+if not SECRET_KEY:
+    if IS_PRODUCTION:
+        raise ImproperlyConfigured("Set DJANGO_SECRET_KEY.")
+    SECRET_KEY = 'django-insecure-crl!8gk0w!b2o(ikyj@7p*+*t&o!jymdh1w2#=ev0^l^v3mae7'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Off on Render unless DJANGO_DEBUG=1. Only with DEBUG off does
+# {% static %} link the fingerprinted names collectstatic writes
+# (build.sh), which WhiteNoise caches for a year.
+DEBUG = os.environ.get("DJANGO_DEBUG", "0" if IS_PRODUCTION else "1") == "1"
 
 ALLOWED_HOSTS = [
     "heartnote-ai.onrender.com",
@@ -39,9 +52,6 @@ SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
 
-IS_PRODUCTION = os.environ.get("RENDER", False)
-
-
 
 
 # Application definition
@@ -58,25 +68,44 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Before everything else: static files need no session, timing or limits.
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    'write.middleware.ProfilingMiddleware',
+    'write.middleware.ServerTimingMiddleware',
+    'write.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'write.middleware.RateLimitMiddleware',
+    'write.middleware.UpstreamClientMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
 
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
-
 ROOT_URLCONF = 'hearnoteai.urls'
 
+# Templates are compiled once per process in production. The home,
+# aiwrite and dashboard pages are also rendered once and served from
+# memory with an ETag (write/pages.py); HEARTNOTE_PAGE_CACHE=0 turns that
+# off, and it is off by default while DEBUG is on and not on Render.
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+if IS_PRODUCTION or not DEBUG:
+    TEMPLATE_LOADERS = [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)]
+
+PAGE_CACHE = os.environ.get(
+    "HEARTNOTE_PAGE_CACHE", "1" if IS_PRODUCTION or not DEBUG else "0"
+) == "1"
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR,'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -88,18 +117,195 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'hearnoteai.wsgi.application'
 
+# hearnoteai/asgi.py turns this on so /api/generate/ and /api/dashboard/
+# are served by the async views; WSGI deployments keep the sync ones.
+ASYNC_GENERATION = os.environ.get("HEARTNOTE_ASYNC", "") == "1"
+
+# HEARTNOTE_JOBS=1 queues generation requests as jobs instead of calling
+# Gemini in the web worker (write/jobs.py); `python manage.py runjobs`
+# processes them, and clients fetch results from /api/jobs/<id>/.
+GENERATION_JOBS = os.environ.get("HEARTNOTE_JOBS", "") == "1"
+
+# Gemini endpoint. Point it at a local stub (python manage.py runstub)
+# to load-test without touching the real API.
+GEMINI_API_BASE = os.environ.get(
+    "GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta"
+)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuned for concurrent gunicorn workers:
+# - WAL lets readers run alongside the single writer; synchronous=NORMAL
+#   is durable in WAL mode except for the last commits on power loss.
+# - "timeout" is the busy timeout: a writer waits for the lock instead of
+#   failing at once with "database is locked".
+# - IMMEDIATE transactions take the write lock at BEGIN, so two
+#   transactions can't both read and then deadlock upgrading to write.
+# - Connections are kept for CONN_MAX_AGE seconds (health-checked before
+#   reuse). ASGI runs each request's queries on a fresh thread, where a
+#   persistent connection would never be reused, so it stays 0 there.
+# db.sqlite3 is tracked with the existing accounts, every migration
+# applied and WAL already set in its header, so a deploy from git starts
+# ready; run `manage.py migrate` when a new migration lands. SQLITE_PATH
+# puts the live database outside the checkout.
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-16000;"
+    f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))};"
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get("SQLITE_PATH", str(BASE_DIR / 'db.sqlite3')),
+        'CONN_MAX_AGE': 0 if ASYNC_GENERATION else int(os.environ.get("SQLITE_CONN_MAX_AGE", "600")),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# The "responses" cache holds generated text and is shared by every
+# gunicorn worker on the host (see write/response_cache.py). The
+# "sessions" cache skips FileBasedCache's cull, which lists the whole
+# directory on every write; manage.py cleanup_sessions prunes it instead.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "RESPONSE_CACHE_DIR", str(BASE_DIR / ".cache" / "responses")
+        ),
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "sessions": {
+        "BACKEND": "write.cache_backends.UnculledFileBasedCache",
+        "LOCATION": os.environ.get(
+            "SESSION_CACHE_DIR", str(BASE_DIR / ".cache" / "sessions")
+        ),
+    },
+}
+
+
+# Sessions. HEARTNOTE_SESSIONS picks the backend:
+#   cached_db       (default) read from the "sessions" cache, written
+#                   through to the database; a warm page load runs no query
+#   signed_cookies  no server state at all; the session (user id and
+#                   name) lives in a signed, not encrypted, cookie, so
+#                   it needs a DJANGO_SECRET_KEY from the environment:
+#                   whoever knows the key can sign in as anyone
+#   db              Django's default, one query per request
+# Expired rows and cache files are removed by manage.py cleanup_sessions
+# (run it from cron), never on the request path.
+
+SESSION_ENGINES = {
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+    "db": "django.contrib.sessions.backends.db",
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get("HEARTNOTE_SESSIONS", "cached_db")]
+if SESSION_ENGINE.endswith(".signed_cookies") and not os.environ.get("DJANGO_SECRET_KEY"):
+    raise ImproperlyConfigured("HEARTNOTE_SESSIONS=signed_cookies needs DJANGO_SECRET_KEY.")
+SESSION_CACHE_ALIAS = "sessions"
+
+
+# Identical in-flight generations are coalesced across workers with
+# per-key lock files here (write/singleflight.py). Empty disables it.
+SINGLEFLIGHT_LOCK_DIR = os.environ.get(
+    "SINGLEFLIGHT_LOCK_DIR", str(BASE_DIR / ".cache" / "flights")
+)
+
+
+# Rate limits for the generation APIs (write/middleware.py).
+# {path prefix: {mode or "*": (burst, requests per minute)}}; buckets are
+# keyed by session user, falling back to client IP, and live in a SQLite
+# file shared by all workers. Set RATELIMIT_DB="" for per-process buckets.
+
+RATELIMITS = {
+    "/api/generate/": {"*": (10, 20)},
+    "/api/dashboard/": {"*": (10, 20)},
+}
+# HEARTNOTE_RATELIMIT=0 switches limiting off (local load tests only).
+if os.environ.get("HEARTNOTE_RATELIMIT", "1") == "0":
+    RATELIMITS = {}
+RATELIMIT_DB = os.environ.get(
+    "RATELIMIT_DB", str(BASE_DIR / ".cache" / "ratelimit.sqlite3")
+)
+# Render puts one proxy in front of the app; trust only its X-Forwarded-For entry.
+RATELIMIT_PROXY_HOPS = 1 if IS_PRODUCTION else 0
+
+
+# Prometheus metrics (write/metrics.py). Every worker writes samples to
+# files in METRICS_DIR and /metrics sums them; gunicorn.conf.py clears
+# the directory when the master starts, and under any other server each
+# process removes the files of dead ones (write/metrics_dir.py). Empty
+# keeps metrics per process. When METRICS_TOKEN is set,
+# /metrics requires "Authorization: Bearer <token>".
+
+METRICS_DIR = os.environ.get(
+    "PROMETHEUS_MULTIPROC_DIR", str(BASE_DIR / ".cache" / "metrics")
+)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# Per-request phase timings (write/timing.py) are always returned in a
+# Server-Timing header; HEARTNOTE_TIMING_LOG=1 also logs them as one
+# JSON line per request on the "write.timing" logger (stdout).
+
+TIMING_LOG = os.environ.get("HEARTNOTE_TIMING_LOG", "") == "1"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "timing": {
+            "class": "logging.StreamHandler",
+            "stream": "ext://sys.stdout",
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "write.timing": {
+            "handlers": ["timing"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+
+# Sampling profiler (write/profiling.py). HEARTNOTE_PROFILE_RATE is the
+# fraction of requests profiled (0 = only requests with a signed
+# X-Heartnote-Profile header, see manage.py profile_token). The header is
+# signed with HEARTNOTE_PROFILE_SECRET, kept apart from SECRET_KEY; unset,
+# no header is accepted. Dumps are collapsed stacks in PROFILE_DIR, the
+# newest PROFILE_KEEP of them kept; an empty PROFILE_DIR turns it off.
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(BASE_DIR / ".cache" / "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("HEARTNOTE_PROFILE_RATE", "0"))
+PROFILE_INTERVAL = float(os.environ.get("HEARTNOTE_PROFILE_INTERVAL", "0.005"))
+PROFILE_SECRET = os.environ.get("HEARTNOTE_PROFILE_SECRET", "")
+PROFILE_TOKEN_MAX_AGE = 600
+PROFILE_KEEP = int(os.environ.get("HEARTNOTE_PROFILE_KEEP", "200"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -119,6 +325,28 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing. HEARTNOTE_PASSWORD_HASHER picks the hasher for new
+# passwords; the others stay listed so older hashes still verify once
+# there is a login (write/hashing.py). argon2 needs the argon2-cffi
+# package, bcrypt the bcrypt package.
+# Hashing runs on HASHING_WORKERS threads; past HASHING_QUEUE pending
+# hashes, signup answers 503 instead of queueing.
+
+PASSWORD_HASHER_CHOICES = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "argon2": "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "bcrypt": "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+}
+PASSWORD_HASHER = os.environ.get("HEARTNOTE_PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+] + ["django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher"]
+
+HASHING_WORKERS = int(os.environ.get("HASHING_WORKERS", "2"))
+HASHING_QUEUE = int(os.environ.get("HASHING_QUEUE", "32"))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -140,6 +368,18 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# collectstatic writes content-hashed copies (css/home.min.<hash>.css) plus
+# .gz and .br siblings; whitenoise serves those with a one-year immutable
+# Cache-Control. While DEBUG is on, pages link the plain names instead
+# and whitenoise serves them from static/ uncached. CSS/JS sources live in assets/ and are minified into
+# static/ by manage.py build_assets.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
 
 
 # Default primary key field type
@@ -0,0 +1,41 @@
+/* Built from assets/js/aiwrite.js by manage.py build_assets. */
+const SERVICE_WORKER_URL=document.currentScript.dataset.serviceWorker;(function(){const modeEl=document.getElementById("mode");const promptEl=document.getElementById("prompt");const emotionEl=document.getElementById("emotion");const emotionLabel=document.getElementById("emotionLabel");const generateBtn=document.getElementById("generateBtn");const outputEl=document.getElementById("output");const addHistoryBtn=document.getElementById("addHistoryBtn");const historyList=document.getElementById("historyList");const clearHistoryBtn=document.getElementById("clearHistory");const lenInfo=document.getElementById("lenInfo");const HISTORY_PAGE=20;let userDOB=localStorage.getItem("heartnote_dob")||null;let isAdult=false;function calculateAge(dob){const birth=new Date(dob);const diff=Date.now()-birth.getTime();return Math.floor(diff/(365.25*24*60*60*1000));}
+function showDOBOverlay(){document.getElementById("dobOverlay").style.display="flex";document.getElementById("dobSubmit").onclick=()=>{const enteredDOB=document.getElementById("dobInput").value;if(!enteredDOB)return;localStorage.setItem("heartnote_dob",enteredDOB);userDOB=enteredDOB;validateAge();document.getElementById("dobOverlay").style.display="none";};}
+function validateAge(){const age=calculateAge(userDOB);isAdult=age>=18;const childModes=["reflection","journal"];for(let option of modeEl.options){if(!isAdult&&!childModes.includes(option.value)){option.disabled=true;}else{option.disabled=false;}}}
+if(!userDOB){showDOBOverlay();}else{validateAge();}
+function clamp(v,min,max){return Math.max(min,Math.min(max,v));}
+function nowTs(){return new Date().toISOString();}
+function updateEmotionLabel(){const v=parseInt(emotionEl.value,10);if(v<25)emotionLabel.textContent="Soft";else if(v<60)emotionLabel.textContent="Balanced";else emotionLabel.textContent="Deep";}
+emotionEl.addEventListener("input",updateEmotionLabel);updateEmotionLabel();function emotionalHandwriteHTML(html,elementId,toneLevel="medium"){const el=document.getElementById(elementId);el.innerHTML="";el.classList.add("handwriting");let speed;switch(toneLevel.toLowerCase()){case"deep":speed=80;break;case"light":speed=35;break;default:speed=55;}
+const parser=new DOMParser();const doc=parser.parseFromString(html,"text/html");const nodes=[...doc.body.childNodes];let nodeIndex=0;let charIndex=0;let currentNode;let currentClone;const fullTextLength=doc.body.innerText.length;function typeNext(){if(!currentNode||charIndex>=currentNode.textContent.length){if(nodeIndex>=nodes.length){const lenInfo=document.getElementById("lenInfo");if(lenInfo){lenInfo.textContent=`${fullTextLength} chars`;}
+return;}
+currentNode=nodes[nodeIndex++];currentClone=currentNode.cloneNode(false);el.appendChild(currentClone);charIndex=0;}
+const text=currentNode.textContent;currentClone.textContent=text.slice(0,charIndex+1);charIndex++;setTimeout(typeNext,(charIndex%6===0)?speed*1.6:speed);}
+typeNext();}
+function getToneFromEmotion(value){const num=Number(value);if(num<=33)return"soft";if(num<=66)return"balanced";return"deep";}
+generateBtn.addEventListener("click",async()=>{const mode=modeEl.value;const text=promptEl.value.trim();const emotion=emotionEl.value;const outputBox=document.getElementById("output");if(!text){alert("Please enter something...");return;}
+const tone=getToneFromEmotion(emotion);outputBox.innerHTML="⏳ Generating...";const query=`?mode=${encodeURIComponent(mode)}&text=${encodeURIComponent(text)}&tone=${encodeURIComponent(tone)}`;try{if(window.EventSource){let started=false;const full=await streamGeneration(`/api/generate/stream/${query}`,chunk=>{if(!started){outputBox.innerHTML="";outputBox.classList.add("handwriting");started=true;}
+outputBox.appendChild(document.createTextNode(chunk));});const lenInfo=document.getElementById("lenInfo");if(lenInfo)lenInfo.textContent=`${full.length} chars`;return;}
+const url=`/api/generate/${query}`;const response=await fetch(url);const data=await jobResult(await response.json());emotionalHandwriteHTML(data.response,"output",tone);}catch(error){outputBox.innerHTML="⚠️ Error contacting backend.";}});async function jobResult(data){while(data.job&&(data.status==="queued"||data.status==="running")){const response=await fetch(`/api/jobs/${data.job}/?wait=20`);data=await response.json();await retryAfter(response,data);}
+return data;}
+function retryAfter(response,data){const seconds=Number(response.headers.get("Retry-After"));if(!seconds||(data.status!=="queued"&&data.status!=="running"))return;return new Promise(resolve=>setTimeout(resolve,seconds*1000));}
+function streamGeneration(url,onChunk){return new Promise((resolve,reject)=>{const source=new EventSource(url);let full="";let waiting=false;let reconnects=0;source.addEventListener("waiting",()=>{waiting=true;reconnects=0;});source.addEventListener("chunk",event=>{const chunk=JSON.parse(event.data);full+=chunk;onChunk(chunk);});source.addEventListener("done",()=>{source.close();resolve(full);});source.onerror=()=>{if(waiting&&source.readyState===EventSource.CONNECTING&&reconnects++<3)return;source.close();if(full)resolve(full);else reject(new Error("stream failed"));};});}
+document.addEventListener('DOMContentLoaded',function(){const clearButton=document.getElementById('clearBtn');const outputContainer=document.getElementById('output');const descInput=document.getElementById('prompt');const lenInfo=document.getElementById('lenInfo');function updateCharCount(){if(descInput&&lenInfo){const count=descInput.value.length;lenInfo.textContent=`${count} chars`;}}
+if(descInput){descInput.addEventListener('input',updateCharCount);updateCharCount();}
+if(clearButton){clearButton.addEventListener('click',function(){if(outputContainer){outputContainer.innerHTML='';}
+if(descInput){descInput.value='';}
+if(lenInfo){lenInfo.textContent='0 chars';}
+if(descInput){descInput.focus();}});}
+if(!clearButton||!outputContainer||!descInput||!lenInfo){console.error("Missing one or more required elements (clearBtn, outputContainer, descInput, or lenInfo).");}});let historyRender=0;function loadHistory(){return loadHistoryPage(null,++historyRender);}
+async function loadHistoryPage(before,render){const{items,next}=await HistoryStore.page("aiwrite",{before,limit:HISTORY_PAGE});if(render!==historyRender)return;if(!before)historyList.innerHTML="";if(!before&&!items.length){historyList.innerHTML=`<div class="muted">No saved entries yet. Generate and "Add to History".</div>`;return;}
+const fragment=document.createDocumentFragment();items.forEach(it=>{const div=document.createElement("div");div.className="hist-item";div.innerHTML=`<div style="flex:1"><strong style="display:block">${it.mode.toUpperCase()}</strong><div style="font-size:0.9rem;color:var(--text);margin-top:6px">${it.preview}</div></div>
+                           <div style="min-width:72px;display:flex;flex-direction:column;gap:6px">
+                             <button class="ghost" data-id="${it.id}" data-action="open">Open</button>
+                             <button class="ghost" data-id="${it.id}" data-action="delete">Delete</button>
+                           </div>`;fragment.appendChild(div);});if(next){const more=document.createElement("button");more.className="ghost";more.textContent="Show more";more.addEventListener("click",()=>{more.remove();loadHistoryPage(next,render);});fragment.appendChild(more);}
+historyList.appendChild(fragment);}
+addHistoryBtn.addEventListener("click",()=>{const text=outputEl.innerText.trim();if(!text){alert("Nothing to add.");return;}
+const mode=modeEl.value;const preview=text.length>90?text.slice(0,90)+"…":text;HistoryStore.add("aiwrite",{ts:nowTs(),mode,preview,text});loadHistory();addHistoryBtn.textContent="Saved ✓";setTimeout(()=>addHistoryBtn.textContent="⭐ Add to History",1200);});historyList.addEventListener("click",async(ev)=>{const btn=ev.target.closest("button[data-action]");if(!btn)return;const id=Number(btn.dataset.id);const action=btn.dataset.action;if(action==="open"){const it=await HistoryStore.get(id);if(!it)return;outputEl.innerText=it.text;lenInfo.textContent=`${it.text.length} chars`;if(it.mode)modeEl.value=it.mode;}else if(action==="delete"){if(!confirm("Delete this saved entry?"))return;await HistoryStore.remove(id);loadHistory();}});clearHistoryBtn.addEventListener("click",()=>{if(!confirm("Clear all saved history?"))return;HistoryStore.clear("aiwrite").then(loadHistory);});loadHistory();promptEl.addEventListener("keydown",(e)=>{if(e.key==="Enter"&&(e.ctrlKey||e.metaKey)){e.preventDefault();generateBtn.click();}});})();const THEME_COLORS={light:"#ffffff",dark:"#0e0e0f"};function updateThemeColor(theme){const meta=document.getElementById("themeColorMeta");if(!meta)return;meta.setAttribute("content",THEME_COLORS[theme]||"#ffffff");}
+const themeToggle=document.getElementById("themeToggle");const userTheme=localStorage.getItem("valantine_theme");if(userTheme==="dark")document.body.classList.add("dark");function updateThemeIcon(){themeToggle.textContent=document.body.classList.contains("dark")?"☀️":"🌙";}
+updateThemeColor(userTheme);updateThemeIcon();themeToggle.addEventListener("click",()=>{document.body.classList.toggle("dark");const isDark=document.body.classList.contains("dark");const theme=isDark?"dark":"light";localStorage.setItem("valantine_theme",theme);updateThemeIcon();updateThemeColor(theme);});const suggestionSets={reflection:["a moment today that changed how I felt","something someone said that stayed in my mind","a small mistake that taught me something","a decision I made and why it mattered","a moment I didn’t react but wanted to"],journal:["what actually happened today that affected me","a conversation that stood out","a moment I felt misunderstood","something I avoided saying today","one specific event I keep thinking about"],poem:["the night I couldn’t sleep and why","a memory that feels like rain","the room where everything changed","a goodbye I wasn’t ready for","a quiet moment that meant more than it looked"],story:["the exact moment I realized I was wrong","the sound or smell that triggered the change","the object I held in my hand when I almost gave up","the stranger who said something that changed everything","the very first morning after the event happened"],letter:["the day my sister cried and I stayed silent","when my father scolded me and I said nothing","the hospital visit when I couldn’t say sorry","the goodbye at the bus stop last year","when my friend moved away and I didn’t react"]};document.getElementById("suggestBtn").addEventListener("click",()=>{const modes=document.getElementById("mode").value;const list=suggestionSets[modes];const random=list[Math.floor(Math.random()*list.length)];document.getElementById("prompt").value=random;});function goHome(){window.location.href="/";}
+if('serviceWorker'in navigator){navigator.serviceWorker.register(SERVICE_WORKER_URL);navigator.serviceWorker.addEventListener("message",event=>{const msg=event.data||{};if(msg.type!=="heartnote:replayed"||!msg.url.startsWith("/api/generate/"))return;document.getElementById("output").innerText=msg.text;});navigator.serviceWorker.startMessages();const replayOutbox=()=>navigator.serviceWorker.ready.then(reg=>{if(reg.active)reg.active.postMessage({type:"heartnote:replay"});});window.addEventListener("online",replayOutbox);replayOutbox();}
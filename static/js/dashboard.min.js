@@ -0,0 +1,105 @@
+/* Built from assets/js/dashboard.js by manage.py build_assets. */
+const SERVICE_WORKER_URL=document.currentScript.dataset.serviceWorker;const username=localStorage.getItem('heartnote_username');if(username){document.getElementById('welcomeText').innerText=`Welcome, ${username} 💞`;}
+function openTool(name){document.getElementById("libraryView").style.display="none";document.getElementById("workspaceView").classList.remove("active");document.getElementById("accountView").classList.add("hidden");if(name==="Dashboard"){document.getElementById("libraryView").style.display="block";showRecents();return;}
+if(name==="Accounts"){document.getElementById("accountView").classList.remove("hidden");return;}
+document.getElementById('workspaceView').classList.add('active');document.getElementById('toolTitle').innerText=name;const fromRecentCard=window.event&&window.event.target.closest&&window.event.target.closest('.recent-card');document.getElementById("nameInput").value="";document.getElementById("descInput").value="";document.getElementById("depthInput").value="light";document.getElementById("output").innerText="Your words from that moment will appear here...";if(fromRecentCard){HistoryStore.page("recents",{mode:name,limit:1}).then(({items})=>{const found=items[0];if(!found||!found.output)return;document.getElementById("nameInput").value=found.nameInput||"";document.getElementById("descInput").value=found.descInput||"";document.getElementById("depthInput").value=found.depthInput||"light";document.getElementById("output").innerText=found.output;});}}
+let isViewingRecent=false;const RECENTS_PAGE=20;function saveRecent(toolName){const data={id:Date.now(),name:toolName,mode:toolName,icon:getToolIcon(toolName),time:new Date().toLocaleString(),preview:lastGeneratedText.substring(0,60)+"...",nameInput:document.getElementById("nameInput").value,descInput:document.getElementById("descInput").value,depthInput:document.getElementById("depthInput").value,output:lastGeneratedText};return HistoryStore.add("recents",data);}
+function getToolIcon(name){const icons={"Letters":"💌","Poems":"🪶","Story":"✨","Journal":"📔","Reflection":"🌿"};return icons[name]||"🪶";}
+let recentsRender=0;function showRecents(){const container=document.getElementById("recentCards");return showRecentsPage(container,null,++recentsRender);}
+async function showRecentsPage(container,before,render){const{items,next}=await HistoryStore.page("recents",{before,limit:RECENTS_PAGE});if(render!==recentsRender)return;if(!before)container.innerHTML="";if(!before&&items.length===0){container.innerHTML=`
+  <p class="no-recents">
+    No writings yet. Your first note will appear here.
+  </p>
+`;return;}
+const html=items.map(r=>`
+      <div class="recent-card">
+        <div class="recent-left" onclick="openRecent(${r.id})">
+          <span class="recent-icon">${r.icon}</span>
+          <div class="recent-text">
+    <p>${r.name}</p>
+    <small class="preview">${r.preview || ""}</small>
+    <small>${r.time}</small>
+</div>
+        </div>
+        <button class="delete-btn" onclick="deleteRecent(${r.id})">❌</button>
+      </div>
+    `).join("");container.insertAdjacentHTML("beforeend",html);if(next){const more=document.createElement("button");more.className="load-more";more.textContent="Show more";more.onclick=()=>{more.remove();showRecentsPage(container,next,render);};container.appendChild(more);}}
+window.addEventListener("DOMContentLoaded",showRecents);function deleteRecent(id){HistoryStore.remove(id).then(showRecents);}
+async function openRecent(id){const state=document.getElementById("state");state.dataset.viewing="true";const item=await HistoryStore.get(id);if(!item)return;isViewingRecent=true;document.getElementById("toolTitle").innerText=item.name;document.getElementById("nameInput").value=item.nameInput||"";document.getElementById("descInput").value=item.descInput||"";document.getElementById("depthInput").value=item.depthInput||"";document.getElementById("output").innerText=item.output||"";document.getElementById("libraryView").style.display="none";document.getElementById("workspaceView").classList.add("active");}
+function capitalizeFirst(str){return str.charAt(0).toUpperCase()+str.slice(1);}
+let typingInterval=null;let isWriting=false;let generatedTool=null;let lastGeneratedText="";let hasGeneratedContent=false;function goBack(){const state=document.getElementById("state");const isViewingRecent=state.dataset.viewing==="true";if(typingInterval){clearInterval(typingInterval);typingInterval=null;}
+isWriting=false;const isFallback=state.dataset.fallback==="true";if(hasGeneratedContent&&lastGeneratedText&&!isViewingRecent&&generatedTool&&!isFallback){saveRecent(capitalizeFirst(generatedTool));}
+hasGeneratedContent=false;lastGeneratedText="";generatedTool=null;state.dataset.blocked="false";state.dataset.viewing="false";state.dataset.fallback="false";openTool("Dashboard");const dashboardLink=document.getElementById("menu-dashboard");if(dashboardLink)setActiveMenu(dashboardLink);document.getElementById("workspaceView").classList.remove("active");document.getElementById("libraryView").style.display="block";showRecents();}
+function getToneFromEmotion(value){const num=Number(value);if(num<=33)return"light";if(num<=66)return"medium";return"deep";}
+function emotionalTypeWrite(text,elementId,depth,onComplete){const el=document.getElementById(elementId);el.innerHTML="";let i=0;let speed=55;if(depth==="light")speed=35;if(depth==="deep")speed=80;if(typingInterval){clearTimeout(typingInterval);typingInterval=null;}
+function typeNext(){if(i>=text.length){typingInterval=null;if(onComplete)onComplete();return;}
+let char=text.charAt(i);el.innerHTML+=char;i++;let pause=speed;if(char===","||char===";")pause+=120;if(char==="."||char==="!"||char==="?")pause+=200;if(char==="\n")pause+=300;if(depth==="deep"&&Math.random()<0.06)pause+=150;typingInterval=setTimeout(typeNext,pause);}
+typeNext();}
+async function generateContent(){if(isWriting)return;isWriting=true;const name=document.getElementById("nameInput").value.trim();const desc=document.getElementById("descInput").value.trim();const depth=document.getElementById("depthInput").value;const mode=document.getElementById("toolTitle").innerText.trim().toLowerCase();generatedTool=mode;if(!name&&!desc){alert("Please write something.");isWriting=false;return;}
+const language=getCurrentLanguage();const output=document.getElementById("output");output.innerHTML="✍️ Writing from the heart...";const query=`?mode=${encodeURIComponent(mode)}`+`&name=${encodeURIComponent(name)}`+`&desc=${encodeURIComponent(desc)}`+`&depth=${encodeURIComponent(depth)}`+`&language=${encodeURIComponent(language)}`;if(window.EventSource){try{let started=false;const result=await streamGeneration(`/api/dashboard/stream/${query}`,chunk=>{if(!started){if(typingInterval){clearTimeout(typingInterval);typingInterval=null;}
+output.innerHTML="";started=true;}
+output.appendChild(document.createTextNode(chunk));});const state=document.getElementById("state");state.dataset.fallback=result.flags.is_fallback===true?"true":"false";lastGeneratedText=result.text.trim();hasGeneratedContent=true;}catch(err){console.error(err);output.innerHTML="⚠️ Something went wrong. Please try again.";}
+isWriting=false;return;}
+try{const url=`/api/dashboard/${query}`;const res=await fetch(url);const data=await jobResult(await res.json());const state=document.getElementById("state");const blocked=data.response.blocked===true;const isFallback=data.response.is_fallback===true;state.dataset.fallback=isFallback?"true":"false";const text=data.response.response.trim();lastGeneratedText=text;hasGeneratedContent=true;emotionalTypeWrite(text,"output",depth,()=>{isWriting=false;});}catch(err){console.error(err);output.innerHTML="⚠️ Something went wrong. Please try again.";isWriting=false;}}
+async function jobResult(data){while(data.job&&(data.status==="queued"||data.status==="running")){const res=await fetch(`/api/jobs/${data.job}/?wait=20`);data=await res.json();await retryAfter(res,data);}
+return data;}
+function retryAfter(res,data){const seconds=Number(res.headers.get("Retry-After"));if(!seconds||(data.status!=="queued"&&data.status!=="running"))return;return new Promise(resolve=>setTimeout(resolve,seconds*1000));}
+function streamGeneration(url,onChunk){return new Promise((resolve,reject)=>{const source=new EventSource(url);let text="";let waiting=false;let reconnects=0;source.addEventListener("waiting",()=>{waiting=true;reconnects=0;});source.addEventListener("chunk",event=>{const chunk=JSON.parse(event.data);text+=chunk;onChunk(chunk);});source.addEventListener("done",event=>{source.close();resolve({text,flags:JSON.parse(event.data)});});source.onerror=()=>{if(waiting&&source.readyState===EventSource.CONNECTING&&reconnects++<3)return;source.close();if(text)resolve({text,flags:{complete:false}});else reject(new Error("stream failed"));};});}
+function showHeartNotePopup(title,message,onConfirm){document.getElementById("hn-popup-title").innerText=title;document.getElementById("hn-popup-message").innerText=message;const confirmBtn=document.getElementById("hn-popup-confirm");confirmBtn.onclick=()=>{closeHeartNotePopup();if(onConfirm)onConfirm();};document.getElementById("hn-popup").classList.remove("hidden");}
+function closeHeartNotePopup(){document.getElementById("hn-popup").classList.add("hidden");}
+function confirmExitWhileWriting(action){if(isWriting){showHeartNotePopup("Your writing is still in progress 💗","If you switch now, this draft will stop generating.",()=>{isWriting=false;if(typingInterval){clearInterval(typingInterval);typingInterval=null;}
+action();});}else{action();}}
+function copyText(){const tool=document.getElementById("toolTitle").innerText.toLowerCase();const text=document.getElementById("output").innerText;const sensitiveTools=["letters","poems","story"];if(sensitiveTools.includes(tool)){showHeartNotePopup("Before you copy 💗","This piece may contain personal emotions.\nMake sure it represents what you truly want to say.",()=>{navigator.clipboard.writeText(text);showHeartNotePopup("Copied","Your text has been copied to clipboard.",null,"Okay");},"Copy Anyway");}else{navigator.clipboard.writeText(text);showHeartNotePopup("Copied","Your text has been copied to clipboard.",null,"Okay");}}
+function suggestName(){const mode=currentMode();let ideas=[];switch(mode){case"reflection":ideas=["The mistake I learned from","A hard decision I made","A moment I stayed silent","Something I outgrew","A turning point in my life"];break;case"journal":ideas=["What happened today","A conversation I had","Something that bothered me","A small win today","Something I avoided"];break;case"letters":ideas=["A message I never sent","What I wanted to say that day","An apology I couldn’t express","A thank you I never fully said","Words I held back"];break;case"poems":ideas=["A quiet evening alone","Rain outside my window","The last time we met","A fading memory","Waiting without knowing"];break;case"story":ideas=["The day everything changed","A stranger who helped me","A risk that scared me","Losing something important","Starting again from zero"];break;case"quotes":ideas=["After a failure","When no one understands","During a hard season","When healing feels slow","On letting go"];break;default:ideas=["Something I am learning","A recent realization","A difficult memory","An important lesson","A quiet thought"];}
+document.getElementById("nameInput").value=ideas[Math.floor(Math.random()*ideas.length)];}
+function selectEmotion(text){const input=document.getElementById("descInput");const current=input.value.trim();input.value=current?current+", "+text:text;input.focus();}
+function suggestFeeling(){const input=document.getElementById("descInput");const newSuggestion=generateSuggestionContent();input.value=newSuggestion;input.focus();}
+function generateSuggestionContent(){const mode=currentMode();let emotions=[];switch(mode){case"reflection":emotions=["I stayed quiet even though I wanted to speak up","I realized I was avoiding something important","I handled it better than I expected","I reacted emotionally and later understood why"];break;case"journal":emotions=["Today something small affected me more than I expected","I had a conversation that stayed in my mind","I felt distracted and couldn’t explain why","I noticed a pattern in my behavior today"];break;case"letters":emotions=["I never told you how that day affected me","There were things I wanted to say but didn’t","I misunderstood you at that moment","I still think about what happened between us"];break;case"poems":emotions=["The room felt quieter than usual","I kept replaying the same memory","There was something unfinished in the air","Time moved slowly that evening"];break;case"story":emotions=["That was the moment everything shifted","I didn’t know it would change me","It started like any normal day","I almost walked away but stayed"];break;default:emotions=["today feels quieter, slower, and more manageable","finding comfort in small moments and simple breaths","progress does not need to be rushed to matter","making space for calm and gentle thoughts"];}
+const randomIndex=Math.floor(Math.random()*emotions.length);return emotions[randomIndex];}
+function currentMode(){const tool=document.getElementById("toolTitle").innerText.toLowerCase();switch(tool){case"reflection":return"reflection";case"journal":return"journal";case"letters":return"letters";case"poems":return"poems";case"story":return"story";default:return"default";}}
+document.querySelectorAll('.dropdown-btn').forEach(button=>{button.addEventListener('click',()=>{const dropdown=button.nextElementSibling;dropdown.style.display=dropdown.style.display==='flex'?'none':'flex';});});window.addEventListener("DOMContentLoaded",function(){const mode=localStorage.getItem("mode");const heartMenu=document.querySelectorAll(".menu-group")[1];if(mode==="under18"){heartMenu.style.display="none";}else{heartMenu.style.display="block";}
+openTool('Dashboard');const dashboardLink=document.getElementById('menu-dashboard');if(dashboardLink){setActiveMenu(dashboardLink);}});function setActiveMenu(el){document.querySelectorAll('.menu a').forEach(a=>{a.classList.remove('active');});el.classList.add('active');}
+window.addEventListener("DOMContentLoaded",function(){const mode=localStorage.getItem("mode");const cardsContainer=document.querySelector(".cards");const isMobile=window.innerWidth<=1024;cardsContainer.innerHTML="";const recommend=(toolName,description)=>{console.log(`Recommended tool: ${toolName} → ${description}`);};if(mode==="under18"){const under18Cards=[{icon:"📔",title:"Journal",desc:"Write about what happened today and how it affected you.",tool:"Journal"},{icon:"🌿",title:"Reflection",desc:"Think about a real moment and what you learned from it.",tool:"Reflection"}];under18Cards.forEach(card=>{recommend(card.title,card.desc);cardsContainer.innerHTML+=`
+        <div class="card" onclick="openTool('${card.tool}')">
+          <div class="card-icon">${card.icon}</div>
+          <h3>${card.title}</h3>
+          <p>${card.desc}</p>
+        </div>
+      `;});}else{const fullCards=[{icon:"💌",title:"Letters",desc:"Write something you never said to someone important.",tool:"Letters"},{icon:"🪶",title:"Poems",desc:"Turn a specific memory or moment into poetic lines.",tool:"Poems"},{icon:"✨",title:"Stories",desc:"Shape a real or imagined turning point into a short story.",tool:"Story"},{icon:"📔",title:"Journal",desc:"Record what happened today and your honest reaction.",tool:"Journal"},{icon:"🌿",title:"Reflection",desc:"Break down a moment and understand it better.",tool:"Reflection"}];const visibleCards=isMobile?fullCards:fullCards.slice(0,5);visibleCards.forEach(card=>{recommend(card.title,card.desc);cardsContainer.innerHTML+=`
+        <div class="card" onclick="openTool('${card.tool}')">
+          <div class="card-icon">${card.icon}</div>
+          <h3>${card.title}</h3>
+          <p>${card.desc}</p>
+        </div>
+      `;});}});document.addEventListener("DOMContentLoaded",()=>{const output=document.getElementById("output");if(output){output.addEventListener("input",()=>{const toolName=document.getElementById("toolTitle").innerText;const currentText=output.innerText;updateRecentContent(toolName,currentText);});}
+showRecents();});function updateRecentContent(toolName,newContent){HistoryStore.page("recents",{mode:toolName,limit:1}).then(({items})=>{if(items[0])HistoryStore.update(items[0].id,{content:newContent});});}
+function hideAllPages(){document.querySelectorAll(".pageView").forEach(p=>p.classList.add("hidden"));document.getElementById("libraryView").style.display="none";}
+function goDashboard(){hideAllPages();document.getElementById("libraryView").style.display="block";}
+window.onload=()=>{loadProfile();};function calculateAge(dob){const birthDate=new Date(dob);const today=new Date();let age=today.getFullYear()-birthDate.getFullYear();const m=today.getMonth()-birthDate.getMonth();if(m<0||(m===0&&today.getDate()<birthDate.getDate())){age--;}
+return age;}
+function loadProfile(){const username=localStorage.getItem("heartnote_username")||"Guest";const email=localStorage.getItem("email")||"Not provided";const dob=localStorage.getItem("dob")||"Not set";const mode=localStorage.getItem("mode")||"unknown";document.getElementById("displayUsername").textContent=username;document.getElementById("displayEmail").textContent=email;document.getElementById("displayDOB").textContent=dob;if(dob!=="Not set"){const age=calculateAge(dob);document.getElementById("displayAge").textContent=age+" years";}else{document.getElementById("displayAge").textContent="-";}
+document.getElementById("displayMode").textContent=mode==="under18"?"Safe Mode (Under 18)":"Full Access";}
+document.addEventListener("DOMContentLoaded",loadProfile);function toggleFocusMode(isEnabled){const sidebar=document.getElementById("emotionSuggestBar");const settings=document.getElementById("settingsPanel");if(sidebar)sidebar.style.display=isEnabled?"none":"";if(settings)settings.style.opacity=isEnabled?"0.3":"1";}
+document.getElementById("focusModeToggle").addEventListener("change",(e)=>{const enabled=e.target.checked;localStorage.setItem("focusMode",enabled);toggleFocusMode(enabled);});document.addEventListener("DOMContentLoaded",()=>{const focusEnabled=JSON.parse(localStorage.getItem("focusMode"))??false;document.getElementById("focusModeToggle").checked=focusEnabled;toggleFocusMode(focusEnabled);});function updateEmotionHintsUI(enabled){const bar=document.getElementById("emotionSuggestBar");if(!bar)return;bar.classList.toggle("hidden",!enabled);}
+document.getElementById("emotionHintsToggle").addEventListener("change",(e)=>{const enabled=e.target.checked;localStorage.setItem("emotionHints",JSON.stringify(enabled));updateEmotionHintsUI(enabled);});document.addEventListener("DOMContentLoaded",()=>{const saved=JSON.parse(localStorage.getItem("emotionHints"))??true;document.getElementById("emotionHintsToggle").checked=saved;updateEmotionHintsUI(saved);});const THEME_COLORS={light:"#ffffff",dark:"#141414",blossom:"#ffddea"};function loadTheme(){const settings=JSON.parse(localStorage.getItem("heartnote_settings"))||{};const theme=settings.theme||"light";document.body.setAttribute("data-theme",theme);const select=document.getElementById("themeMode");if(select)select.value=theme;const meta=document.getElementById("themeColorMeta");if(meta&&THEME_COLORS[theme]){meta.setAttribute("content",THEME_COLORS[theme]);}}
+function saveTheme(value){const settings=JSON.parse(localStorage.getItem("heartnote_settings"))||{};settings.theme=value;localStorage.setItem("heartnote_settings",JSON.stringify(settings));document.body.setAttribute("data-theme",value);const meta=document.getElementById("themeColorMeta");if(meta&&THEME_COLORS[value]){meta.setAttribute("content",THEME_COLORS[value]);}}
+document.addEventListener("change",(e)=>{if(e.target.id==="themeMode"){saveTheme(e.target.value);}});loadTheme();async function deleteAccount(){await fetch("/api/delete-account/",{method:"POST",headers:{"X-Requested-With":"XMLHttpRequest"}});localStorage.clear();await HistoryStore.clear();window.location.href="/";}
+async function resetApp(){await HistoryStore.clear("recents");localStorage.removeItem("heartnote_settings");alert("App has been reset.");window.location.reload();}
+const styleSelect=document.getElementById("handwritingStyle");const outputArea=document.getElementById("output");const savedStyle=localStorage.getItem("handwritingStyle");if(savedStyle){styleSelect.value=savedStyle;applyHandwritingStyle(savedStyle);}
+styleSelect.addEventListener("change",(e)=>{const selected=e.target.value;localStorage.setItem("handwritingStyle",selected);applyHandwritingStyle(selected);});function applyHandwritingStyle(style){outputArea.classList.remove("font-cute","font-romantic","font-deep","font-journal");if(style==="cute"){outputArea.classList.add("font-cute");}else if(style==="romantic"){outputArea.classList.add("font-romantic");}else if(style==="deep"){outputArea.classList.add("font-deep");}else if(style==="journal"){outputArea.classList.add("font-journal");}}
+function applyHandwriting(fontName){const h1=document.querySelector(".output");h1.style.fontFamily=fontName;h1.classList.remove("handwriting-animate");void h1.offsetWidth;h1.classList.add("handwriting-animate");h1.classList.remove("draw-effect");void h1.offsetWidth;h1.classList.add("draw-effect");}
+function loadFontSize(){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};const v=s.fontSize||"medium";document.documentElement.setAttribute("data-font",v);const el=document.getElementById("fontSize");if(el)el.value=v;}
+function saveFontSize(value){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};s.fontSize=value;localStorage.setItem("heartnote_settings",JSON.stringify(s));document.documentElement.setAttribute("data-font",value);}
+document.addEventListener("DOMContentLoaded",()=>{loadLanguage();});function loadLanguage(){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};const v=["en","hi"].includes(s.language)?s.language:"en";const el=document.getElementById("uiLanguage");if(el)el.value=v;}
+function getCurrentLanguage(){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};return s.language||"en";}
+function saveLanguage(value){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};s.language=value;localStorage.setItem("heartnote_settings",JSON.stringify(s));}
+document.addEventListener("change",(e)=>{if(e.target.id==="fontSize"){saveFontSize(e.target.value);applyFontSize();}
+if(e.target.id==="uiLanguage"){saveLanguage(e.target.value);}});function applyFontSize(){const s=JSON.parse(localStorage.getItem("heartnote_settings"))||{};const size=s.fontSize||"medium";document.documentElement.setAttribute("data-font",size);}
+function openFeedbackForm(){window.open("https://docs.google.com/forms/d/e/1FAIpQLSf4rrCaMcpGZMRzVB52OCqQGiMES2UrMnpc8Szd6D8oEEGjYw/viewform?usp=dialog","_blank");}
+function proAlert(){alert("HeartNote Pro is coming soon ✨");}
+if('serviceWorker'in navigator){navigator.serviceWorker.register(SERVICE_WORKER_URL);navigator.serviceWorker.addEventListener("message",event=>{const msg=event.data||{};if(msg.type!=="heartnote:replayed"||!msg.url.startsWith("/api/dashboard/"))return;if(isWriting)return;document.getElementById("output").innerText=msg.text;lastGeneratedText=msg.text.trim();hasGeneratedContent=true;});navigator.serviceWorker.startMessages();const replayOutbox=()=>navigator.serviceWorker.ready.then(reg=>{if(reg.active)reg.active.postMessage({type:"heartnote:replay"});});window.addEventListener("online",replayOutbox);replayOutbox();}
+document.addEventListener("DOMContentLoaded",()=>{const notificationToggle=document.getElementById("notificationToggle");if(notificationToggle){const notifState=localStorage.getItem("notifications-enabled");if(notifState==="true"){notificationToggle.checked=true;}else{notificationToggle.checked=false;}
+notificationToggle.addEventListener("change",()=>{localStorage.setItem("notifications-enabled",notificationToggle.checked?"true":"false");});}
+const festivals={"01-01":"🎉 New Beginnings — Happy New Year","02-14":"💛 Day of Care & Connection","03-25":"🌸 Holi — A Day of Renewal","04-14":"🌾 Harvest & Gratitude (Tamil New Year)","05-01":"🛠️ Honouring Effort & Growth (Labour Day)","06-21":"🧘 Calm the Mind — International Yoga Day","07-21":"🌧️ Monsoon Reflections & Reset","08-15":"🇮🇳 Freedom, Identity & Purpose","09-05":"📚 Gratitude for Guidance (Teachers’ Day)","10-02":"🕊️ Silence, Truth & Self-Discipline","11-12":"🪔 Light Over Noise — Diwali","12-25":"🎄 Warmth, Kindness & Closure"};const defaultMessage="🌱 A quiet moment to pause and write something real";const popup=document.getElementById("festivalPopup");if(!popup)return;const notificationsEnabled=localStorage.getItem("notifications-enabled")==="true";if(!notificationsEnabled)return;const today=new Date();const key=String(today.getMonth()+1).padStart(2,"0")+"-"+
+String(today.getDate()).padStart(2,"0");popup.innerText=festivals[key]||defaultMessage;popup.classList.remove("hidden");setTimeout(()=>{popup.classList.add("hidden");},5000);});document.addEventListener("DOMContentLoaded",()=>{const profileAvatar=document.getElementById("profileAvatar");const dashboardAvatar=document.getElementById("dashboardAvatar");const input=document.getElementById("avatarInput");const saved=localStorage.getItem("profile-avatar");if(saved){if(profileAvatar)profileAvatar.src=saved;if(dashboardAvatar)dashboardAvatar.src=saved;}
+if(!profileAvatar||!input)return;profileAvatar.addEventListener("click",()=>input.click());input.addEventListener("change",()=>{const file=input.files[0];if(!file||!file.type.startsWith("image/"))return;const reader=new FileReader();reader.onload=()=>{const data=reader.result;localStorage.setItem("profile-avatar",data);profileAvatar.src=data;if(dashboardAvatar)dashboardAvatar.src=data;};reader.readAsDataURL(file);});});document.querySelector(".avatar-edit").onclick=()=>{document.getElementById("avatarInput").click();};
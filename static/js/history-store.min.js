@@ -0,0 +1,14 @@
+/* Built from assets/js/history-store.js by manage.py build_assets. */
+const HistoryStore=(function(){const DB_NAME="heartnote-history";const STORE="entries";const LEGACY_KEYS={recents:"recents",aiwrite:"heartnote_h1_history",};let opening=null;function open(){if(!opening){opening=new Promise((resolve,reject)=>{const request=indexedDB.open(DB_NAME,1);request.onupgradeneeded=()=>{const store=request.result.createObjectStore(STORE,{keyPath:"id",autoIncrement:true});store.createIndex("list",["list","created","id"]);store.createIndex("list_mode",["list","mode","created","id"]);};request.onerror=()=>reject(request.error);request.onsuccess=()=>migrate(request.result).then(resolve,reject);});}
+return opening;}
+function legacyEntries(list){try{return JSON.parse(localStorage.getItem(LEGACY_KEYS[list]))||[];}catch(e){return[];}}
+function migrate(db){const recents=legacyEntries("recents");const history=legacyEntries("aiwrite");if(!recents.length&&!history.length)return Promise.resolve(db);return new Promise((resolve,reject)=>{const tx=db.transaction(STORE,"readwrite");const store=tx.objectStore(STORE);recents.forEach(r=>store.put(Object.assign({},r,{list:"recents",mode:r.name,created:r.id,})));history.forEach(h=>store.add(Object.assign({},h,{list:"aiwrite",created:Date.parse(h.ts)||Date.now(),})));tx.oncomplete=()=>{Object.values(LEGACY_KEYS).forEach(key=>localStorage.removeItem(key));resolve(db);};tx.onerror=tx.onabort=()=>reject(tx.error);});}
+function transaction(mode,fn){return open().then(db=>new Promise((resolve,reject)=>{const tx=db.transaction(STORE,mode);const result=fn(tx.objectStore(STORE));tx.oncomplete=()=>{if(result instanceof IDBRequest)resolve(result.result);else if(typeof result==="function")resolve(result());else resolve(result);};tx.onerror=tx.onabort=()=>reject(tx.error);}));}
+function listRange(list,mode){const prefix=mode===undefined?[list]:[list,mode];return{prefix,upper:prefix.concat([[]])};}
+function add(list,entry){return transaction("readwrite",store=>store.add(Object.assign({},entry,{list,created:entry.created||Date.now(),})));}
+function get(id){return transaction("readonly",store=>store.get(id));}
+function update(id,changes){return transaction("readwrite",store=>{const request=store.get(id);request.onsuccess=()=>{if(request.result)store.put(Object.assign(request.result,changes));};});}
+function remove(id){return transaction("readwrite",store=>store.delete(id));}
+function page(list,options){const{mode,before,limit=20}=options||{};const{prefix,upper}=listRange(list,mode);const range=IDBKeyRange.bound(prefix,before?prefix.concat(before):upper,false,true);const index=mode===undefined?"list":"list_mode";return transaction("readonly",store=>{const items=[];const cursor=store.index(index).openCursor(range,"prev");cursor.onsuccess=()=>{const c=cursor.result;if(!c)return;items.push(c.value);if(items.length<=limit)c.continue();};return()=>{const more=items.length>limit;const shown=items.slice(0,limit);const last=shown[shown.length-1];return{items:shown,next:more?[last.created,last.id]:null};};});}
+function clear(list){return transaction("readwrite",store=>{if(list===undefined)return store.clear();const{prefix,upper}=listRange(list);const cursor=store.index("list").openCursor(IDBKeyRange.bound(prefix,upper));cursor.onsuccess=()=>{const c=cursor.result;if(!c)return;c.delete();c.continue();};});}
+return{add,get,update,remove,page,clear};})();
@@ -0,0 +1,5 @@
+/* Built from assets/js/home.js by manage.py build_assets. */
+const SERVICE_WORKER_URL=document.currentScript.dataset.serviceWorker;const modal=document.getElementById('signupModal');const openBtn=document.getElementById('openSignup');const closeBtn=document.getElementById('closeModal');const submitBtn=document.getElementById('submitSignup');openBtn.onclick=()=>modal.style.display='flex';closeBtn.onclick=()=>modal.style.display='none';window.onclick=(e)=>{if(e.target===modal)modal.style.display='none';};submitBtn.onclick=async()=>{const username=document.getElementById("username").value.trim();const email=document.getElementById("email").value.trim();const password=document.getElementById("password").value.trim();const dob=document.getElementById("dob").value;if(!username||!email||!password||!dob){alert("Please fill all fields before continuing.");return;}
+localStorage.setItem("heartnote_username",username);localStorage.setItem("email",email);localStorage.setItem("dob",dob);const birth=new Date(dob);const today=new Date();let age=today.getFullYear()-birth.getFullYear();const m=today.getMonth()-birth.getMonth();if(m<0||(m===0&&today.getDate()<birth.getDate())){age--;}
+localStorage.setItem("age",age);localStorage.setItem("mode",age<18?"under18":"adult");const form=new FormData();form.append("username",username);form.append("email",email);form.append("password",password);const res=await fetch("/api/signup/",{method:"POST",body:form});const data=await res.json();if(data.error){alert(data.error);return;}
+window.location.href="/dashboard/";if('serviceWorker'in navigator){navigator.serviceWorker.register(SERVICE_WORKER_URL);}};
@@ -0,0 +1,28 @@
+/* Built from assets/js/service-worker.js by manage.py build_assets. */
+const STATIC_CACHE=`heartnote-static-${CONFIG.version}`;const PAGE_CACHE=`heartnote-pages-${CONFIG.version}`;const PRECACHED=new Set(CONFIG.static);const OUTBOX_DB="heartnote-outbox";const OUTBOX_LIMIT=20;const SYNC_TAG="heartnote-outbox";const QUEUEABLE=["/api/generate/","/api/dashboard/"];const STREAM_SUFFIX="stream/";const QUEUED_MESSAGE="📮 You're offline. This will be written as soon as you're back online.";self.addEventListener("install",event=>{event.waitUntil((async()=>{const staticCache=await caches.open(STATIC_CACHE);await staticCache.addAll(CONFIG.static);const pageCache=await caches.open(PAGE_CACHE);await Promise.all(CONFIG.pages.map(url=>refreshPage(pageCache,url).catch(()=>null)));await self.skipWaiting();})());});self.addEventListener("activate",event=>{event.waitUntil((async()=>{const keep=[STATIC_CACHE,PAGE_CACHE];for(const key of await caches.keys()){if(key.startsWith("heartnote-")&&!keep.includes(key)){await caches.delete(key);}}
+await self.clients.claim();})());});self.addEventListener("fetch",event=>{const request=event.request;const url=new URL(request.url);if(url.origin!==self.location.origin||request.method!=="GET")return;if(url.pathname.startsWith("/api/")){if(isQueueable(url))event.respondWith(networkOrQueue(request,url));return;}
+if(PRECACHED.has(url.pathname)){event.respondWith(cacheFirst(request));return;}
+if(url.pathname.startsWith(CONFIG.staticPrefix)){event.respondWith(revalidateStatic(event));return;}
+if(CONFIG.pages.includes(url.pathname)){event.respondWith(staleWhileRevalidate(event,url.pathname));}});async function cacheFirst(request){const cached=await caches.match(request);if(cached)return cached;const response=await fetch(request);if(response.ok){const cache=await caches.open(STATIC_CACHE);await cache.put(request,response.clone());}
+return response;}
+async function revalidateStatic(event){const cache=await caches.open(STATIC_CACHE);const cached=await cache.match(event.request);const network=fetch(event.request).then(async response=>{if(response.ok)await cache.put(event.request,response.clone());return response;});if(cached){event.waitUntil(network.catch(()=>null));return cached;}
+return network;}
+async function staleWhileRevalidate(event,path){const cache=await caches.open(PAGE_CACHE);const cached=await cache.match(path);const network=refreshPage(cache,path,event.request);if(cached){event.waitUntil(network.catch(()=>null));return cached;}
+return network;}
+async function refreshPage(cache,path,request){const response=await fetch(request||path);if(response.ok&&!response.redirected){await cache.put(path,response.clone());}else{await cache.delete(path);}
+return response;}
+function isQueueable(url){return QUEUEABLE.some(path=>url.pathname===path||url.pathname===path+STREAM_SUFFIX);}
+async function networkOrQueue(request,url){try{return await fetch(request);}catch(err){const stream=url.pathname.endsWith(STREAM_SUFFIX);const path=stream?url.pathname.slice(0,-STREAM_SUFFIX.length):url.pathname;await enqueue(path+url.search);return queuedResponse(path,stream);}}
+function queuedResponse(path,stream){const flags={blocked:false,is_fallback:true,queued:true};if(stream){const body=`event: chunk\ndata: ${JSON.stringify(QUEUED_MESSAGE)}\n\n`+`event: done\ndata: ${JSON.stringify({ complete: true, ...flags })}\n\n`;return new Response(body,{headers:{"Content-Type":"text/event-stream"}});}
+const data=path==="/api/dashboard/"?{response:{response:QUEUED_MESSAGE,...flags}}:{response:QUEUED_MESSAGE,queued:true};return new Response(JSON.stringify(data),{headers:{"Content-Type":"application/json"}});}
+async function enqueue(url){await withOutbox("readwrite",store=>{store.put({url,queuedAt:Date.now(),result:null});const all=store.getAll();all.onsuccess=()=>{const items=all.result.sort((a,b)=>a.queuedAt-b.queuedAt);items.slice(0,Math.max(0,items.length-OUTBOX_LIMIT)).forEach(item=>store.delete(item.url));};});if(self.registration.sync){try{await self.registration.sync.register(SYNC_TAG);}catch(err){}}}
+self.addEventListener("sync",event=>{if(event.tag===SYNC_TAG)event.waitUntil(replay());});self.addEventListener("message",event=>{if(event.data&&event.data.type==="heartnote:replay")event.waitUntil(replay());});let replaying=null;function replay(){if(!replaying)replaying=drain().finally(()=>{replaying=null;});return replaying;}
+async function drain(){const items=await withOutbox("readonly",store=>store.getAll());for(const item of items){if(!item.result){const response=await fetch(item.url);item.result=await jobResult(await response.json().catch(()=>null));if(!item.result){await withOutbox("readwrite",store=>store.delete(item.url));continue;}
+await withOutbox("readwrite",store=>store.put(item));}
+if(await deliver(item)){await withOutbox("readwrite",store=>store.delete(item.url));}}}
+async function jobResult(data){while(data&&data.job&&(data.status==="queued"||data.status==="running")){const response=await fetch(`/api/jobs/${data.job}/?wait=20`);data=await response.json().catch(()=>null);const seconds=Number(response.headers.get("Retry-After"));if(seconds&&data&&(data.status==="queued"||data.status==="running")){await new Promise(resolve=>setTimeout(resolve,seconds*1000));}}
+return data&&data.response!==undefined?data:null;}
+async function deliver(item){const data=item.result;const text=typeof data.response==="string"?data.response:data.response.response;const windows=await self.clients.matchAll({type:"window"});if(!windows.length){if(self.Notification&&Notification.permission==="granted"){await self.registration.showNotification("HeartNote 💗",{body:"What you wrote offline is ready.",tag:SYNC_TAG,});}
+return false;}
+windows.forEach(client=>client.postMessage({type:"heartnote:replayed",url:item.url,text,data}));return true;}
+self.addEventListener("notificationclick",event=>{event.notification.close();event.waitUntil(self.clients.openWindow("/"));});function withOutbox(mode,fn){return new Promise((resolve,reject)=>{const open=indexedDB.open(OUTBOX_DB,1);open.onupgradeneeded=()=>open.result.createObjectStore("requests",{keyPath:"url"});open.onerror=()=>reject(open.error);open.onsuccess=()=>{const db=open.result;const tx=db.transaction("requests",mode);const request=fn(tx.objectStore("requests"));tx.oncomplete=()=>{db.close();resolve(request?request.result:undefined);};tx.onerror=tx.onabort=()=>{db.close();reject(tx.error);};};});}
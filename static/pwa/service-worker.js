@@ -1,6 +1,7 @@
-const CACHE_NAME = "heartnote-v1"; 
-const STATIC_ASSETS = ["/", "/dashboard/", "/aiwrite/", "/static/pwa/manifest.json"]; 
-self.addEventListener("install", event => { 
-    event.waitUntil(caches.open(CACHE_NAME).then(cache => cache.addAll(STATIC_ASSETS))); 
-});
- self.addEventListener("fetch", event => { if (!event.request.url.includes("/api/")) { event.respondWith(caches.match(event.request).then(res => res || fetch(event.request))); } });
\ No newline at end of file
+// Superseded by /service-worker.js. Browsers that registered this file
+// (whose scope never reached the pages) fetch it on their next update
+// check and remove it along with its cache.
+self.addEventListener("install", () => self.skipWaiting());
+self.addEventListener("activate", event => {
+  event.waitUntil(caches.delete("heartnote-v1").then(() => self.registration.unregister()));
+});
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class WriteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'write'
+
+    def ready(self):
+        # Before anything imports write/metrics.py (and prometheus_client).
+        if settings.METRICS_DIR:
+            from . import metrics_dir
+            metrics_dir.prepare(settings.METRICS_DIR)
@@ -0,0 +1,16 @@
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+
+
+# -----------------------------------------------------
+# FILE CACHE WITHOUT CULLING
+# FileBasedCache._cull() lists the whole directory on every set() to
+# count its entries, so each write costs O(entries). Sessions expire on
+# their own schedule and manage.py cleanup_sessions (cron) deletes the
+# expired files, so this cache never culls on the request path.
+# -----------------------------------------------------
+class UnculledFileBasedCache(FileBasedCache):
+
+    def _cull(self):
+        pass
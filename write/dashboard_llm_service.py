@@ -1,8 +1,27 @@
+import asyncio
+import contextvars
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import os
 
-GEMINI_MODEL = "gemini-2.5-flash"
+from .gemini_client import GEMINI_MODEL, extract_text, get_client
+from .instructions import SystemInstructions
+from .metrics import fallback, input_fitted, record_usage, safety_block
+from .response_cache import make_key, response_cache
+from .safety import BLOCKLIST, SELFHARM, safety
+from .scheduler import STILL_FORMING, Overloaded, scheduler as default_scheduler
+from .singleflight import flight_key, flights as default_flights
+from .timing import span
+from .token_budget import (
+    INPUT_TOKENS, NAME_TOKENS, REJECTED, THINKING_BUDGET, fit_text,
+    output_budget, words_for,
+)
+
+# Batch fan-out bounds: threads in the process-wide pool used by sync
+# views, and in-flight calls per batch on the async path.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "5"))
 
 
 
@@ -25,15 +44,15 @@ SUPPORTED_LANGUAGES = {
 
 
 # -----------------------------------------------------
-# SIMPLE EMOTIONAL TEMPLATES FOR 8 MODES
+# SYSTEM INSTRUCTIONS FOR EACH MODE
+# The fixed rules, sent as the request's systemInstruction (or a
+# cachedContents handle, see write/instructions.py). Only the short
+# templates below change from one request to the next.
 # -----------------------------------------------------
 
-DASHBOARD_REFLECTION = """
-Write a simple emotional reflection in {language}.
-
-Topic: {name}
-Feeling: {desc}
-Style: {tone}
+DASHBOARD_REFLECTION_INSTRUCTION = """
+Write a simple emotional reflection about the topic and feeling the user gives,
+in the language they ask for, in the style they ask for.
 
 Rules:
 - Two paragraphs
@@ -46,12 +65,9 @@ Return only the reflection.
 """
 
 
-DASHBOARD_LETTER = """
-Write a short emotional letter in {language}.
-
-Recipient: {name}
-Feeling: {desc}
-Style: {tone}
+DASHBOARD_LETTER_INSTRUCTION = """
+Write a short emotional letter to the recipient the user gives, about the
+feeling they describe, in the language and style they ask for.
 
 Rules:
 - Two short paragraphs
@@ -66,12 +82,9 @@ Dear You,
 
 
 
-DASHBOARD_POEM = """
-Write a short free-verse poem in {language}.
-
-Inspired by:
-{name} — {desc}
-Style: {tone}
+DASHBOARD_POEM_INSTRUCTION = """
+Write a short free-verse poem inspired by what the user gives, in the
+language and style they ask for.
 
 Rules:
 - 5–7 short lines
@@ -84,12 +97,9 @@ Return only the poem.
 
 
 
-DASHBOARD_STORY = """
-Write a short emotional micro-story in {language}.
-
-Inspired by:
-{name} — {desc}
-Style: {tone}
+DASHBOARD_STORY_INSTRUCTION = """
+Write a short emotional micro-story inspired by what the user gives, in the
+language and style they ask for.
 
 Rules:
 - 45–65 words
@@ -103,12 +113,9 @@ Return only the story.
 
 
 
-DASHBOARD_JOURNAL = """
-Write a calm journal entry in {language}.
-
-Topic: {name}
-Feeling: {desc}
-Style: {tone}
+DASHBOARD_JOURNAL_INSTRUCTION = """
+Write a calm journal entry about the topic and feeling the user gives, in the
+language and style they ask for.
 
 Rules:
 - Two paragraphs
@@ -117,6 +124,57 @@ Rules:
 - No advice or lessons
 
 Start with:
+Date: <the date the user gives>
+"""
+
+
+DASHBOARD_INSTRUCTIONS = {
+    "reflection": DASHBOARD_REFLECTION_INSTRUCTION,
+    "letters": DASHBOARD_LETTER_INSTRUCTION,
+    "poems": DASHBOARD_POEM_INSTRUCTION,
+    "story": DASHBOARD_STORY_INSTRUCTION,
+    "journal": DASHBOARD_JOURNAL_INSTRUCTION
+}
+
+
+
+
+# -----------------------------------------------------
+# SIMPLE EMOTIONAL TEMPLATES FOR 8 MODES
+# -----------------------------------------------------
+
+DASHBOARD_REFLECTION = """
+Topic: {name}
+Feeling: {desc}
+Style: {tone}
+Language: {language}
+"""
+
+
+DASHBOARD_LETTER = """
+Recipient: {name}
+Feeling: {desc}
+Style: {tone}
+Language: {language}
+"""
+
+
+DASHBOARD_POEM = """
+Inspired by:
+{name} — {desc}
+Style: {tone}
+Language: {language}
+"""
+
+
+DASHBOARD_STORY = DASHBOARD_POEM
+
+
+DASHBOARD_JOURNAL = """
+Topic: {name}
+Feeling: {desc}
+Style: {tone}
+Language: {language}
 Date: {date}
 """
 
@@ -125,108 +183,366 @@ Date: {date}
 
 
 
+DASHBOARD_TEMPLATES = {
+    "reflection": DASHBOARD_REFLECTION,
+    "letters": DASHBOARD_LETTER,
+    "poems": DASHBOARD_POEM,
+    "story": DASHBOARD_STORY,
+    "journal": DASHBOARD_JOURNAL
+}
+
+# Longest answer each template asks for, in words; turned into
+# maxOutputTokens per language by write/token_budget.py.
+DASHBOARD_OUTPUT_WORDS = {
+    "reflection": 55,
+    "letters": 55,
+    "poems": 50,
+    "story": 65,
+    "journal": 55
+}
+
+
+_batch_pool = None
+
+
+def batch_pool():
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = ThreadPoolExecutor(
+            max_workers=BATCH_WORKERS, thread_name_prefix="dashboard-batch")
+    return _batch_pool
+
+
+
+
 # -----------------------------------------------------
 # LLM SERVICE
 # -----------------------------------------------------
 class Dashboard_LLM_Service:
 
-    def __init__(self, model=GEMINI_MODEL):
+    def __init__(self, model=GEMINI_MODEL, client=None, cache=response_cache,
+                 flights=default_flights, scheduler=default_scheduler):
         self.model = model
+        self.client = client or get_client()
+        self.cache = cache
+        self.flights = flights
+        self.scheduler = scheduler
+        self.instructions = SystemInstructions(DASHBOARD_INSTRUCTIONS, self.client)
 
     # -------------------------------------------------
     # MAIN GENERATE
     # -------------------------------------------------
-    def generate(self, mode, name, desc, depth, language):
+    def generate(self, mode, name, desc, depth, language, use_cache=True):
+        mode = (mode or "").lower().strip()
+        result, payload, key = self.prepare(mode, name, desc, depth, language, use_cache)
+        if result is not None:
+            return result
+
+        # Identical requests already in flight share one upstream call.
+        recheck = None
+        if use_cache and self.cache is not None:
+            recheck = lambda: self.cached_result(key)
+        with span("upstream"):
+            return self.flights.do(flight_key(key, use_cache),
+                                   lambda: self.fetch(payload, key, mode), recheck)
+
+    async def agenerate(self, mode, name, desc, depth, language, use_cache=True):
+        mode = (mode or "").lower().strip()
+        result, payload, key = self.prepare(mode, name, desc, depth, language, use_cache=False)
+        if result is not None:
+            return result
+        if use_cache and self.cache is not None:
+            with span("cache"):
+                cached = await self.cache.aget(key)
+            if cached is not None:
+                return {
+                "response": cached,
+                "blocked": False,
+                "is_fallback": False}
+
+        with span("upstream"):
+            return await self.flights.ado(flight_key(key, use_cache),
+                                          lambda: self.afetch(payload, key, mode))
+
+    # -------------------------------------------------
+    # UPSTREAM CALL (run once per key by the single-flight layer)
+    # -------------------------------------------------
+    def fetch(self, payload, key, mode):
+        try:
+            with self.scheduler.slot("dashboard"):
+                data = self.client.generate_content(payload, model=self.model)
+            record_usage("dashboard", mode, data)
+            result = self.finish(data)
+        except Exception as e:
+            self.instructions.forget(payload, e)
+            return self.failure(e)
+        if self.cache is not None and not result["is_fallback"]:
+            self.cache.set(key, result["response"])
+        return result
+
+    async def afetch(self, payload, key, mode):
+        try:
+            async with self.scheduler.aslot("dashboard"):
+                data = await self.client.agenerate_content(payload, model=self.model)
+            record_usage("dashboard", mode, data)
+            result = self.finish(data)
+        except Exception as e:
+            self.instructions.forget(payload, e)
+            return self.failure(e)
+        if self.cache is not None and not result["is_fallback"]:
+            await self.cache.aset(key, result["response"])
+        return result
+
+    def cached_result(self, key):
+        cached = self.cache.get_shared(key)
+        return self.result(cached) if cached is not None else None
+
+    # -------------------------------------------------
+    # BATCH: one feeling, several modes, fanned out concurrently
+    # Returns {mode: result} in request order; a failing mode gets the
+    # usual fallback dict instead of failing the whole batch.
+    # -------------------------------------------------
+    def generate_many(self, modes, name, desc, depth, language, use_cache=True):
+        # Each task runs in a copy of the caller's context so its phase
+        # timings land on this request.
+        futures = [
+            batch_pool().submit(
+                contextvars.copy_context().run,
+                self.generate, mode, name, desc, depth, language, use_cache)
+            for mode in modes
+        ]
+        results = {}
+        for mode, future in zip(modes, futures):
+            try:
+                results[mode] = future.result()
+            except Exception as e:
+                results[mode] = self.failure(e)
+        return results
+
+    async def agenerate_many(self, modes, name, desc, depth, language, use_cache=True):
+        gate = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def one(mode):
+            async with gate:
+                return await self.agenerate(mode, name, desc, depth, language, use_cache)
+
+        outcomes = await asyncio.gather(*(one(m) for m in modes), return_exceptions=True)
+        return {
+            mode: self.failure(out) if isinstance(out, Exception) else out
+            for mode, out in zip(modes, outcomes)
+        }
+
+    # -------------------------------------------------
+    # STREAMING
+    # Yields ("chunk", text) events, then one ("done", flags) event
+    # carrying the same blocked / is_fallback flags as generate().
+    # -------------------------------------------------
+    def stream(self, mode, name, desc, depth, language, use_cache=True):
+        mode = (mode or "").lower().strip()
+        result, payload, key = self.prepare(mode, name, desc, depth, language, use_cache)
+        if result is not None:
+            yield "chunk", result["response"]
+            yield "done", self.flags(result)
+            return
+
+        parts = []
+        last = {}
+        try:
+            with span("upstream"), self.scheduler.slot("dashboard"):
+                for piece in self.client.stream_generate(payload, model=self.model,
+                                                         on_data=last.update):
+                    piece = piece if parts else piece.lstrip()
+                    if piece:
+                        parts.append(piece)
+                        yield "chunk", piece
+        except Exception as e:
+            self.instructions.forget(payload, e)
+            if parts:
+                yield "done", {"blocked": False, "is_fallback": False, "complete": False}
+            else:
+                result = self.failure(e)
+                yield "chunk", result["response"]
+                yield "done", self.flags(result)
+            return
+
+        record_usage("dashboard", mode, last)
+        result = self.result("".join(parts))
+        if not parts:
+            yield "chunk", result["response"]
+        elif self.cache is not None:
+            self.cache.set(key, result["response"])
+        yield "done", self.flags(result)
+
+    async def astream(self, mode, name, desc, depth, language, use_cache=True):
+        mode = (mode or "").lower().strip()
+        result, payload, key = self.prepare(mode, name, desc, depth, language, use_cache=False)
+        if result is None and use_cache and self.cache is not None:
+            with span("cache"):
+                cached = await self.cache.aget(key)
+            if cached is not None:
+                result = self.result(cached)
+        if result is not None:
+            yield "chunk", result["response"]
+            yield "done", self.flags(result)
+            return
+
+        parts = []
+        last = {}
+        try:
+            with span("upstream"):
+                async with self.scheduler.aslot("dashboard"):
+                    async for piece in self.client.astream_generate(
+                            payload, model=self.model, on_data=last.update):
+                        piece = piece if parts else piece.lstrip()
+                        if piece:
+                            parts.append(piece)
+                            yield "chunk", piece
+        except Exception as e:
+            self.instructions.forget(payload, e)
+            if parts:
+                yield "done", {"blocked": False, "is_fallback": False, "complete": False}
+            else:
+                result = self.failure(e)
+                yield "chunk", result["response"]
+                yield "done", self.flags(result)
+            return
+
+        record_usage("dashboard", mode, last)
+        result = self.result("".join(parts))
+        if not parts:
+            yield "chunk", result["response"]
+        elif self.cache is not None:
+            await self.cache.aset(key, result["response"])
+        yield "done", self.flags(result)
+
+    def flags(self, result):
+        return {
+            "blocked": result["blocked"],
+            "is_fallback": result["is_fallback"],
+            "complete": True}
+
+    # -------------------------------------------------
+    # REQUEST PREPARATION
+    # Returns (result, payload, cache_key); a non-None result is final.
+    # -------------------------------------------------
+    def prepare(self, mode, name, desc, depth, language, use_cache=True):
         mode = (mode or "").lower().strip()
         depth = (depth or "light").lower().strip()
         raw_lang = (language or "en").lower().strip()
         language = SUPPORTED_LANGUAGES.get(raw_lang, "English")
         tone = DEPTH_TONE.get(depth, DEPTH_TONE["light"])
-        safe, safe_message = self.safety_filter(desc)
+        with span("safety"):
+            safe, safe_message = self.safety_filter(desc)
         if not safe:
             return {
             "response": safe_message,
             "blocked": True,
-            "is_fallback": False}
+            "is_fallback": False}, None, None
+        name, desc, refusal = self.fit_inputs(name, desc)
+        if refusal is not None:
+            return {
+            "response": refusal,
+            "blocked": True,
+            "is_fallback": False}, None, None
         template = self.get_template(mode)
         if not template:
+            fallback("dashboard", "unknown_mode")
             return {
             "response": "This writing mode is not available right now.",
             "blocked": False,
-            "is_fallback": True}
-        date = datetime.now().strftime("%d/%m/%Y")
-        try:
-            prompt = template.format(
-            name=name,
-            desc=desc,
-            tone=tone,
-            depth=depth,
-            language=language,
-            date=date)
-        except Exception:
-            prompt = template.format(
-            name=name,
-            desc=desc,
-            tone=tone,
-            language=language)
-        
-        full_prompt = f"[LANG={language}]\n{prompt}"
-        try:
-            api_key = os.getenv("GEMINI_API_KEY")
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent?key={api_key}"
-            headers = {
-            "Content-Type": "application/json"}
-            payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": full_prompt}
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.6,
-                "topP": 0.9,
-                "maxOutputTokens": 1024
-            }}
-            res = requests.post(url, headers=headers, json=payload, timeout=30)
-            res.raise_for_status()
-            data = res.json()
-            raw = data["candidates"][0]["content"]["parts"][0]["text"]
-            if not isinstance(raw, str) or not raw.strip():
+            "is_fallback": True}, None, None
+        with span("prompt"):
+            date = datetime.now().strftime("%d/%m/%Y")
+            try:
+                prompt = template.format(
+                name=name,
+                desc=desc,
+                tone=tone,
+                depth=depth,
+                language=language,
+                date=date)
+            except Exception:
+                prompt = template.format(
+                name=name,
+                desc=desc,
+                tone=tone,
+                language=language)
+
+            full_prompt = f"[LANG={language}]\n{prompt}"
+
+            # The journal template carries the date, so it is part of the key.
+            key = make_key(
+                "dashboard", self.model, mode, name, desc, tone, language,
+                date if mode == "journal" else "")
+
+        if use_cache and self.cache is not None:
+            with span("cache"):
+                cached = self.cache.get(key)
+            if cached is not None:
                 return {
-                "response": (
-                    "The words feel quiet right now.\n\n"
-                    "Some feelings take a moment before they find language."
-                ),
+                "response": cached,
                 "blocked": False,
-                "is_fallback": True
-            }
+                "is_fallback": False}, None, key
+
+        with span("prompt"):
+            payload = self.client.build_payload(
+                full_prompt,
+                temperature=0.6,
+                top_p=0.9,
+                max_output_tokens=output_budget(DASHBOARD_OUTPUT_WORDS[mode], language),
+                thinking_budget=THINKING_BUDGET,
+                **self.instructions.fields(self.model, mode))
+        return None, payload, key
+
+    def fit_inputs(self, name, desc):
+        # Returns (name, desc, refusal message or None). Both fields are
+        # trimmed to their budgets; a far oversized feeling is refused.
+        name, name_action = fit_text(name or "", NAME_TOKENS, reject=False)
+        desc, action = fit_text(desc or "", INPUT_TOKENS)
+        for taken in (name_action, action):
+            if taken is not None:
+                input_fitted("dashboard", taken)
+        if action == REJECTED:
+            return name, desc, (
+                "⚠️ That's a lot to hold at once. "
+                f"Please shorten it to about {words_for(INPUT_TOKENS)} words.")
+        return name, desc, None
+
+    # -------------------------------------------------
+    # RESPONSE HANDLING
+    # -------------------------------------------------
+    def finish(self, data):
+        return self.result(extract_text(data))
+
+    def result(self, raw):
+        if not isinstance(raw, str) or not raw.strip():
+            fallback("dashboard", "empty_response")
             return {
-            "response": raw.strip(),
+            "response": (
+                "The words feel quiet right now.\n\n"
+                "Some feelings take a moment before they find language."
+            ),
             "blocked": False,
-            "is_fallback": False}
-        except requests.exceptions.HTTPError as e:
-            if e.response is not None and e.response.status_code == 429:
+            "is_fallback": True
+        }
+        return {
+        "response": raw.strip(),
+        "blocked": False,
+        "is_fallback": False}
+
+    def failure(self, error):
+        if isinstance(error, requests.exceptions.HTTPError):
+            if error.response is not None and error.response.status_code == 429:
                 return {
                 "response": "⚠️ Too many requests. Please wait a moment and try again.",
                 "blocked": True,
                 "is_fallback": False}
-            return {
-            "response": (
-                "The thoughts are still forming.\n\n"
-                "Please try again in a moment."
-            ),
-            "blocked": False,
-            "is_fallback": True}
-        except Exception:
-            return {
-            "response": (
-                "The thoughts are still forming.\n\n"
-                "Please try again in a moment."
-            ),
-            "blocked": False,
-            "is_fallback": True}
+        # Also the answer when the scheduler sheds the call (overload).
+        fallback("dashboard", "shed" if isinstance(error, Overloaded) else "upstream_error")
+        return {
+        "response": STILL_FORMING,
+        "blocked": False,
+        "is_fallback": True}
 
 
 
@@ -235,39 +551,28 @@ class Dashboard_LLM_Service:
     # TEMPLATE ROUTER
     # -------------------------------------------------
     def get_template(self, mode):
-        return {
-            "reflection": DASHBOARD_REFLECTION,
-            "letters": DASHBOARD_LETTER,
-            "poems": DASHBOARD_POEM,
-            "story": DASHBOARD_STORY,
-            "journal": DASHBOARD_JOURNAL
-        }.get(mode)
+        return DASHBOARD_TEMPLATES.get(mode)
+
+    def modes(self):
+        return list(DASHBOARD_TEMPLATES)
 
     # -------------------------------------------------
-    # SAFETY FILTER (MINIMAL)
+    # SAFETY FILTER (shared patterns, see write/safety.py)
     # -------------------------------------------------
     def safety_filter(self, text):
-        t = (text or "").lower()
-
-        bad_words = [
-            "fuck", "bitch", "shit", "asshole",
-            "bastard", "slut", "dick", "pussy"
-        ]
-        for w in bad_words:
-            if w in t:
-                return False, "⚠️ Please rewrite using respectful language."
-
-        selfharm = [
-            "kill myself", "i want to die", "end my life",
-            "self harm", "no reason to live"
-        ]
-        for s in selfharm:
-            if s in t:
-                return False, (
-                    "⚠️ HeartNote AI cannot generate this.\n\n"
-                    "• You matter.\n"
-                    "• You are not alone.\n"
-                    "• Support is available."
-                )
+        verdict = safety.scan(text)
+        if verdict is not None:
+            safety_block("dashboard", verdict)
+
+        if verdict == BLOCKLIST:
+            return False, "⚠️ Please rewrite using respectful language."
+
+        if verdict == SELFHARM:
+            return False, (
+                "⚠️ HeartNote AI cannot generate this.\n\n"
+                "• You matter.\n"
+                "• You are not alone.\n"
+                "• Support is available."
+            )
 
         return True, text
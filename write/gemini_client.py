@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import UPSTREAM_RESPONSES, observe_upstream
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+# Models in order of preference; with more than one (or more than one
+# key in GEMINI_API_KEYS) calls go through the router, and the later
+# models answer when the first is slow, rate limited or down.
+GEMINI_MODELS = [m.strip() for m in os.getenv("GEMINI_MODELS", "gemini-2.5-flash").split(",") if m.strip()]
+GEMINI_MODEL = GEMINI_MODELS[0]
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+# (connect, read) in seconds. The connect timeout stays short so a dead
+# upstream is noticed quickly; the read timeout covers a full generation.
+CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "30"))
+
+POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "16"))
+
+# "pro" models can't turn thinking off: they answer a thinkingBudget of
+# 0 with a 400. They get their smallest budget instead, added to
+# maxOutputTokens since thought tokens count against it.
+MIN_PRO_THINKING_BUDGET = 128
+
+# The async client multiplexes many in-flight generations over one event
+# loop, so its pool is far larger than a thread worker's.
+ASYNC_POOL_SIZE = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", "1000"))
+
+
+
+
+# -----------------------------------------------------
+# GEMINI CLIENT (ONE POOLED SESSION PER WORKER)
+# -----------------------------------------------------
+class GeminiClient:
+
+    def __init__(self, api_key=None, base_url=None,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), pool_size=POOL_SIZE,
+                 async_pool_size=ASYNC_POOL_SIZE, breaker=None, retry=None):
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        if base_url is None:
+            base_url = getattr(settings, "GEMINI_API_BASE", GEMINI_API_BASE)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.async_pool_size = async_pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.retry = retry or RetryPolicy()
+        self.headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": self.api_key or "",
+        }
+        self._urls = {}
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    # -------------------------------------------------
+    # SESSION
+    # -------------------------------------------------
+    @property
+    def session(self):
+        # gunicorn forks workers after import, so a session created in the
+        # master must never be shared: rebuild it once per process.
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.pool_size,
+                        pool_block=False,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._session_pid = pid
+        return self._session
+
+    @property
+    def async_client(self):
+        # httpx.AsyncClient is bound to the loop that first uses it; keep
+        # one per running loop (one per process under uvicorn).
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect, read = self.timeout
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(read, connect=connect, pool=read),
+                limits=httpx.Limits(
+                    max_connections=self.async_pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def url(self, model, method="generateContent"):
+        key = (model, method)
+        url = self._urls.get(key)
+        if url is None:
+            url = f"{self.base_url}/models/{model}:{method}"
+            self._urls[key] = url
+        return url
+
+    # -------------------------------------------------
+    # REQUEST
+    # -------------------------------------------------
+    def allow(self, model, method):
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            UPSTREAM_RESPONSES.labels(model, method, "circuit_open").inc()
+            raise
+
+    def build_payload(self, prompt, temperature, top_p=0.9, max_output_tokens=1024,
+                      thinking_budget=None, system_instruction=None, cached_content=None):
+        # A cachedContent already holds its system instruction; the API
+        # refuses a request that sends both.
+        payload = {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": prompt}
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "temperature": temperature,
+                "topP": top_p,
+                "maxOutputTokens": max_output_tokens
+            }
+        }
+        if thinking_budget is not None:
+            payload["generationConfig"]["thinkingConfig"] = {"thinkingBudget": thinking_budget}
+        if cached_content:
+            payload["cachedContent"] = cached_content
+        elif system_instruction:
+            payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return payload
+
+    def generate_content(self, payload, model=GEMINI_MODEL):
+        # Fails fast with CircuitOpenError while the breaker is open;
+        # otherwise retries 429/5xx/connect errors with jittered backoff.
+        self.retry.deposit()
+        attempt = 0
+        while True:
+            self.allow(model, "generateContent")
+            started = time.perf_counter()
+            try:
+                res = self.session.post(self.url(model), json=payload_for_model(payload, model),
+                                        timeout=self.timeout)
+                res.raise_for_status()
+            except Exception as e:
+                observe_upstream(model, "generateContent", started, e)
+                self.breaker.record(e)
+                delay = self.retry.backoff(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            observe_upstream(model, "generateContent", started)
+            self.breaker.record_success()
+            return res.json()
+
+    def create_cached_content(self, model, system_instruction, ttl):
+        # Returns the handle ("cachedContents/...") for generateContent's
+        # cachedContent field. Not retried: callers fall back to sending
+        # the instruction inline.
+        started = time.perf_counter()
+        try:
+            res = self.session.post(
+                f"{self.base_url}/cachedContents",
+                json={
+                    "model": f"models/{model}",
+                    "systemInstruction": {"parts": [{"text": system_instruction}]},
+                    "ttl": f"{int(ttl)}s",
+                },
+                timeout=self.timeout,
+            )
+            res.raise_for_status()
+        except Exception as e:
+            observe_upstream(model, "cachedContents", started, e)
+            raise
+        observe_upstream(model, "cachedContents", started)
+        return res.json()["name"]
+
+    def generate(self, prompt, temperature, top_p=0.9, max_output_tokens=1024, model=GEMINI_MODEL):
+        payload = self.build_payload(prompt, temperature, top_p, max_output_tokens)
+        data = self.generate_content(payload, model=model)
+        return extract_text(data)
+
+    # -------------------------------------------------
+    # STREAMING (streamGenerateContent?alt=sse)
+    # -------------------------------------------------
+    def stream_generate(self, payload, model=GEMINI_MODEL, on_data=None):
+        # Streams go through the breaker but are not retried: once text
+        # has reached the browser a retry would duplicate it. on_data, if
+        # given, sees every parsed event (the last carries usage totals).
+        self.allow(model, "streamGenerateContent")
+        started = time.perf_counter()
+        try:
+            res = self.session.post(
+                self.url(model, "streamGenerateContent"),
+                params=STREAM_PARAMS,
+                json=payload_for_model(payload, model),
+                timeout=self.timeout,
+                stream=True,
+            )
+            res.raise_for_status()
+        except Exception as e:
+            observe_upstream(model, "streamGenerateContent", started, e)
+            self.breaker.record(e)
+            raise
+        observe_upstream(model, "streamGenerateContent", started)
+        self.breaker.record_success()
+        with res:
+            for line in res.iter_lines(decode_unicode=True):
+                text = parse_sse_line(line, on_data)
+                if text:
+                    yield text
+
+    async def agenerate_content(self, payload, model=GEMINI_MODEL):
+        self.retry.deposit()
+        attempt = 0
+        while True:
+            self.allow(model, "generateContent")
+            started = time.perf_counter()
+            try:
+                res = await self.async_client.post(self.url(model), json=payload_for_model(payload, model))
+                raise_for_status(res)
+            except Exception as e:
+                observe_upstream(model, "generateContent", started, e)
+                self.breaker.record(e)
+                delay = self.retry.backoff(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled: no outcome to record, but a half-open probe
+                # must not stay taken.
+                self.breaker.release()
+                raise
+            observe_upstream(model, "generateContent", started)
+            self.breaker.record_success()
+            return res.json()
+
+    async def agenerate(self, prompt, temperature, top_p=0.9, max_output_tokens=1024, model=GEMINI_MODEL):
+        payload = self.build_payload(prompt, temperature, top_p, max_output_tokens)
+        data = await self.agenerate_content(payload, model=model)
+        return extract_text(data)
+
+    async def astream_generate(self, payload, model=GEMINI_MODEL, on_data=None):
+        self.allow(model, "streamGenerateContent")
+        started = time.perf_counter()
+        connected = False
+        try:
+            async with self.async_client.stream(
+                "POST",
+                self.url(model, "streamGenerateContent"),
+                params=STREAM_PARAMS,
+                json=payload_for_model(payload, model),
+            ) as res:
+                raise_for_status(res)
+                connected = True
+                observe_upstream(model, "streamGenerateContent", started)
+                self.breaker.record_success()
+                async for line in res.aiter_lines():
+                    text = parse_sse_line(line, on_data)
+                    if text:
+                        yield text
+        except Exception as e:
+            if not connected:
+                observe_upstream(model, "streamGenerateContent", started, e)
+                self.breaker.record(e)
+            raise
+        except BaseException:
+            if not connected:
+                self.breaker.release()
+            raise
+
+
+STREAM_PARAMS = {"alt": "sse"}
+
+
+def payload_for_model(payload, model):
+    config = payload.get("generationConfig", {})
+    budget = config.get("thinkingConfig", {}).get("thinkingBudget")
+    # -1 (dynamic thinking) is valid everywhere.
+    if budget is None or not 0 <= budget < MIN_PRO_THINKING_BUDGET or "-pro" not in model:
+        return payload
+    extra = MIN_PRO_THINKING_BUDGET - budget
+    config = dict(config, thinkingConfig={"thinkingBudget": MIN_PRO_THINKING_BUDGET})
+    if "maxOutputTokens" in config:
+        config["maxOutputTokens"] += extra
+    return dict(payload, generationConfig=config)
+
+
+def raise_for_status(res):
+    # httpx responses raise the same exception type as the requests path,
+    # so callers handle both with one except clause.
+    if res.status_code >= 400:
+        raise requests.exceptions.HTTPError(
+            f"{res.status_code} Error for url: {res.url}", response=res)
+
+
+def parse_sse_line(line, on_data=None):
+    # Each event is one "data: {...}" line holding a partial
+    # GenerateContentResponse; the last one may carry only usage data.
+    if not line or not line.startswith("data:"):
+        return ""
+    data = json.loads(line[5:])
+    if on_data is not None:
+        on_data(data)
+    parts = (data.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def extract_text(data):
+    return data["candidates"][0]["content"]["parts"][0]["text"]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def api_keys():
+    keys = os.getenv("GEMINI_API_KEYS") or os.getenv("GEMINI_API_KEY") or ""
+    return [k.strip() for k in keys.split(",") if k.strip()]
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                keys = api_keys()
+                if len(keys) > 1 or len(GEMINI_MODELS) > 1:
+                    from .router import GeminiRouter
+                    _client = GeminiRouter(keys, GEMINI_MODELS)
+                else:
+                    _client = GeminiClient()
+    return _client
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from .token_budget import estimate_tokens
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+MODEL_PATH = re.compile(r"/models/([^:/\s]+):")
+
+
+
+
+# -----------------------------------------------------
+# LOCAL GEMINI STUB
+# A tiny keep-alive HTTP/1.1 server that answers generateContent after
+# a sampled delay and streamGenerateContent word by word. It runs on its
+# own event loop thread so thousands of slow "upstream" calls cost
+# nothing but sockets.
+#
+# latency/spread by distribution:
+#   fixed      always `latency`
+#   uniform    latency +/- spread
+#   normal     mean latency, standard deviation spread
+#   lognormal  median latency, sigma spread (long right tail)
+#
+# Faults: `error_rate` of requests get a 503, and for `burst_length`
+# seconds out of every `burst_every` all requests get a 429 with
+# Retry-After, like a quota window running dry.
+#
+# Answers are cut to the request's maxOutputTokens (finishReason
+# MAX_TOKENS) and carry usageMetadata, counted with the same local
+# estimate write/token_budget.py uses.
+#
+# POST /cachedContents stores a system instruction and returns its
+# handle; one under `cache_min_tokens` is refused with a 400 like the
+# real API's minimum size. A request naming an unknown handle gets a
+# 404; a known one's tokens are reported as cachedContentTokenCount.
+#
+# model_latency maps a model name to its own `latency`, so a router can
+# be shown a slow model and a fast one behind the same stub.
+# -----------------------------------------------------
+class GeminiStub:
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5,
+                 text="A quiet window, rain tracing the glass.",
+                 distribution="fixed", spread=0.0, error_rate=0.0,
+                 burst_every=0.0, burst_length=0.0, retry_after=1, seed=None,
+                 cache_min_tokens=0, model_latency=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.text = text
+        self.distribution = distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.cache_min_tokens = cache_min_tokens
+        self.cached = {}
+        self.cache_creates = 0
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.by_model = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1beta"
+
+    # -------------------------------------------------
+    # LIFECYCLE
+    # -------------------------------------------------
+    def start(self):
+        ready = threading.Event()
+        failed = []
+        self.started = time.monotonic()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port, backlog=4096))
+            except OSError as e:  # port in use etc.: surface it in start()
+                failed.append(e)
+                loop.close()
+                ready.set()
+                return
+            self._loop = loop
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="gemini-stub", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if failed:
+            raise failed[0]
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self._server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -------------------------------------------------
+    # HTTP
+    # -------------------------------------------------
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                request_line = request_line.decode("latin-1")
+                match = MODEL_PATH.search(request_line)
+                model = match.group(1) if match else None
+                if model is not None:
+                    self.by_model[model] = self.by_model.get(model, 0) + 1
+                fault = self.fault()
+                if fault is not None:
+                    self.write_json(writer, *fault)
+                elif "/cachedContents " in request_line:
+                    self.write_json(writer, *self.create_cached(body))
+                elif self.unknown_handle(body):
+                    self.write_json(writer, "404 Not Found",
+                                    error(404, "CachedContent not found.", "NOT_FOUND"))
+                elif "streamGenerateContent" in request_line:
+                    await self.respond_stream(writer, body, model)
+                else:
+                    self.write_json(writer, *await self.respond(request_line, body, model))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def write_json(self, writer, status, payload, headers=None):
+        out = json.dumps(payload).encode("utf-8")
+        extra = "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(out)}\r\n"
+            f"{extra}"
+            "\r\n".encode("latin-1") + out
+        )
+
+    async def respond(self, request_line, body, model=None):
+        await asyncio.sleep(self.delay(model))
+        text, finish, usage = self.answer(body)
+        return "200 OK", candidate(text, finish, usage)
+
+    def answer(self, body):
+        # (text, finishReason, usageMetadata) for a request body.
+        request = parse(body)
+        prompt = "".join(
+            part.get("text", "")
+            for content in request.get("contents", [])
+            for part in content.get("parts", []))
+        instruction = parts_text(request.get("systemInstruction"))
+        cached = self.cached.get(request.get("cachedContent"), "")
+        limit = request.get("generationConfig", {}).get("maxOutputTokens")
+        words = self.text.split(" ")
+        finish = "STOP"
+        while limit and len(words) > 1 and estimate_tokens(" ".join(words)) > limit:
+            words.pop()
+            finish = "MAX_TOKENS"
+        text = " ".join(words)
+        usage = {
+            "promptTokenCount": estimate_tokens(instruction + cached + prompt),
+            "candidatesTokenCount": estimate_tokens(text),
+        }
+        if cached:
+            usage["cachedContentTokenCount"] = estimate_tokens(cached)
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        return text, finish, usage
+
+    def create_cached(self, body):
+        request = parse(body)
+        instruction = parts_text(request.get("systemInstruction"))
+        tokens = estimate_tokens(instruction)
+        if tokens < self.cache_min_tokens:
+            return "400 Bad Request", error(
+                400, f"Cached content is too small. total_token_count={tokens}, "
+                     f"min_total_token_count={self.cache_min_tokens}", "INVALID_ARGUMENT")
+        self.cache_creates += 1
+        name = f"cachedContents/stub-{self.cache_creates}"
+        self.cached[name] = instruction
+        ttl = float(request.get("ttl", "3600s").rstrip("s"))
+        expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + ttl))
+        return "200 OK", {
+            "name": name,
+            "model": request.get("model"),
+            "expireTime": expire,
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+
+    def unknown_handle(self, body):
+        name = parse(body).get("cachedContent")
+        return name is not None and name not in self.cached
+
+    # -------------------------------------------------
+    # LATENCY AND FAULTS
+    # -------------------------------------------------
+    def delay(self, model=None):
+        latency = self.model_latency.get(model, self.latency)
+        if self.distribution == "uniform":
+            value = self.rng.uniform(latency - self.spread, latency + self.spread)
+        elif self.distribution == "normal":
+            value = self.rng.gauss(latency, self.spread)
+        elif self.distribution == "lognormal":
+            value = latency * math.exp(self.rng.gauss(0.0, self.spread))
+        else:
+            value = latency
+        return max(0.0, value)
+
+    def in_burst(self):
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_length
+
+    def fault(self):
+        # (status, payload, headers) for a failed request, else None.
+        if self.in_burst():
+            self.throttled += 1
+            return ("429 Too Many Requests",
+                    error(429, "Resource has been exhausted (e.g. check quota).", "RESOURCE_EXHAUSTED"),
+                    {"Retry-After": str(self.retry_after)})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            return ("503 Service Unavailable",
+                    error(503, "The model is overloaded. Please try again later.", "UNAVAILABLE"))
+        return None
+
+    async def respond_stream(self, writer, body, model=None):
+        # Word-sized chunks spread over the configured latency, sent as
+        # SSE over chunked transfer encoding like the real endpoint; the
+        # last event carries finishReason and usage.
+        text, finish, usage = self.answer(body)
+        words = text.split(" ")
+        pieces = [w + " " for w in words[:-1]] + words[-1:]
+        delay = self.delay(model) / max(len(pieces), 1)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+        )
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(delay)
+            data = candidate(piece, finish, usage) if i == len(pieces) - 1 else candidate(piece)
+            event = f"data: {json.dumps(data)}\r\n\r\n".encode("utf-8")
+            writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+
+def candidate(text, finish=None, usage=None):
+    data = {
+        "candidates": [
+            {"content": {"parts": [{"text": text}], "role": "model"}}
+        ]
+    }
+    if finish:
+        data["candidates"][0]["finishReason"] = finish
+    if usage:
+        data["usageMetadata"] = usage
+    return data
+
+
+def parse(body):
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return {}
+
+
+def parts_text(content):
+    return "".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+
+def error(code, message, status):
+    return {"error": {"code": code, "message": message, "status": status}}
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+class HashingBusy(Exception):
+    pass
+
+
+
+
+# -----------------------------------------------------
+# PASSWORD HASHING POOL
+# PBKDF2, bcrypt and argon2 all release the GIL while hashing, so a few
+# threads are enough to take the work off the event loop. The pool caps
+# how many cores a signup burst can burn; beyond HASHING_QUEUE waiting
+# jobs callers get HashingBusy instead of queueing.
+# -----------------------------------------------------
+class HashingPool:
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Threads don't survive a fork; each gunicorn worker builds its own.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="hashing")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Too many password hashes queued")
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+pool = HashingPool(
+    getattr(settings, "HASHING_WORKERS", 2),
+    getattr(settings, "HASHING_QUEUE", 32),
+)
+
+
+
+
+# -----------------------------------------------------
+# HASH
+# The async path frees the event loop while the pool hashes. The sync
+# path still blocks its request thread on the result: it caps the cores
+# hashing can take, but frees no threads (serve signups through ASGI
+# for that).
+# -----------------------------------------------------
+def hash_password(password):
+    return pool.run(make_password, password)
+
+
+async def ahash_password(password):
+    return await pool.arun(make_password, password)
@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+
+from .resilience import status_of
+
+# Opt-in: register each mode's system instruction with Gemini's
+# cachedContents API and send only the handle with every request.
+CACHED_CONTENT = os.getenv("GEMINI_CACHED_CONTENT", "0") == "1"
+CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Handles are replaced once this much of their TTL has passed, so a
+# request never carries one that is about to expire.
+REFRESH_AT = 0.8
+# After a failed create (e.g. the instruction is below the API's minimum
+# cacheable size) the mode stays inline this long before trying again.
+RETRY_AFTER = 600
+
+log = logging.getLogger(__name__)
+
+
+
+
+# -----------------------------------------------------
+# SYSTEM INSTRUCTIONS
+# Each mode's rules are a fixed system instruction, built once; only the
+# user's event, tone and the like travel as user content. fields()
+# returns what build_payload() needs for a mode: the instruction inline,
+# or with CACHED_CONTENT a cachedContents handle. Handles are created
+# and refreshed on a background thread, never on a request; until one
+# exists (or if creating it fails) the instruction goes inline.
+# -----------------------------------------------------
+class SystemInstructions:
+
+    def __init__(self, texts, client, cached=CACHED_CONTENT, ttl=CACHE_TTL):
+        self.texts = texts
+        self.client = client
+        self.cached = cached
+        self.ttl = ttl
+        self._handles = {}      # (model, mode) -> (name, refresh_at)
+        self._failed = {}       # (model, mode) -> retry_at
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def text(self, mode):
+        return self.texts.get(mode)
+
+    def fields(self, model, mode):
+        if self.cached:
+            name = self.handle(model, mode)
+            if name is not None:
+                return {"cached_content": name}
+        return {"system_instruction": self.texts[mode]}
+
+    def handle(self, model, mode):
+        key = (model, mode)
+        now = time.monotonic()
+        with self._lock:
+            name, refresh_at = self._handles.get(key, (None, 0.0))
+            # Past refresh_at an existing handle still has a fifth of its
+            # TTL left, so it is used while the replacement is created.
+            if now < refresh_at or key in self._pending or now < self._failed.get(key, 0.0):
+                return name
+            self._pending.add(key)
+        threading.Thread(target=self.create, args=(model, mode), daemon=True,
+                         name="heartnote-cache-create").start()
+        return name
+
+    def create(self, model, mode):
+        key = (model, mode)
+        try:
+            name = self.client.create_cached_content(model, self.texts[mode], self.ttl)
+        except Exception as e:
+            log.warning("cachedContents create failed for %s/%s: %s", model, mode, e)
+            name = None
+        with self._lock:
+            self._pending.discard(key)
+            if name is None:
+                self._handles.pop(key, None)
+                self._failed[key] = time.monotonic() + RETRY_AFTER
+            else:
+                self._handles[key] = (name, time.monotonic() + self.ttl * REFRESH_AT)
+
+    def forget(self, payload, error):
+        # A handle the API no longer knows (evicted, or deleted by hand)
+        # fails the request once; the next request goes inline and a new
+        # handle is created.
+        name = payload.get("cachedContent")
+        if name is None or status_of(error) not in (400, 403, 404):
+            return
+        with self._lock:
+            for key, (handle, _) in list(self._handles.items()):
+                if handle == name:
+                    del self._handles[key]
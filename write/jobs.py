@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import JOB_WAIT, JOBS, fallback
+from .models import GenerationJob
+from .scheduler import STILL_FORMING, acting_for, current_client
+
+# Jobs processed at once by one `runjobs` process.
+JOB_WORKERS = int(os.getenv("HEARTNOTE_JOB_WORKERS", "4"))
+# How often an idle worker, a long-poll or an SSE stream looks again.
+JOB_POLL = float(os.getenv("HEARTNOTE_JOB_POLL", "0.25"))
+# Longest ?wait= a long-poll may ask for.
+JOB_WAIT_MAX = int(os.getenv("HEARTNOTE_JOB_WAIT", "20"))
+# Under WSGI a waiting view holds a worker thread, so there a long-poll
+# waits at most this long and an SSE connection closes after it; the
+# page asks again (EventSource reconnects by itself).
+JOB_SYNC_WAIT = float(os.getenv("HEARTNOTE_JOB_SYNC_WAIT", "1"))
+# A running job not finished within its lease (worker killed mid-call)
+# is queued again, up to JOB_ATTEMPTS times in all.
+JOB_LEASE = int(os.getenv("HEARTNOTE_JOB_LEASE", "120"))
+JOB_ATTEMPTS = 3
+# Beyond this many queued jobs new requests are turned away (503), so a
+# spike that outlasts the workers doesn't grow the queue without bound.
+JOB_QUEUE_LIMIT = int(os.getenv("HEARTNOTE_JOB_QUEUE_LIMIT", "1000"))
+# Finished jobs are deleted after this long.
+JOB_RETENTION = int(os.getenv("HEARTNOTE_JOB_RETENTION", "3600"))
+# SSE gives up on a job that hasn't finished this long after it was
+# queued (no worker running, say) and sends the fallback.
+JOB_STREAM_TIMEOUT = int(os.getenv("HEARTNOTE_JOB_STREAM_TIMEOUT", "300"))
+HEARTBEAT = 10
+MAINTAIN_EVERY = 30
+
+FINISHED = (GenerationJob.DONE, GenerationJob.FAILED)
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+
+
+# -----------------------------------------------------
+# QUEUE
+# A table in the app's SQLite database. Workers claim the oldest queued
+# job with a conditional UPDATE, so two workers never run the same one;
+# the lease puts a job back if its worker died.
+# -----------------------------------------------------
+def enqueue(kind, params):
+    if GenerationJob.objects.filter(status=GenerationJob.QUEUED).count() >= JOB_QUEUE_LIMIT:
+        JOBS.labels(kind, "rejected").inc()
+        raise QueueFull(kind)
+    job = GenerationJob.objects.create(kind=kind, params=params, client=current_client())
+    JOBS.labels(kind, "queued").inc()
+    return job
+
+
+def claim():
+    while True:
+        job = (GenerationJob.objects.filter(status=GenerationJob.QUEUED)
+               .order_by("created").only("id").first())
+        if job is None:
+            return None
+        taken = GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.QUEUED).update(
+            status=GenerationJob.RUNNING, started=timezone.now(), attempts=F("attempts") + 1)
+        if taken:
+            job = GenerationJob.objects.get(pk=job.pk)
+            JOB_WAIT.labels(job.kind).observe((job.started - job.created).total_seconds())
+            return job
+        # Another worker got there first; try the next one.
+
+
+def finish(job, status, result):
+    GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.RUNNING).update(
+        status=status, result=result, finished=timezone.now())
+    JOBS.labels(job.kind, status).inc()
+
+
+def requeue(job):
+    GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.RUNNING).update(
+        status=GenerationJob.QUEUED, started=None)
+    JOBS.labels(job.kind, "retried").inc()
+
+
+def maintain():
+    now = timezone.now()
+    for job in GenerationJob.objects.filter(
+            status=GenerationJob.RUNNING, started__lt=now - timedelta(seconds=JOB_LEASE)):
+        if job.attempts < JOB_ATTEMPTS:
+            requeue(job)
+        else:
+            finish(job, GenerationJob.FAILED, failure_result(job.kind))
+    GenerationJob.objects.filter(
+        status__in=FINISHED, finished__lt=now - timedelta(seconds=JOB_RETENTION)).delete()
+
+
+def failure_result(kind, reason="job_failed"):
+    # Same shapes the direct endpoints return.
+    fallback(kind, reason)
+    if kind == "dashboard":
+        return {"response": {"response": STILL_FORMING, "blocked": False, "is_fallback": True}}
+    return {"response": "⚠️ " + STILL_FORMING}
+
+
+
+
+# -----------------------------------------------------
+# WORKER
+# `python manage.py runjobs`. The main thread claims a job whenever one
+# of `concurrency` slots is free and hands it to the pool, so an idle
+# worker costs one indexed query per JOB_POLL, however many slots it has.
+# -----------------------------------------------------
+class JobWorker:
+
+    def __init__(self, concurrency=JOB_WORKERS, poll=JOB_POLL, runners=None):
+        self.concurrency = concurrency
+        self.poll = poll
+        self.runners = runners or default_runners()
+        self.stopping = threading.Event()
+        self._maintained = 0.0
+
+    def stop(self):
+        self.stopping.set()
+
+    def serve(self, once=False):
+        # once: exit when the queue is empty instead of waiting for more.
+        slots = threading.BoundedSemaphore(self.concurrency)
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="heartnote-job") as pool:
+            while not self.stopping.is_set():
+                self.maintain()
+                if not slots.acquire(timeout=self.poll):
+                    continue
+                job = claim()
+                if job is None:
+                    slots.release()
+                    if once:
+                        break
+                    self.stopping.wait(self.poll)
+                    continue
+                pool.submit(self.run, job).add_done_callback(lambda f: slots.release())
+        connection.close()
+
+    def maintain(self):
+        now = time.monotonic()
+        if now - self._maintained >= MAINTAIN_EVERY:
+            self._maintained = now
+            maintain()
+
+    def run(self, job):
+        close_old_connections()
+        try:
+            # The worker's Gemini calls queue under the session (or IP)
+            # that submitted the job, as the direct endpoints' calls do.
+            with acting_for(job.client or "job"):
+                result = self.runners[job.kind](**job.params)
+        except Exception:
+            log.exception("job %s (%s) failed", job.id, job.kind)
+            if job.attempts < JOB_ATTEMPTS:
+                requeue(job)
+            else:
+                finish(job, GenerationJob.FAILED, failure_result(job.kind))
+            return
+        finish(job, GenerationJob.DONE, result)
+
+
+def default_runners():
+    # Only the worker builds services; the web process imports this
+    # module just to enqueue jobs and read results.
+    from .dashboard_llm_service import Dashboard_LLM_Service
+    from .llm_service import LLM_Service
+
+    # Job params are the services' keyword arguments; results are the
+    # direct endpoints' response bodies.
+    llm_simple = LLM_Service()
+    dashboard_llm = Dashboard_LLM_Service()
+    return {
+        "generate": lambda **params: {"response": llm_simple.generate(**params)},
+        "dashboard": lambda **params: {"response": dashboard_llm.generate(**params)},
+    }
+
+
+
+
+# -----------------------------------------------------
+# RESULTS
+# Read by polling the row: the worker is another process, and an
+# indexed primary-key read every JOB_POLL is cheaper than any channel
+# between them. describe() is the long-poll body; events() the SSE.
+# -----------------------------------------------------
+def describe(job):
+    data = {"job": str(job.id), "status": job.status}
+    if job.status in FINISHED:
+        data.update(job.result or {})
+    return data
+
+
+def wait(job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = GenerationJob.objects.filter(pk=job_id).first()
+        if job is None or job.status in FINISHED or time.monotonic() >= deadline:
+            return job
+        time.sleep(JOB_POLL)
+
+
+async def await_job(job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await GenerationJob.objects.filter(pk=job_id).afirst()
+        if job is None or job.status in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(JOB_POLL)
+
+
+def result_events(job, kind):
+    # The same ("chunk", text) / ("done", flags) events the stream
+    # endpoints send.
+    if job is None:
+        result, complete = failure_result(kind, "job_expired"), False
+    elif job.status not in FINISHED:
+        result, complete = failure_result(kind, "job_timeout"), False
+    else:
+        result, complete = job.result, True
+    response = result["response"]
+    if isinstance(response, dict):
+        flags = {"blocked": response["blocked"], "is_fallback": response["is_fallback"]}
+        response = response["response"]
+    else:
+        flags = {}
+    return [("chunk", response), ("done", {"complete": complete, **flags})]
+
+
+def overdue(job):
+    return timezone.now() - job.created >= timedelta(seconds=JOB_STREAM_TIMEOUT)
+
+
+def events(job_id, kind, lifetime=JOB_STREAM_TIMEOUT):
+    # lifetime: how long this connection stays open. Past it the stream
+    # just ends and the client reconnects for the rest.
+    closes = time.monotonic() + lifetime
+    while True:
+        job = wait(job_id, min(HEARTBEAT, max(0, closes - time.monotonic())))
+        if job is None or job.status in FINISHED or overdue(job):
+            yield from result_events(job, kind)
+            return
+        # No page listens for these beyond knowing the job is alive;
+        # they also keep proxies from closing an idle stream.
+        yield "waiting", {"status": job.status}
+        if time.monotonic() >= closes:
+            return
+
+
+async def aevents(job_id, kind, lifetime=JOB_STREAM_TIMEOUT):
+    closes = time.monotonic() + lifetime
+    while True:
+        job = await await_job(job_id, min(HEARTBEAT, max(0, closes - time.monotonic())))
+        if job is None or job.status in FINISHED or overdue(job):
+            for event in result_events(job, kind):
+                yield event
+            return
+        yield "waiting", {"status": job.status}
+        if time.monotonic() >= closes:
+            return
@@ -1,7 +1,17 @@
-import requests
 from datetime import datetime
-import os
-import time
+
+from .gemini_client import GEMINI_MODEL, extract_text, get_client
+from .instructions import SystemInstructions
+from .metrics import fallback, input_fitted, record_usage, safety_block
+from .response_cache import make_key, response_cache
+from .scheduler import STILL_FORMING, Overloaded, scheduler as default_scheduler
+from .safety import BLOCKLIST, SELFHARM, safety
+from .singleflight import flight_key, flights as default_flights
+from .timing import span
+from .token_budget import (
+    INPUT_TOKENS, REJECTED, THINKING_BUDGET, fit_text, output_budget,
+    script_language, words_for,
+)
 
 
 
@@ -20,12 +30,16 @@ TONE_MAP = {
 
 
 # ------------------------------------------
-# TEMPLATES
+# SYSTEM INSTRUCTIONS
+# The fixed rules for each mode. They never change between requests, so
+# they go in the request's systemInstruction (or a cachedContents handle,
+# see write/instructions.py) rather than being re-sent inside every
+# prompt.
 # ------------------------------------------
+MODES = ("letter", "journal", "poem", "reflection", "story")
 
-LETTER_TEMPLATE = """
-Write a short personal letter based only on this real event:
-{content}
+LETTER_INSTRUCTION = """
+Write a short personal letter based only on the real event the user describes.
 
 Rules:
 - 50–60 words
@@ -33,7 +47,7 @@ Rules:
 - No new events or characters
 - No advice or life lessons
 - Focus only on internal feelings
-- Tone: {tone}
+- Use the tone the user gives
 
 Start with:
 Dear You,
@@ -44,68 +58,109 @@ Dear You,
 
 
 
-JOURNAL_TEMPLATE = """
-Write a journal entry about this real event:
-{content}
+JOURNAL_INSTRUCTION = """
+Write a journal entry about the real event the user describes.
 
 Rules:
 - 50–70 words
 - 4–6 sentences
 - Mention one concrete detail
 - No advice or philosophy
-- Tone: {tone}
+- Use the tone the user gives
 
 Start with:
-Date: {date}
+Date: <the date the user gives>
 """
 
 
 
 
-POEM_TEMPLATE = """
-Write a short poem based only on:
-{content}
+POEM_INSTRUCTION = """
+Write a short poem based only on what the user describes.
 
 Rules:
 - Exactly 4 short lines
 - Concrete imagery only
 - No rhyming
-- Tone: {tone}
+- Use the tone the user gives
 
 Return only the poem.
 """
 
 
-REFLECTION_TEMPLATE = """
-Write a short reflection based only on:
-{content}
+REFLECTION_INSTRUCTION = """
+Write a short reflection based only on what the user describes.
 
 Rules:
 - 40–60 words
 - 3–5 sentences
 - Mention one concrete detail
 - No advice or general life statements
-- Tone: {tone}
+- Use the tone the user gives
 
 Return only the reflection.
 """
 
 
 
-STORY_TEMPLATE = """
-Write a very short story based only on:
-{content}
+STORY_INSTRUCTION = """
+Write a very short story based only on what the user describes.
 
 Rules:
 - 2–3 sentences
 - Focus on one small physical action
 - No moral or philosophical ending
-- Tone: {tone}
+- Use the tone the user gives
 
 Return only the story.
 """
 
 
+INSTRUCTIONS = {
+    "letter": LETTER_INSTRUCTION,
+    "journal": JOURNAL_INSTRUCTION,
+    "poem": POEM_INSTRUCTION,
+    "reflection": REFLECTION_INSTRUCTION,
+    "story": STORY_INSTRUCTION,
+}
+
+
+
+
+# ------------------------------------------
+# TEMPLATES
+# What changes per request: the event and the tone (and the date, for
+# journal entries).
+# ------------------------------------------
+PROMPT_TEMPLATE = """Event:
+{content}
+
+Tone: {tone}
+"""
+
+JOURNAL_TEMPLATE = PROMPT_TEMPLATE + """Date: {date}
+"""
+
+
+
+
+# ------------------------------------------
+# OUTPUT BUDGETS
+# Longest answer each template asks for, in words; write/token_budget.py
+# turns it into maxOutputTokens for the input's script.
+# ------------------------------------------
+OUTPUT_WORDS = {
+    "letter": 60,
+    "journal": 70,
+    "poem": 32,
+    "reflection": 60,
+    "story": 60,
+}
+
+TOO_LONG = "⚠️ That's a lot to hold at once. Please shorten it to about {words} words."
+SHED = "⚠️ " + STILL_FORMING
+
+
 
 
 # ------------------------------------------
@@ -113,105 +168,249 @@ Return only the story.
 # ------------------------------------------
 class LLM_Service:
 
-    def __init__(self):
-        pass
-
- 
-    def call_gemini(self, prompt):
-        api_key = os.getenv("GEMINI_API_KEY")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
-        headers = {
-            "Content-Type": "application/json"
-               }
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt}
-                    ]
-                }
-            ],
-                "generationConfig": {
-                "temperature": 0.5,
-                "topP": 0.9,
-                "maxOutputTokens": 1024
-              }
-            }
+    def __init__(self, client=None, model=GEMINI_MODEL, cache=response_cache,
+                 flights=default_flights, scheduler=default_scheduler):
+        self.client = client or get_client()
+        self.model = model
+        self.cache = cache
+        self.flights = flights
+        self.scheduler = scheduler
+        self.instructions = SystemInstructions(INSTRUCTIONS, self.client)
+
+
+    def payload(self, mode, prompt, max_output_tokens=1024):
+        return self.client.build_payload(
+            prompt,
+            temperature=0.5,
+            top_p=0.9,
+            max_output_tokens=max_output_tokens,
+            thinking_budget=THINKING_BUDGET,
+            **self.instructions.fields(self.model, mode),
+        )
+
+    def call_gemini(self, payload, mode):
+        try:
+            with self.scheduler.slot("generate"):
+                data = self.client.generate_content(payload, model=self.model)
+            record_usage("generate", mode, data)
+            return extract_text(data).strip()
+        except Exception as e:
+            return self.upstream_error(payload, e)
+
+    async def acall_gemini(self, payload, mode):
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            data = response.json()
-            return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+            async with self.scheduler.aslot("generate"):
+                data = await self.client.agenerate_content(payload, model=self.model)
+            record_usage("generate", mode, data)
+            return extract_text(data).strip()
         except Exception as e:
-            return f"⚠️ Gemini error: {str(e)}"
+            return self.upstream_error(payload, e)
+
+    def upstream_error(self, payload, error):
+        # Message for a call that failed (or was shed) before any text.
+        self.instructions.forget(payload, error)
+        if isinstance(error, Overloaded):
+            fallback("generate", "shed")
+            return SHED
+        fallback("generate", "upstream_error")
+        return f"⚠️ Gemini error: {str(error)}"
     
-    def generate(self, mode, text, tone="soft"):
-        tone_style = TONE_MAP.get(tone, TONE_MAP["soft"])
+    def generate(self, mode, text, tone="soft", use_cache=True):
         mode = mode.lower().strip()
+        answer, payload, key = self.prepare(mode, text, tone, use_cache)
+        if answer is not None:
+            return answer
+
+        # Identical requests already in flight share one upstream call.
+        recheck = None
+        if use_cache and self.cache is not None:
+            recheck = lambda: self.cache.get_shared(key)
+        with span("upstream"):
+            return self.flights.do(flight_key(key, use_cache),
+                                   lambda: self.fetch(payload, key, mode), recheck)
+
+    async def agenerate(self, mode, text, tone="soft", use_cache=True):
+        mode = mode.lower().strip()
+        answer, payload, key = self.prepare(mode, text, tone, use_cache=False)
+        if answer is not None:
+            return answer
+        if use_cache and self.cache is not None:
+            with span("cache"):
+                cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached
+
+        with span("upstream"):
+            return await self.flights.ado(flight_key(key, use_cache),
+                                          lambda: self.afetch(payload, key, mode))
+
+    def fetch(self, payload, key, mode):
+        result = self.call_gemini(payload, mode)
+        self.store(key, result)
+        return result
+
+    async def afetch(self, payload, key, mode):
+        result = await self.acall_gemini(payload, mode)
+        if self.cacheable(result):
+            await self.cache.aset(key, result)
+        return result
 
-        # Select template
-        prompt = self.build_prompt(mode, text, tone_style)
-        safe, result = self.safety_filter(text)
+
+    # -------------------------
+    # Streaming
+    # Yields ("chunk", text) events, then a single ("done", meta) event.
+    # -------------------------
+    def stream(self, mode, text, tone="soft", use_cache=True):
+        mode = mode.lower().strip()
+        answer, payload, key = self.prepare(mode, text, tone, use_cache)
+        if answer is not None:
+            yield "chunk", answer
+            yield "done", {"complete": True}
+            return
+
+        parts = []
+        last = {}
+        try:
+            with span("upstream"), self.scheduler.slot("generate"):
+                for piece in self.client.stream_generate(payload, model=self.model,
+                                                         on_data=last.update):
+                    piece = piece if parts else piece.lstrip()
+                    if piece:
+                        parts.append(piece)
+                        yield "chunk", piece
+        except Exception as e:
+            if parts:
+                self.instructions.forget(payload, e)
+            else:
+                yield "chunk", self.upstream_error(payload, e)
+            yield "done", {"complete": False}
+            return
+
+        record_usage("generate", mode, last)
+        self.store(key, "".join(parts).strip())
+        yield "done", {"complete": True}
+
+    async def astream(self, mode, text, tone="soft", use_cache=True):
+        mode = mode.lower().strip()
+        answer, payload, key = self.prepare(mode, text, tone, use_cache=False)
+        if answer is None and use_cache and self.cache is not None:
+            with span("cache"):
+                answer = await self.cache.aget(key)
+        if answer is not None:
+            yield "chunk", answer
+            yield "done", {"complete": True}
+            return
+
+        parts = []
+        last = {}
+        try:
+            with span("upstream"):
+                async with self.scheduler.aslot("generate"):
+                    async for piece in self.client.astream_generate(
+                            payload, model=self.model, on_data=last.update):
+                        piece = piece if parts else piece.lstrip()
+                        if piece:
+                            parts.append(piece)
+                            yield "chunk", piece
+        except Exception as e:
+            if parts:
+                self.instructions.forget(payload, e)
+            else:
+                yield "chunk", self.upstream_error(payload, e)
+            yield "done", {"complete": False}
+            return
+
+        record_usage("generate", mode, last)
+        result = "".join(parts).strip()
+        if self.cacheable(result):
+            await self.cache.aset(key, result)
+        yield "done", {"complete": True}
+
+
+    # -------------------------
+    # Shared request preparation
+    # Returns (answer, payload, cache_key); a non-None answer is final.
+    # -------------------------
+    def prepare(self, mode, text, tone, use_cache=True):
+        tone = tone if tone in TONE_MAP else "soft"
+        tone_style = TONE_MAP[tone]
+        mode = mode.lower().strip()
+
+        # Safety sees the whole input, before any trimming
+        with span("safety"):
+            safe, result = self.safety_filter(text)
         if not safe:
-            return result
+            return result, None, None
 
+        text, refusal = self.fit_input(text)
+        if refusal is not None:
+            return refusal, None, None
 
+        # Select template
+        with span("prompt"):
+            prompt = self.build_prompt(mode, text, tone_style)
         if prompt is None:
-            return "⚠️ Unknown mode."
-        return self.call_gemini(prompt)
+            fallback("generate", "unknown_mode")
+            return "⚠️ Unknown mode.", None, None
+
+        key = self.cache_key(mode, text, tone)
+        if use_cache and self.cache is not None:
+            with span("cache"):
+                cached = self.cache.get(key)
+            if cached is not None:
+                return cached, None, key
+        with span("prompt"):
+            budget = output_budget(OUTPUT_WORDS[mode], script_language(text))
+            payload = self.payload(mode, prompt, max_output_tokens=budget)
+        return None, payload, key
+
+    def fit_input(self, text):
+        # Returns (text to use, refusal message or None).
+        text, action = fit_text(text, INPUT_TOKENS)
+        if action is not None:
+            input_fitted("generate", action)
+        if action == REJECTED:
+            return text, TOO_LONG.format(words=words_for(INPUT_TOKENS))
+        return text, None
+
+    def cacheable(self, result):
+        return self.cache is not None and bool(result) and not result.startswith("⚠️")
+
+    def store(self, key, result):
+        if self.cacheable(result):
+            self.cache.set(key, result)
+
+
+    def cache_key(self, mode, text, tone):
+        # Journal prompts carry today's date, so yesterday's entry must
+        # not be served again today.
+        date_str = datetime.now().strftime("%d/%m/%Y") if mode == "journal" else ""
+        return make_key("generate", self.model, mode, text, tone, date_str)
 
 
     # -------------------------
     # Template selection
     # -------------------------
     def build_prompt(self, mode, text, tone):
-        if mode == "letter":
-            return LETTER_TEMPLATE.format(content=text, tone=tone)
-        
-        
-
-        elif mode == "journal":
+        if mode not in INSTRUCTIONS:
+            return None
+        if mode == "journal":
             date_str = datetime.now().strftime("%d/%m/%Y")
             return JOURNAL_TEMPLATE.format(date=date_str, content=text, tone=tone)
+        return PROMPT_TEMPLATE.format(content=text, tone=tone)
 
-        elif mode == "poem":
-            return POEM_TEMPLATE.format(content=text, tone=tone)
-        elif mode == "reflection":
-            return REFLECTION_TEMPLATE.format(content=text, tone=tone)
-
-        elif mode == "story":
-            return STORY_TEMPLATE.format(content=text, tone=tone)
-        return None
-    
 
     def safety_filter(self, text):
-        text_lower = text.lower().strip()
-
-    # --------------------------------------
-    # BAD WORD BLOCK
-    # --------------------------------------
-        bad_words = [
-            "fuck", "bitch", "shit", "asshole",
-            "bastard", "slut", "dick", "pussy",
-            "kill you", "hurt you"  # generic abuse
-        ]
-        for w in bad_words:
-            if w in text_lower:
-                return False, "⚠️ Your input contains unsafe or harmful language. Please rewrite it more respectfully."
-
-        selfharm_patterns = [
-        "kill myself",
-        "kill me",
-        "i want to die",
-        "end my life",
-        "i want to disappear",
-        "i hurt myself",
-        "self harm",
-        "i can't live",
-        "no reason to live",
-    ]
-        for pattern in selfharm_patterns:
-            if pattern in text_lower:
-                return False, (
+        # Patterns are compiled once and shared with the dashboard service
+        verdict = safety.scan(text)
+        if verdict is not None:
+            safety_block("generate", verdict)
+
+        if verdict == BLOCKLIST:
+            return False, "⚠️ Your input contains unsafe or harmful language. Please rewrite it more respectfully."
+
+        if verdict == SELFHARM:
+            return False, (
                 "⚠️ HeartNote AI cannot continue this request.\n"
                 "You are feeling something heavy.\n"
                 "Here is a gentle, safe message instead:\n\n"
@@ -219,5 +418,5 @@ class LLM_Service:
                 "• You are not alone.\n"
                 "• Your feelings matter.\n"
             )
-            
+
         return True, text
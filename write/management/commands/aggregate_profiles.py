@@ -0,0 +1,77 @@
+import glob
+import os
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge collapsed-stack profile dumps into one file for flamegraph "
+        "tools and print the hottest frames."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILE_DIR)
+        parser.add_argument("--endpoint", default="",
+                            help="Only dumps for this URL name (e.g. generate_text).")
+        parser.add_argument("--since", type=float, default=0,
+                            help="Only dumps from the last N hours.")
+        parser.add_argument("--output", default="",
+                            help="Write the merged stacks here ('-' for stdout).")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--delete", action="store_true",
+                            help="Remove the dumps that were merged.")
+
+    def handle(self, *args, **opts):
+        paths = sorted(glob.glob(os.path.join(opts["dir"], "*.folded")))
+        if opts["endpoint"]:
+            paths = [p for p in paths if p.endswith(f"-{opts['endpoint']}.folded")]
+        if opts["since"]:
+            cutoff = time.time() - opts["since"] * 3600
+            paths = [p for p in paths if os.path.getmtime(p) >= cutoff]
+        if not paths:
+            raise CommandError(f"No profile dumps in {opts['dir']}.")
+
+        stacks = Counter()
+        for path in paths:
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack and count.isdigit():
+                        stacks[stack] += int(count)
+
+        if opts["output"]:
+            out = sys.stdout if opts["output"] == "-" else open(opts["output"], "w", encoding="utf-8")
+            try:
+                for stack, count in stacks.most_common():
+                    out.write(f"{stack} {count}\n")
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        if opts["output"] == "-":
+            return
+
+        # Self time: samples where the frame is the leaf. Total time:
+        # samples where it appears anywhere (counted once per stack).
+        total = sum(stacks.values())
+        own, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        self.stdout.write(f"{len(paths)} dumps, {total} samples\n")
+        for title, counter in (("self", own), ("total", inclusive)):
+            self.stdout.write(f"{title:>6} %  frame")
+            for frame, count in counter.most_common(opts["top"]):
+                self.stdout.write(f"{100 * count / total:>8.1f}  {frame}")
+            self.stdout.write("")
+
+        if opts["delete"]:
+            for path in paths:
+                os.remove(path)
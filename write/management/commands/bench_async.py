@@ -0,0 +1,84 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory
+
+from write import views
+from write.dashboard_llm_service import Dashboard_LLM_Service
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.llm_service import LLM_Service
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync (WSGI) and async (ASGI) generation views against "
+        "a local Gemini stub with a fixed upstream latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--latency", type=float, default=0.5,
+                            help="Stub upstream latency in seconds.")
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Sync worker threads (gunicorn workers x threads).")
+        parser.add_argument("--concurrency", type=int, default=400,
+                            help="In-flight requests on the single async event loop.")
+
+    def handle(self, *args, **opts):
+        with GeminiStub(latency=opts["latency"]) as stub:
+            client = self.client = GeminiClient(
+                api_key="stub", base_url=stub.base_url, pool_size=opts["threads"])
+            # No response cache: every request must reach the upstream.
+            views.llm_simple = LLM_Service(client=client, cache=None)
+            views.dashboard_llm = Dashboard_LLM_Service(client=client, cache=None)
+
+            rows = [
+                ("wsgi  generate_text", self.run_sync(views.generate_text, "/api/generate/", opts)),
+                ("asgi agenerate_text", self.run_async(views.agenerate_text, "/api/generate/", opts)),
+                ("wsgi  generate_dashboard", self.run_sync(views.generate_dashboard, "/api/dashboard/", opts)),
+                ("asgi agenerate_dashboard", self.run_async(views.agenerate_dashboard, "/api/dashboard/", opts)),
+            ]
+
+        self.stdout.write(
+            f"{opts['requests']} requests, upstream latency {opts['latency']:.2f}s, "
+            f"{opts['threads']} sync threads vs {opts['concurrency']} async in-flight\n"
+        )
+        self.stdout.write(f"{'path':<26}{'wall s':>9}{'req/s':>10}")
+        for label, elapsed in rows:
+            self.stdout.write(f"{label:<26}{elapsed:>9.2f}{opts['requests'] / elapsed:>10.1f}")
+
+    def params(self, path, i):
+        if path == "/api/generate/":
+            return {"mode": "poem", "text": f"rain on glass {i}", "tone": "soft"}
+        return {"mode": "poems", "name": "rain", "desc": f"quiet evening {i}",
+                "depth": "light", "language": "en"}
+
+    def run_sync(self, view, path, opts):
+        factory = RequestFactory()
+        reqs = [factory.get(path, self.params(path, i)) for i in range(opts["requests"])]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts["threads"]) as pool:
+            list(pool.map(view, reqs))
+        return time.perf_counter() - start
+
+    def run_async(self, view, path, opts):
+        factory = AsyncRequestFactory()
+        reqs = [factory.get(path, self.params(path, i)) for i in range(opts["requests"])]
+
+        async def main():
+            gate = asyncio.Semaphore(opts["concurrency"])
+
+            async def one(req):
+                async with gate:
+                    return await view(req)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(r) for r in reqs))
+            elapsed = time.perf_counter() - start
+            await self.client.aclose()
+            return elapsed
+
+        return asyncio.run(main())
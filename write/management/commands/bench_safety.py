@@ -0,0 +1,82 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from write.safety import BLOCKLIST, SELFHARM, SafetyFilter, safety
+
+
+def naive_scan(text, blocklist, selfharm):
+    # The previous implementation: one substring scan per pattern.
+    t = text.lower()
+    for w in blocklist:
+        if w in t:
+            return BLOCKLIST
+    for s in selfharm:
+        if s in t:
+            return SELFHARM
+    return None
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the compiled safety filter against per-pattern substring scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patterns", type=int, default=5000,
+                            help="Synthetic patterns added to the shipped lists.")
+        parser.add_argument("--chars", type=int, default=20000,
+                            help="Length of each clean input text.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        blocklist = safety.patterns[BLOCKLIST]
+        selfharm = safety.patterns[SELFHARM]
+
+        def word(lo, hi):
+            return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(lo, hi)))
+
+        # Synthetic phrases that never occur in the input, so every scan
+        # has to look at the whole text (the worst case for both).
+        extra = [f"{word(4, 9)}q{word(3, 8)}" for _ in range(opts["patterns"])]
+        big_block = blocklist + extra[: len(extra) // 2]
+        big_self = selfharm + extra[len(extra) // 2:]
+
+        vocab = [word(2, 9).replace("q", "e") for _ in range(500)]
+        text = ""
+        while len(text) < opts["chars"]:
+            text += rng.choice(vocab) + " "
+
+        rows = []
+        for label, blk, slf in (
+            ("shipped lists", blocklist, selfharm),
+            (f"+{opts['patterns']} patterns", big_block, big_self),
+        ):
+            build_start = time.perf_counter()
+            compiled = SafetyFilter(blk, slf)
+            build = time.perf_counter() - build_start
+
+            assert compiled.scan(text) is None and naive_scan(text, blk, slf) is None
+            assert compiled.scan(text + " i want to die") == SELFHARM
+
+            naive = self.timeit(lambda: naive_scan(text, blk, slf), opts["repeat"])
+            fast = self.timeit(lambda: compiled.scan(text), opts["repeat"])
+            rows.append((label, len(blk) + len(slf), build, naive, fast))
+
+        self.stdout.write(f"input: {len(text)} chars, best of {opts['repeat']} runs\n")
+        self.stdout.write(f"{'lists':<20}{'patterns':>10}{'build ms':>10}{'naive ms':>11}{'compiled ms':>13}{'speedup':>9}")
+        for label, count, build, naive, fast in rows:
+            self.stdout.write(
+                f"{label:<20}{count:>10}{build * 1e3:>10.1f}{naive * 1e3:>11.3f}"
+                f"{fast * 1e3:>13.3f}{naive / fast:>8.1f}x"
+            )
+
+    def timeit(self, fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+
+from write import views
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.hashing import hash_password
+from write.llm_service import LLM_Service
+from write.management.commands.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure signups/s and /api/generate/ latency during a signup burst, "
+        "with password hashing inline on request threads vs on the hashing pool. "
+        "Uses a throwaway database and a local Gemini stub."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=48)
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Request threads (gunicorn threads), shared by both kinds of request.")
+        parser.add_argument("--generates", type=int, default=200)
+        parser.add_argument("--latency", type=float, default=0.05,
+                            help="Stub upstream latency in seconds.")
+
+    def handle(self, *args, **opts):
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        for conn in connections.all():
+            conn.close()
+        settings.DATABASES["default"]["NAME"] = path
+        connections["default"].settings_dict["NAME"] = path
+        call_command("migrate", verbosity=0)
+        settings.RATELIMITS = {}
+        settings.PROFILE_DIR = ""
+
+        try:
+            with GeminiStub(latency=opts["latency"]) as stub:
+                client = GeminiClient(api_key="stub", base_url=stub.base_url)
+                views.llm_simple = LLM_Service(client=client, cache=None)
+                rows = [("no signups", None, self.run(opts, 0))]
+                for label, hasher in (("inline", make_password), ("pool", hash_password)):
+                    views.hash_password = hasher
+                    rows.append((label, hasher, self.run(opts, opts["signups"], label)))
+        finally:
+            for conn in connections.all():
+                conn.close()
+            os.remove(path)
+
+        self.stdout.write(
+            f"{opts['threads']} request threads, {opts['signups']} signups, "
+            f"{opts['generates']} generations, hasher {settings.PASSWORD_HASHERS[0].rsplit('.', 1)[-1]}, "
+            f"pool of {settings.HASHING_WORKERS}\n"
+        )
+        self.stdout.write(f"{'hashing':<12}{'signups/s':>10}{'gen p50 ms':>12}{'gen p95 ms':>12}{'gen p99 ms':>12}")
+        for label, _, row in rows:
+            rate = f"{row['signup_rate']:.1f}" if row["signup_rate"] else "-"
+            self.stdout.write(
+                f"{label:<12}{rate:>10}"
+                + "".join(f"{percentile(row['latencies'], p) * 1e3:>12.1f}" for p in (50, 95, 99))
+            )
+
+    def run(self, opts, signups, tag=""):
+        # One shared pool of request threads, like a gthread worker:
+        # signups and generations interleave and compete for it.
+        local = threading.local()
+        latencies = []
+
+        def client():
+            if not hasattr(local, "client"):
+                local.client = Client(HTTP_HOST="localhost")
+            return local.client
+
+        def generate(i):
+            start = time.perf_counter()
+            client().get("/api/generate/", {"mode": "poem", "text": f"rain {tag} {i}"})
+            latencies.append(time.perf_counter() - start)
+
+        def signup(i):
+            name = f"bench-{tag}-{i}"
+            res = Client(HTTP_HOST="localhost").post("/api/signup/", {"username": name, "email": f"{name}@example.com",
+                                                 "password": "correct horse battery"})
+            assert res.status_code == 200, res.content
+
+        jobs = [(generate, i) for i in range(opts["generates"])]
+        # Spread the burst through the generation traffic.
+        step = max(1, len(jobs) // max(signups, 1))
+        for i in range(signups):
+            jobs.insert(min(len(jobs), i * (step + 1)), (signup, i))
+
+        signup_done = []
+
+        def job(fn, i):
+            fn(i)
+            if fn is signup:
+                signup_done.append(time.perf_counter())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts["threads"]) as pool:
+            list(pool.map(lambda j: job(*j), jobs))
+        for conn in connections.all():
+            conn.close()
+
+        latencies.sort()
+        rate = signups / (max(signup_done) - start) if signup_done else None
+        return {"latencies": latencies, "signup_rate": rate}
@@ -0,0 +1,55 @@
+import glob
+import os
+
+import rcssmin
+import rjsmin
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SOURCE_DIR = settings.BASE_DIR / "assets"
+OUTPUT_DIR = settings.BASE_DIR / "static"
+
+MINIFIERS = {
+    "css": rcssmin.cssmin,
+    "js": rjsmin.jsmin,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Minify assets/css/*.css and assets/js/*.js into static/css/*.min.css "
+        "and static/js/*.min.js. collectstatic then fingerprints and compresses them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report bundles that are out of date (exit 1 if any).")
+
+    def handle(self, *args, **opts):
+        stale = []
+        for kind, minify in MINIFIERS.items():
+            for source in sorted(glob.glob(str(SOURCE_DIR / kind / f"*.{kind}"))):
+                name = os.path.splitext(os.path.basename(source))[0]
+                target = OUTPUT_DIR / kind / f"{name}.min.{kind}"
+                with open(source, encoding="utf-8") as fh:
+                    text = fh.read()
+                built = (
+                    f"/* Built from assets/{kind}/{name}.{kind} by manage.py build_assets. */\n"
+                    + minify(text).strip() + "\n"
+                )
+                current = target.read_text(encoding="utf-8") if target.exists() else None
+                if current == built:
+                    continue
+                stale.append(target)
+                if opts["check"]:
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(built, encoding="utf-8")
+                self.stdout.write(f"{target.relative_to(settings.BASE_DIR)}: "
+                                  f"{len(text.encode())} -> {len(built.encode())} bytes")
+
+        if opts["check"] and stale:
+            raise CommandError("Out of date: " + ", ".join(
+                str(t.relative_to(settings.BASE_DIR)) for t in stale))
+        if not stale:
+            self.stdout.write("Bundles are up to date.")
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions from the database and expired entries from "
+        "the file-based caches. Meant for cron, off the request path."
+    )
+
+    def handle(self, *args, **opts):
+        if settings.SESSION_ENGINE.endswith((".db", ".cached_db")):
+            call_command("clearsessions")
+            self.stdout.write("Expired database sessions cleared.")
+
+        for alias in settings.CACHES:
+            cache = caches[alias]
+            if not isinstance(cache, FileBasedCache):
+                continue
+            files = cache._list_cache_files()
+            removed = 0
+            for path in files:
+                try:
+                    with open(path, "rb") as f:
+                        # _is_expired() deletes the file if its entry has expired.
+                        removed += cache._is_expired(f)
+                except FileNotFoundError:  # removed by a worker meanwhile
+                    pass
+            self.stdout.write(f"{alias}: removed {removed} of {len(files)} cache files.")
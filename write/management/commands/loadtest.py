@@ -0,0 +1,140 @@
+import asyncio
+import math
+import time
+from collections import Counter
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from write.jobs import FINISHED
+
+ENDPOINTS = {
+    "generate": "/api/generate/",
+    "dashboard": "/api/dashboard/",
+}
+# Job mode answers 202 with a job; its result is long-polled this many
+# seconds at a time (the server caps it at HEARTNOTE_JOB_WAIT).
+JOB_POLL_WAIT = 20
+
+
+def percentile(ordered, p):
+    # Nearest-rank percentile of an already sorted list.
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive /api/generate/ and /api/dashboard/ of a running server at "
+        "fixed concurrency levels and report latency percentiles and req/s. "
+        "Run the server against the stub (runstub + GEMINI_API_BASE) and "
+        "with HEARTNOTE_RATELIMIT=0, or most requests measure the limiter. "
+        "Under HEARTNOTE_JOBS=1 each queued job is followed to its result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--endpoints", default="generate,dashboard",
+                            help="Comma-separated: generate, dashboard.")
+        parser.add_argument("--concurrency", default="1,8,32",
+                            help="Comma-separated in-flight request levels.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per endpoint and concurrency level.")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--timeout", type=float, default=60.0)
+        parser.add_argument("--repeat-inputs", action="store_true",
+                            help="Send identical inputs (measures the cache and "
+                                 "single-flight instead of the upstream).")
+
+    def handle(self, *args, **opts):
+        try:
+            endpoints = [(name, ENDPOINTS[name.strip()]) for name in opts["endpoints"].split(",")]
+            levels = [int(c) for c in opts["concurrency"].split(",")]
+        except (KeyError, ValueError) as e:
+            raise CommandError(f"Bad --endpoints or --concurrency: {e}")
+
+        self.stdout.write(
+            f"{'endpoint':<11}{'conc':>6}{'ok':>7}{'fallbk':>8}{'429':>6}{'err':>6}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'req/s':>9}"
+        )
+        run = 0
+        for name, path in endpoints:
+            for level in levels:
+                run += 1
+                row = asyncio.run(self.run_level(path, level, run, opts))
+                self.stdout.write(self.format_row(name, level, row))
+
+    async def run_level(self, path, concurrency, run, opts):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=opts["url"], timeout=opts["timeout"],
+                                     limits=limits) as client:
+            for i in range(opts["warmup"]):
+                await self.one(client, path, self.params(path, f"warmup-{run}-{i}", opts))
+
+            queue = asyncio.Queue()
+            for i in range(opts["requests"]):
+                queue.put_nowait(self.params(path, f"{run}-{i}", opts))
+            latencies = []
+            outcomes = Counter()
+
+            async def worker():
+                while not queue.empty():
+                    params = queue.get_nowait()
+                    start = time.perf_counter()
+                    outcome = await self.one(client, path, params)
+                    latencies.append(time.perf_counter() - start)
+                    outcomes[outcome] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {"latencies": latencies, "outcomes": outcomes, "elapsed": elapsed}
+
+    async def one(self, client, path, params):
+        try:
+            res = await client.get(path, params=params)
+        except httpx.HTTPError:
+            return "error"
+        if res.status_code == 202:
+            try:
+                res = await self.job_result(client, res.json()["result"])
+            except (httpx.HTTPError, ValueError, KeyError, TypeError, AttributeError):
+                return "error"
+        if res.status_code == 429:
+            return "429"
+        if res.status_code != 200:
+            return "error"
+        try:
+            body = res.json().get("response")
+        except (ValueError, AttributeError):
+            return "error"
+        if isinstance(body, dict):
+            return "fallback" if body.get("is_fallback") else "ok"
+        return "fallback" if str(body).startswith("⚠️") else "ok"
+
+    async def job_result(self, client, url):
+        # Latency then covers queueing and generation, not just the 202.
+        while True:
+            res = await client.get(url, params={"wait": JOB_POLL_WAIT})
+            if res.status_code != 200 or res.json().get("status") in FINISHED:
+                return res
+
+    def params(self, path, tag, opts):
+        # Unique inputs by default so every request reaches the upstream.
+        salt = "" if opts["repeat_inputs"] else f" {tag}"
+        if path == ENDPOINTS["generate"]:
+            return {"mode": "poem", "text": f"rain on glass{salt}", "tone": "soft"}
+        return {"mode": "poems", "name": "rain", "desc": f"quiet evening{salt}",
+                "depth": "light", "language": "en"}
+
+    def format_row(self, name, level, row):
+        lat, out = row["latencies"], row["outcomes"]
+        ms = [percentile(lat, p) * 1e3 for p in (50, 95, 99)] + [(lat[-1] if lat else 0) * 1e3]
+        rps = len(lat) / row["elapsed"] if row["elapsed"] else 0.0
+        return (
+            f"{name:<11}{level:>6}{out['ok']:>7}{out['fallback']:>8}{out['429']:>6}{out['error']:>6}"
+            + "".join(f"{v:>9.1f}" for v in ms)
+            + f"{rps:>9.1f}"
+        )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from write.profiling import HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed header value that makes the server profile a request."
+
+    def handle(self, *args, **opts):
+        if not settings.PROFILE_SECRET:
+            raise CommandError("Set HEARTNOTE_PROFILE_SECRET (the same value as the server's).")
+        token = make_token()
+        self.stdout.write(f"{HEADER}: {token}")
+        self.stderr.write(
+            f"Valid for {settings.PROFILE_TOKEN_MAX_AGE}s, e.g.\n"
+            f"  curl -H '{HEADER}: {token}' '<url>'\n"
+            f"The response's {HEADER}-File header names the dump in {settings.PROFILE_DIR}."
+        )
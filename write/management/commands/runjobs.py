@@ -0,0 +1,33 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from write.jobs import JOB_POLL, JOB_WORKERS, JobWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued generation jobs (HEARTNOTE_JOBS=1) with at most "
+        "--concurrency Gemini calls at once. Run one or more next to the web "
+        "processes; they share the queue through the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=JOB_WORKERS,
+                            help="Jobs run at once by this process.")
+        parser.add_argument("--poll", type=float, default=JOB_POLL,
+                            help="Seconds between looks at an empty queue.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty.")
+
+    def handle(self, *args, **opts):
+        worker = JobWorker(concurrency=opts["concurrency"], poll=opts["poll"])
+        # SIGTERM (deploys) and CONTROL-C stop taking new jobs and let
+        # the running ones finish.
+        signal.signal(signal.SIGTERM, lambda *a: worker.stop())
+        self.stdout.write(f"Running jobs, {opts['concurrency']} at a time. Quit with CONTROL-C.")
+        try:
+            worker.serve(once=opts["once"])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write("Job worker stopped.")
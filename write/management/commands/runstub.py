@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from write.gemini_stub import DISTRIBUTIONS, GeminiStub
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the local Gemini stub in the foreground. Start the app with "
+        "GEMINI_API_BASE set to the printed URL to keep all traffic local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.5,
+                            help="Mean (median for lognormal) upstream latency in seconds.")
+        parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed")
+        parser.add_argument("--spread", type=float, default=0.0,
+                            help="Half-width (uniform), std dev (normal) or sigma (lognormal).")
+        parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="Fraction of requests answered with a 503.")
+        parser.add_argument("--burst-every", type=float, default=0.0,
+                            help="Seconds between 429 bursts (0 disables them).")
+        parser.add_argument("--burst-length", type=float, default=0.0,
+                            help="Seconds each 429 burst lasts.")
+        parser.add_argument("--retry-after", type=int, default=1,
+                            help="Retry-After sent with every 429.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--cache-min-tokens", type=int, default=0,
+                            help="Refuse cachedContents smaller than this (Gemini: 1024+).")
+        parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                            help="Latency for one model instead of --latency (repeatable).")
+
+    def handle(self, *args, **opts):
+        model_latency = {}
+        for item in opts["model_latency"]:
+            model, _, seconds = item.partition("=")
+            try:
+                model_latency[model] = float(seconds)
+            except ValueError:
+                raise CommandError(f"--model-latency expects MODEL=SECONDS, not {item!r}")
+        stub = GeminiStub(
+            host=opts["host"], port=opts["port"], latency=opts["latency"],
+            distribution=opts["distribution"], spread=opts["spread"],
+            error_rate=opts["error_rate"], burst_every=opts["burst_every"],
+            burst_length=opts["burst_length"], retry_after=opts["retry_after"],
+            seed=opts["seed"], cache_min_tokens=opts["cache_min_tokens"],
+            model_latency=model_latency,
+        ).start()
+        self.stdout.write(f"Gemini stub listening; export GEMINI_API_BASE={stub.base_url}")
+        self.stdout.write("Quit with CONTROL-C.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
+            self.stdout.write(
+                f"\n{stub.requests} requests, {stub.errors} errors, {stub.throttled} throttled"
+            )
+            for model, count in sorted(stub.by_model.items()):
+                self.stdout.write(f"  {model}: {count}")
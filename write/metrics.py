@@ -0,0 +1,203 @@
+import os
+import time
+
+# PROMETHEUS_MULTIPROC_DIR is set (write/metrics_dir.py) by the startup
+# hooks, before this module is first imported.
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from .resilience import status_of
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+
+
+
+# -----------------------------------------------------
+# METRICS
+# Each worker process writes its samples to mmap'd files in METRICS_DIR;
+# /metrics sums them, so counts cover every process (and, under
+# gunicorn, survive worker restarts). Recording is a dict lookup plus a
+# float add.
+# -----------------------------------------------------
+REQUEST_LATENCY = Histogram(
+    "heartnote_request_duration_seconds",
+    "Time to serve a request, until the last byte for streams.",
+    ["endpoint", "mode"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSES = Counter(
+    "heartnote_responses_total",
+    "Responses by endpoint and HTTP status.",
+    ["endpoint", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "heartnote_upstream_duration_seconds",
+    "Time for one Gemini call attempt (until headers for streams).",
+    ["model", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "heartnote_upstream_responses_total",
+    "Gemini call attempts by HTTP status, or by error kind when no response arrived.",
+    ["model", "method", "status"],
+)
+CACHE_LOOKUPS = Counter(
+    "heartnote_response_cache_lookups_total",
+    "Response cache lookups by the tier that answered (local, shared) or miss.",
+    ["result"],
+)
+SAFETY_BLOCKS = Counter(
+    "heartnote_safety_blocks_total",
+    "Inputs rejected by the safety filter.",
+    ["service", "category"],
+)
+FALLBACKS = Counter(
+    "heartnote_fallbacks_total",
+    "Fallback responses served instead of generated text.",
+    ["service", "reason"],
+)
+RATE_LIMITED = Counter(
+    "heartnote_rate_limited_total",
+    "Requests rejected with 429 by the rate limiter.",
+    ["endpoint"],
+)
+TOKENS = Counter(
+    "heartnote_tokens_total",
+    "Tokens Gemini reported in usageMetadata, by kind (prompt, output, thoughts, cached).",
+    ["service", "mode", "kind"],
+)
+TRUNCATED = Counter(
+    "heartnote_truncated_total",
+    "Generations that stopped at maxOutputTokens (budget too tight).",
+    ["service", "mode"],
+)
+INPUT_FITTED = Counter(
+    "heartnote_input_fitted_total",
+    "Oversized inputs trimmed or refused before calling Gemini.",
+    ["service", "action"],
+)
+# Gauges: "livesum" adds up the live worker processes' values.
+UPSTREAM_ACTIVE = Gauge(
+    "heartnote_upstream_active",
+    "Gemini calls holding a scheduler slot.",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_QUEUED = Gauge(
+    "heartnote_upstream_queued",
+    "Requests waiting for a scheduler slot.",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "heartnote_upstream_queue_wait_seconds",
+    "Time a request waited for a scheduler slot before calling Gemini.",
+    ["service"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_SHED = Counter(
+    "heartnote_upstream_shed_total",
+    "Requests given the fallback because their deadline would pass before a slot came.",
+    ["service", "reason"],
+)
+UPSTREAM_ROUTED = Counter(
+    "heartnote_upstream_routed_total",
+    "Gemini calls by the API key and model the router sent them to.",
+    ["key", "model"],
+)
+UPSTREAM_FAILOVERS = Counter(
+    "heartnote_upstream_failovers_total",
+    "Gemini calls moved to another key or model, by the status that moved them.",
+    ["status"],
+)
+JOBS = Counter(
+    "heartnote_jobs_total",
+    "Generation jobs by outcome (queued, rejected, done, failed, retried).",
+    ["kind", "outcome"],
+)
+JOB_WAIT = Histogram(
+    "heartnote_job_wait_seconds",
+    "Time a generation job spent queued before a worker took it.",
+    ["kind"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+
+
+# -----------------------------------------------------
+# RECORDING HELPERS
+# -----------------------------------------------------
+def upstream_status(error):
+    if error is None:
+        return "200"
+    status = status_of(error)
+    if status is not None:
+        return str(status)
+    name = type(error).__name__.lower()
+    if "timeout" in name:
+        return "timeout"
+    if "connect" in name:
+        return "connect_error"
+    return "error"
+
+
+def observe_upstream(model, method, started, error=None):
+    UPSTREAM_LATENCY.labels(model, method).observe(time.perf_counter() - started)
+    UPSTREAM_RESPONSES.labels(model, method, upstream_status(error)).inc()
+
+
+def safety_block(service, category):
+    SAFETY_BLOCKS.labels(service, category).inc()
+
+
+def fallback(service, reason):
+    FALLBACKS.labels(service, reason).inc()
+
+
+USAGE_FIELDS = (
+    ("prompt", "promptTokenCount"),
+    ("output", "candidatesTokenCount"),
+    ("thoughts", "thoughtsTokenCount"),
+    ("cached", "cachedContentTokenCount"),
+)
+
+
+def record_usage(service, mode, data):
+    # data is a GenerateContentResponse, or the last event of a stream
+    # (stream events carry running totals).
+    if not data:
+        return
+    usage = data.get("usageMetadata") or {}
+    for kind, field in USAGE_FIELDS:
+        count = usage.get(field)
+        if count:
+            TOKENS.labels(service, mode, kind).inc(count)
+    finish = (data.get("candidates") or [{}])[0].get("finishReason")
+    if finish == "MAX_TOKENS":
+        TRUNCATED.labels(service, mode).inc()
+
+
+def input_fitted(service, action):
+    INPUT_FITTED.labels(service, action).inc()
+
+
+
+
+# -----------------------------------------------------
+# EXPOSITION
+# -----------------------------------------------------
+def render():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
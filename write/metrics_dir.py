@@ -0,0 +1,62 @@
+import os
+import re
+import shutil
+
+# Written by gunicorn.conf.py: that master clears the directory when it
+# starts and marks its own workers dead, so no other process prunes it.
+MASTER_FILE = "master.pid"
+SAMPLE_FILE = re.compile(r"_(\d+)\.db$")
+
+
+
+
+# -----------------------------------------------------
+# PROMETHEUS MULTIPROCESS DIRECTORY
+# Set up by the process's startup hook (WriteConfig.ready(), or
+# gunicorn's on_starting) before prometheus_client is first imported:
+# it picks its value store on import. Elsewhere (uvicorn, runjobs,
+# management commands) nothing clears the directory, so each process
+# deletes the sample files of processes that are no longer running;
+# their counts drop out of /metrics, which Prometheus reads as a counter
+# reset.
+# -----------------------------------------------------
+def prepare(path, clean=False):
+    if clean:
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    if not clean and not managed(path):
+        prune(path)
+
+
+def claim(path):
+    with open(os.path.join(path, MASTER_FILE), "w") as fh:
+        fh.write(str(os.getpid()))
+
+
+def managed(path):
+    try:
+        with open(os.path.join(path, MASTER_FILE)) as fh:
+            return alive(int(fh.read()))
+    except (OSError, ValueError):
+        return False
+
+
+def prune(path):
+    for name in os.listdir(path):
+        match = SAMPLE_FILE.search(name)
+        if match and not alive(int(match.group(1))):
+            try:
+                os.unlink(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,371 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from .dashboard_llm_service import DASHBOARD_TEMPLATES
+from .llm_service import MODES
+from .metrics import RATE_LIMITED, REQUEST_LATENCY, RESPONSES
+from .ratelimit import LocalBucketStore, SQLiteBucketStore, find_limit
+from . import profiling, scheduler, timing
+
+TOO_MANY = "⚠️ Too many requests. Please wait a moment and try again."
+
+timing_log = logging.getLogger("write.timing")
+
+
+def endpoint_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Not routed yet, or rejected before routing (e.g. rate limited).
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+    return match.url_name or match.view_name
+
+
+def client_id(request, proxy_hops=0):
+    user_id = request.session.get("user_id") if hasattr(request, "session") else None
+    return identity(request, user_id, proxy_hops)
+
+
+async def aclient_id(request, proxy_hops=0):
+    # A session not in the cache (or a stale cookie) is looked up in the
+    # database, which can't run on the event loop.
+    user_id = await request.session.aget("user_id") if hasattr(request, "session") else None
+    return identity(request, user_id, proxy_hops)
+
+
+def identity(request, user_id, proxy_hops):
+    if user_id:
+        return f"u:{user_id}"
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    hops = [h.strip() for h in forwarded.split(",") if h.strip()]
+    if proxy_hops and len(hops) >= proxy_hops:
+        # Count from the right: only our own proxies' entries are trusted.
+        return f"ip:{hops[-proxy_hops]}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def on_stream_end(response, callback):
+    # Streaming bodies are sent after the middleware returns; run the
+    # callback once the last chunk is out (or the client goes away).
+    content = response.streaming_content
+    if response.is_async:
+        async def wrapped():
+            try:
+                async for chunk in content:
+                    yield chunk
+            finally:
+                callback()
+    else:
+        def wrapped():
+            try:
+                yield from content
+            finally:
+                callback()
+    response.streaming_content = wrapped()
+
+
+
+
+# -----------------------------------------------------
+# RATE LIMITING
+# Token buckets keyed by session user (or client IP) per endpoint and
+# mode. Runs before the view, so rejected requests never reach Gemini.
+# -----------------------------------------------------
+class RateLimitMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = getattr(settings, "RATELIMITS", {})
+        path = getattr(settings, "RATELIMIT_DB", "")
+        self.store = SQLiteBucketStore(path) if path else LocalBucketStore()
+        self.proxy_hops = getattr(settings, "RATELIMIT_PROXY_HOPS", 0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        limit = find_limit(self.limits, request.path, request.GET.get("mode"))
+        if limit is None:
+            return self.get_response(request)
+        cost = self.cost(request)
+        allowed, tokens = self.take(request, limit, cost)
+        if not allowed:
+            return self.reject(request, limit, tokens, cost)
+        return self.finish(self.get_response(request), limit, tokens)
+
+    async def __acall__(self, request):
+        limit = find_limit(self.limits, request.path, request.GET.get("mode"))
+        if limit is None:
+            return await self.get_response(request)
+        cost = self.cost(request)
+        # SQLite may wait on a busy lock; keep that off the event loop.
+        allowed, tokens = await sync_to_async(self.take, thread_sensitive=False)(
+            request, limit, cost)
+        if not allowed:
+            return self.reject(request, limit, tokens, cost)
+        return self.finish(await self.get_response(request), limit, tokens)
+
+    # -------------------------------------------------
+    # HELPERS
+    # -------------------------------------------------
+    def cost(self, request):
+        # A batch request spends one token per requested mode.
+        modes = {m.strip().lower() for m in request.GET.get("modes", "").split(",")}
+        return max(1, len(modes - {""}))
+
+    def take(self, request, limit, cost):
+        try:
+            return self.store.take(self.bucket_key(request, limit), limit.burst, limit.rate, cost)
+        except Exception:
+            # Fail open: a broken limiter store must not take the API down.
+            return True, limit.burst
+
+    def bucket_key(self, request, limit):
+        return f"{limit.endpoint}|{limit.mode}|{client_id(request, self.proxy_hops)}"
+
+    def reject(self, request, limit, tokens, cost):
+        if limit.endpoint.startswith("/api/dashboard/"):
+            # Same shape the dashboard service uses for an upstream 429.
+            body = {"response": {"response": TOO_MANY, "blocked": True, "is_fallback": False}}
+        else:
+            body = {"response": TOO_MANY}
+        RATE_LIMITED.labels(limit.endpoint).inc()
+        response = JsonResponse(body, status=429)
+        response["Retry-After"] = str(limit.retry_after(tokens, cost))
+        return self.finish(response, limit, tokens)
+
+    def finish(self, response, limit, tokens):
+        for name, value in limit.headers(tokens).items():
+            response[name] = value
+        return response
+
+
+
+
+# -----------------------------------------------------
+# UPSTREAM CLIENT
+# Tells the fair-share scheduler (write/scheduler.py) whose request is
+# running, by the same session-or-IP identity the rate limiter uses.
+# -----------------------------------------------------
+class UpstreamClientMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.proxy_hops = getattr(settings, "RATELIMIT_PROXY_HOPS", 0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with scheduler.acting_for(client_id(request, self.proxy_hops)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with scheduler.acting_for(await aclient_id(request, self.proxy_hops)):
+            return await self.get_response(request)
+
+
+
+
+# -----------------------------------------------------
+# METRICS
+# Times every routed request by URL name and mode (write/metrics.py).
+# Streaming responses are timed until their last chunk is sent.
+# -----------------------------------------------------
+KNOWN_MODES = frozenset(MODES) | frozenset(DASHBOARD_TEMPLATES)
+
+
+class MetricsMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        return self.observe(request, self.get_response(request), started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        return self.observe(request, await self.get_response(request), started)
+
+    def observe(self, request, response, started):
+        endpoint = self.endpoint(request)
+        if endpoint is None:
+            return response
+        RESPONSES.labels(endpoint, str(response.status_code)).inc()
+        histogram = REQUEST_LATENCY.labels(endpoint, self.mode(request))
+
+        def done():
+            histogram.observe(time.perf_counter() - started)
+
+        if response.streaming:
+            on_stream_end(response, done)
+        else:
+            done()
+        return response
+
+    def endpoint(self, request):
+        # URL names keep the label set small; unrouted paths (404s) are skipped.
+        return endpoint_name(request)
+
+    def mode(self, request):
+        if "modes" in request.GET:
+            return "batch"
+        mode = request.GET.get("mode", "").lower().strip()
+        if not mode:
+            return ""
+        return mode if mode in KNOWN_MODES else "other"
+
+
+
+
+# -----------------------------------------------------
+# SERVER-TIMING
+# Collects the request's phase spans (write/timing.py) into a
+# Server-Timing header, and with TIMING_LOG one JSON line per request.
+# A stream's header can only carry the phases before its first byte;
+# its log line is written when the stream ends and has them all.
+# -----------------------------------------------------
+class ServerTimingMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.log = getattr(settings, "TIMING_LOG", False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        response["Server-Timing"] = timings.header()
+        if self.log:
+            if response.streaming:
+                on_stream_end(response, lambda: self.write_log(request, response, timings))
+            else:
+                self.write_log(request, response, timings)
+        return response
+
+    def write_log(self, request, response, timings):
+        timing_log.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "mode": request.GET.get("mode") or request.GET.get("modes", ""),
+            "status": response.status_code,
+            "streamed": response.streaming,
+            "ms": timings.as_ms(),
+        }))
+
+
+
+
+# -----------------------------------------------------
+# PROFILING
+# Samples PROFILE_SAMPLE_RATE of requests, plus any request carrying a
+# fresh signed X-Heartnote-Profile header (manage.py profile_token), and
+# writes collapsed stacks to PROFILE_DIR (write/profiling.py). Merge
+# them with manage.py aggregate_profiles.
+# -----------------------------------------------------
+class ProfilingMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0.0)
+        self.directory = getattr(settings, "PROFILE_DIR", "")
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, requested = self.begin(request)
+        if profile is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.end(profile)
+            raise
+        return self.finish(response, profile, requested)
+
+    async def __acall__(self, request):
+        profile, requested = self.begin(request)
+        if profile is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self.end(profile)
+            raise
+        return self.finish(response, profile, requested)
+
+    def begin(self, request):
+        if not self.directory:
+            return None, False
+        requested = profiling.has_valid_token(request)
+        if not requested and not (self.rate and random.random() < self.rate):
+            return None, False
+        label = endpoint_name(request) or "unrouted"
+        return profiling.sampler.start(label), requested
+
+    def finish(self, response, profile, requested):
+        if requested:
+            # Tells whoever asked which dump to look for.
+            response[profiling.HEADER + "-File"] = profile.name
+        if response.streaming:
+            on_stream_end(response, lambda: self.end(profile))
+        else:
+            self.end(profile)
+        return response
+
+    def end(self, profile):
+        profiling.sampler.stop(profile)
+        try:
+            profiling.write_dump(profile, self.directory)
+        except OSError:
+            pass
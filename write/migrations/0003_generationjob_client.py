@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('write', '0002_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='client',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 class HeartUser(models.Model):
@@ -9,3 +11,31 @@ class HeartUser(models.Model):
     def __str__(self):
         return self.username
 
+
+# Queued generation requests (settings.GENERATION_JOBS, write/jobs.py).
+# The id is random: knowing it is what lets a client read the result.
+class GenerationJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20)
+    params = models.JSONField()
+    # Fair-share client (scheduler.current_client) that queued the job.
+    client = models.CharField(max_length=100, blank=True, default="")
+    status = models.CharField(max_length=10, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created"], name="write_job_status_created"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
@@ -0,0 +1,110 @@
+import hashlib
+import json
+from fnmatch import fnmatch
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+_pages = {}
+
+
+
+
+# -----------------------------------------------------
+# PRE-RENDERED PAGES
+# home, aiwrite and dashboard carry no per-user data: the only session
+# state they depend on (logged in or not) is decided by the views'
+# redirects before a page is served. So each template is rendered once
+# per process (with no request context, so nothing per-user can leak in)
+# and kept in memory with a strong ETag. Browsers revalidate on every
+# visit (no-cache) and get a bodyless 304 while the deploy is unchanged.
+#
+# With PAGE_CACHE off (development) the page is re-rendered on every hit
+# so template edits show up, but still gets its ETag.
+# -----------------------------------------------------
+class Page:
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def cached(key, build):
+    page = _pages.get(key)
+    if page is None:
+        page = Page(build())
+        if settings.PAGE_CACHE:
+            _pages[key] = page
+    return page
+
+
+def serve(request, template_name):
+    page = cached(template_name, lambda: render_to_string(template_name).encode())
+    return respond(request, page)
+
+
+def respond(request, page, content_type=None):
+    response = get_conditional_response(request, etag=page.etag)
+    if response is None:
+        response = HttpResponse(page.body, content_type=content_type)
+    response["ETag"] = page.etag
+    # private: whether a page or a redirect comes back depends on the
+    # session cookie, so shared caches must not store it.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+
+
+# -----------------------------------------------------
+# SERVICE WORKER
+# Served from the site root so its scope covers every page (a worker
+# under /static/pwa/ only ever controlled /static/pwa/). The source is
+# assets/js/service-worker.js, minified by build_assets; this prefixes
+# it with the fingerprinted URLs to precache, resolved through the
+# collectstatic manifest, and a version hashed from their contents. Any
+# deploy that changes an asset changes the version, so browsers install
+# the new worker, which evicts the old caches.
+# -----------------------------------------------------
+WORKER_SOURCE = "js/service-worker.min.js"
+PRECACHE = ("css/*.css", "js/*.js", "icons/*", "pwa/manifest.json")
+PRECACHE_EXCLUDE = ("js/service-worker*",)
+WORKER_PAGES = ("home", "aiwrite", "dashboard")
+
+
+def precache_names():
+    names = set()
+    for finder in finders.get_finders():
+        for path, storage in finder.list([]):
+            name = path.replace("\\", "/")
+            if any(fnmatch(name, p) for p in PRECACHE) and not any(
+                    fnmatch(name, p) for p in PRECACHE_EXCLUDE):
+                names.add(name)
+    return sorted(names)
+
+
+def build_service_worker():
+    with open(finders.find(WORKER_SOURCE), "rb") as fh:
+        source = fh.read()
+    version = hashlib.sha256(source)
+    names = precache_names()
+    for name in names:
+        with open(finders.find(name), "rb") as fh:
+            version.update(fh.read())
+    config = {
+        "version": version.hexdigest()[:12],
+        "static": [staticfiles_storage.url(name) for name in names],
+        "pages": [reverse(name) for name in WORKER_PAGES],
+        "staticPrefix": settings.STATIC_URL,
+    }
+    return b"const CONFIG = " + json.dumps(config).encode() + b";\n" + source
+
+
+def service_worker(request):
+    page = cached("service-worker.js", build_service_worker)
+    return respond(request, page, "text/javascript; charset=utf-8")
@@ -0,0 +1,175 @@
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+HEADER = "X-Heartnote-Profile"
+SALT = "heartnote.profile"
+
+
+
+
+# -----------------------------------------------------
+# SAMPLING PROFILER
+# One daemon thread wakes every PROFILE_INTERVAL seconds while any
+# request is being profiled and records the stack of each profiled
+# request's thread. Unprofiled requests pay nothing; profiled ones pay
+# for one sys._current_frames() per tick, not a trace hook per call.
+#
+# Under ASGI every coroutine shares the event loop thread, so only one
+# request per thread is profiled at a time and its samples include
+# whatever else the loop was running.
+# -----------------------------------------------------
+class Profile:
+
+    def __init__(self, thread_id, label):
+        self.thread_id = thread_id
+        self.started = time.time()
+        self.stacks = Counter()
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        self.name = f"{int(self.started * 1000)}-{os.getpid()}-{thread_id % 100000}-{safe}.folded"
+
+
+class Sampler:
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self, label):
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id in self.active:
+                return None
+            profile = self.active[thread_id] = Profile(thread_id, label)
+            # A forked worker inherits the object but not the thread.
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self.run, name="heartnote-profiler", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+        self._wake.set()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            if self.active.get(profile.thread_id) is profile:
+                del self.active[profile.thread_id]
+            if not self.active:
+                self._wake.clear()
+        return profile
+
+    def run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self.active.values())
+            if not profiles:
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[self.fold(frame)] += 1
+
+    def fold(self, frame):
+        names = []
+        while frame is not None:
+            names.append(self.label(frame.f_code))
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def label(self, code):
+        name = self._labels.get(code)
+        if name is None:
+            # co_qualname (3.11+) tells the middlewares' __call__s apart.
+            func = getattr(code, "co_qualname", code.co_name)
+            name = self._labels[code] = f"{short_path(code.co_filename)}:{func}"
+        return name
+
+
+def short_path(filename):
+    # Project files relative to the repo, libraries relative to their
+    # install directory: "write/views.py", "django/core/handlers/base.py".
+    for prefix in path_prefixes():
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+_prefixes = None
+
+
+def path_prefixes():
+    global _prefixes
+    if _prefixes is None:
+        paths = {str(settings.BASE_DIR)}
+        paths.update(sysconfig.get_paths()[key] for key in ("purelib", "platlib", "stdlib", "platstdlib"))
+        # Longest first, so a virtualenv inside the repo wins over the repo.
+        _prefixes = [p + os.sep for p in sorted(paths, key=len, reverse=True)]
+    return _prefixes
+
+
+
+
+# -----------------------------------------------------
+# WHICH REQUESTS, AND WHERE THE DUMPS GO
+# -----------------------------------------------------
+# Tokens are signed with PROFILE_SECRET, not SECRET_KEY; without one the
+# header is ignored and only PROFILE_SAMPLE_RATE picks requests.
+def signer():
+    return signing.TimestampSigner(key=settings.PROFILE_SECRET, salt=SALT)
+
+
+def make_token():
+    return signer().sign("profile")
+
+
+def has_valid_token(request):
+    value = request.headers.get(HEADER)
+    if not value or not settings.PROFILE_SECRET:
+        return False
+    try:
+        signer().unsign(value, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def write_dump(profile, directory, keep=None):
+    # Collapsed-stack format ("frame;frame;frame count"), as read by
+    # flamegraph.pl, speedscope and inferno. Requests shorter than one
+    # sampling interval have no samples and leave no file.
+    if not profile.stacks:
+        return
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, "." + profile.name)
+    with open(tmp, "w", encoding="utf-8") as fh:
+        for stack, count in profile.stacks.most_common():
+            fh.write(f"{stack} {count}\n")
+    os.replace(tmp, os.path.join(directory, profile.name))
+    prune_dumps(directory, settings.PROFILE_KEEP if keep is None else keep)
+
+
+def prune_dumps(directory, keep):
+    # Names start with the time in milliseconds, so they sort oldest first.
+    dumps = sorted(n for n in os.listdir(directory) if n.endswith(".folded") and not n.startswith("."))
+    for name in dumps[:max(0, len(dumps) - keep)]:
+        try:
+            os.unlink(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+sampler = Sampler(getattr(settings, "PROFILE_INTERVAL", 0.005))
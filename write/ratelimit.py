@@ -0,0 +1,142 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+
+
+# -----------------------------------------------------
+# TOKEN BUCKET STORE (SQLite)
+# One small SQLite file shared by every gunicorn worker on the host.
+# Each take() is a single BEGIN IMMEDIATE transaction, so concurrent
+# workers never double-spend a bucket.
+# -----------------------------------------------------
+class SQLiteBucketStore:
+
+    PRUNE_EVERY = 1000
+    PRUNE_AGE = 24 * 3600
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, cost=1, now=None):
+        # rate is tokens per second. Returns (allowed, tokens_left).
+        now = time.time() if now is None else now
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = capacity if row is None else min(
+                capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._calls += 1
+        if self._calls % self.PRUNE_EVERY == 0:
+            self.prune(now)
+        return allowed, tokens
+
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        self.conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.PRUNE_AGE,))
+
+
+class LocalBucketStore:
+
+    # Per-process fallback (tests, single-worker dev server).
+    def __init__(self):
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+        return allowed, tokens
+
+
+
+
+# -----------------------------------------------------
+# LIMIT LOOKUP
+# RATELIMITS = {path prefix: {mode or "*": (burst, per_minute)}}
+# -----------------------------------------------------
+class Limit:
+
+    def __init__(self, endpoint, mode, burst, per_minute):
+        self.endpoint = endpoint
+        self.mode = mode
+        self.burst = burst
+        self.rate = per_minute / 60.0
+
+    @property
+    def window(self):
+        # Seconds for an empty bucket to refill completely.
+        return math.ceil(self.burst / self.rate)
+
+    def headers(self, tokens):
+        return {
+            "RateLimit-Limit": str(self.burst),
+            "RateLimit-Remaining": str(max(0, int(tokens))),
+            "RateLimit-Reset": str(math.ceil((self.burst - tokens) / self.rate)),
+            "RateLimit-Policy": f"{self.burst};w={self.window}",
+        }
+
+    def retry_after(self, tokens, cost=1):
+        # Seconds until the bucket holds enough tokens for this request.
+        return max(1, math.ceil((cost - tokens) / self.rate))
+
+
+def find_limit(limits, path, mode):
+    # Longest matching prefix, so /api/generate/stream/ shares the
+    # /api/generate/ buckets unless it is configured separately.
+    endpoint = None
+    for prefix in limits:
+        if path.startswith(prefix) and (endpoint is None or len(prefix) > len(endpoint)):
+            endpoint = prefix
+    if endpoint is None:
+        return None
+    per_mode = limits[endpoint]
+    mode = (mode or "").lower().strip()
+    if mode in per_mode:
+        return Limit(endpoint, mode, *per_mode[mode])
+    if "*" in per_mode:
+        return Limit(endpoint, "*", *per_mode["*"])
+    return None
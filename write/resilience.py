@@ -0,0 +1,212 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+MAX_ATTEMPTS = int(os.getenv("GEMINI_RETRY_ATTEMPTS", "3"))
+BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.25"))
+MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "4"))
+BUDGET_RATIO = float(os.getenv("GEMINI_RETRY_BUDGET_RATIO", "0.2"))
+
+FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("GEMINI_BREAKER_RESET", "20"))
+HALF_OPEN_PROBES = int(os.getenv("GEMINI_BREAKER_PROBES", "1"))
+# A probe that hasn't reported back in this long (its caller was
+# cancelled, say) counts as failed, so it can't hold the breaker
+# half-open for good.
+PROBE_TIMEOUT = float(os.getenv("GEMINI_BREAKER_PROBE_TIMEOUT", "60"))
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+
+
+# -----------------------------------------------------
+# FAILURE CLASSIFICATION
+# -----------------------------------------------------
+def status_of(error):
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def is_upstream_failure(error):
+    # Counts against the breaker: Gemini (or the path to it) is unhealthy.
+    # A 400 for a bad prompt says nothing about upstream health.
+    status = status_of(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        httpx.TransportError,
+    ))
+
+
+def is_retryable(error):
+    # A read timeout already cost the full timeout; retrying it would
+    # double the wait, so only fast failures are retried.
+    if isinstance(error, (requests.exceptions.ReadTimeout, httpx.ReadTimeout)):
+        return False
+    return is_upstream_failure(error)
+
+
+def retry_after(error):
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        value = error.response.headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    return None
+    return None
+
+
+
+
+# -----------------------------------------------------
+# CIRCUIT BREAKER
+# closed -> open after N consecutive upstream failures
+# open -> half-open after reset_timeout; a few probes are let through
+# half-open -> closed on a probe success, back to open on a failure or
+#              when no probe has reported back within probe_timeout
+# -----------------------------------------------------
+class CircuitBreaker:
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT, half_open_probes=HALF_OPEN_PROBES,
+                 probe_timeout=PROBE_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probed_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            self.expire_probes()
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Gemini is unavailable (circuit open)")
+                self.state = self.HALF_OPEN
+                self.probes = 0
+            if self.state == self.HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    raise CircuitOpenError("Gemini is unavailable (circuit half-open)")
+                self.probes += 1
+                self.probed_at = time.monotonic()
+
+    def available(self):
+        # Whether allow() could let a call through now, without taking
+        # a half-open probe.
+        with self._lock:
+            self.expire_probes()
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            if self.state == self.HALF_OPEN:
+                return self.probes < self.half_open_probes
+            return True
+
+    def release(self):
+        # For a call let through that ended without an outcome (it was
+        # cancelled): its half-open probe goes to the next caller.
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def expire_probes(self):
+        # Called with the lock held.
+        if (self.state == self.HALF_OPEN and self.probes >= self.half_open_probes
+                and time.monotonic() - self.probed_at >= self.probe_timeout):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probes = 0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self.probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probes = 0
+
+    def record(self, error=None):
+        if error is not None and is_upstream_failure(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+
+
+# -----------------------------------------------------
+# RETRY POLICY
+# Full-jitter exponential backoff, honouring Retry-After, limited by a
+# retry budget: every request deposits BUDGET_RATIO tokens and every
+# retry spends one, so retries stay a fraction of real traffic.
+# -----------------------------------------------------
+class RetryPolicy:
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, budget_ratio=BUDGET_RATIO, budget_cap=10):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_cap = budget_cap
+        self.tokens = float(budget_cap)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.budget_cap, self.tokens + self.budget_ratio)
+
+    def backoff(self, attempt, error):
+        # Seconds to wait before the next attempt, or None to give up.
+        if attempt + 1 >= self.max_attempts or not is_retryable(error):
+            return None
+        hinted = retry_after(error)
+        if hinted is not None:
+            if hinted > self.max_delay:
+                return None
+            delay = hinted
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if not self.spend():
+            return None
+        return delay
+
+    def spend(self):
+        # Takes one retry from the budget; False when it is empty.
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        return True
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+
+from cachetools import TTLCache
+from django.core.cache import caches
+
+from .metrics import CACHE_LOOKUPS
+
+LOCAL_MAXSIZE = int(os.getenv("RESPONSE_CACHE_LOCAL_SIZE", "512"))
+LOCAL_TTL = int(os.getenv("RESPONSE_CACHE_LOCAL_TTL", "300"))
+SHARED_TTL = int(os.getenv("RESPONSE_CACHE_SHARED_TTL", "3600"))
+SHARED_ALIAS = "responses"
+
+
+
+
+# -----------------------------------------------------
+# KEY NORMALIZATION
+# The services key on the model they ask for. Through the router a later
+# model in GEMINI_MODELS may have answered instead; its text is cached
+# under the same key, since GEMINI_MODELS lists only models whose
+# answers are acceptable for every request.
+# -----------------------------------------------------
+def normalize(value):
+    # Case and whitespace differences never change what Gemini writes,
+    # so "Rain  on glass " and "rain on glass" share one entry.
+    return " ".join(str(value or "").split()).casefold()
+
+
+def make_key(namespace, *parts):
+    raw = "\x1f".join(normalize(p) for p in parts)
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return f"heartnote:{namespace}:{digest}"
+
+
+
+
+# -----------------------------------------------------
+# TWO-TIER CACHE
+# L1: per-process TTL/LRU (cachetools)
+# L2: Django cache alias shared by every gunicorn worker
+# -----------------------------------------------------
+class ResponseCache:
+
+    def __init__(self, alias=SHARED_ALIAS, maxsize=LOCAL_MAXSIZE,
+                 local_ttl=LOCAL_TTL, shared_ttl=SHARED_TTL):
+        self.alias = alias
+        self.shared_ttl = shared_ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        with self._lock:
+            value = self.local.get(key)
+            if value is not None:
+                CACHE_LOOKUPS.labels("local").inc()
+                return value
+
+        try:
+            value = self.shared.get(key)
+        except Exception:
+            value = None
+
+        with self._lock:
+            if value is None:
+                CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            CACHE_LOOKUPS.labels("shared").inc()
+            self.local[key] = value
+        return value
+
+    def get_shared(self, key):
+        # Re-read only the shared tier, without touching the counters; used
+        # after waiting on another worker that was generating the same key.
+        try:
+            value = self.shared.get(key)
+        except Exception:
+            return None
+        if value is not None:
+            with self._lock:
+                self.local[key] = value
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.local[key] = value
+        try:
+            self.shared.set(key, value, self.shared_ttl)
+        except Exception:
+            # The shared tier is an optimisation; a full disk or an
+            # unreachable backend must never fail a generation.
+            pass
+
+    # -------------------------------------------------
+    # ASYNC (the L1 tier never blocks; L2 goes through Django's aget/aset)
+    # -------------------------------------------------
+    async def aget(self, key):
+        with self._lock:
+            value = self.local.get(key)
+            if value is not None:
+                CACHE_LOOKUPS.labels("local").inc()
+                return value
+
+        try:
+            value = await self.shared.aget(key)
+        except Exception:
+            value = None
+
+        with self._lock:
+            if value is None:
+                CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            CACHE_LOOKUPS.labels("shared").inc()
+            self.local[key] = value
+        return value
+
+    async def aset(self, key, value):
+        with self._lock:
+            self.local[key] = value
+        try:
+            await self.shared.aset(key, value, self.shared_ttl)
+        except Exception:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self.local.clear()
+        try:
+            self.shared.clear()
+        except Exception:
+            pass
+
+
+response_cache = ResponseCache()
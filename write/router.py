@@ -0,0 +1,370 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import aclosing
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .gemini_client import GEMINI_MODEL, GeminiClient, extract_text
+from .metrics import UPSTREAM_FAILOVERS, UPSTREAM_ROUTED, upstream_status
+from .ratelimit import LocalBucketStore, SQLiteBucketStore
+from .resilience import CircuitOpenError, RetryPolicy, is_retryable, retry_after, status_of
+
+# Requests per minute each key may send to each model (Gemini's quotas
+# are per project and model). 0 leaves it to the 429s.
+KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "0"))
+# A route that answered 429 without a Retry-After rests this long.
+COOLDOWN = float(os.getenv("GEMINI_ROUTE_COOLDOWN", "20"))
+# Each later model in GEMINI_MODELS has to be this much faster (25%
+# per place) to be chosen over an earlier one.
+MODEL_PENALTY = float(os.getenv("GEMINI_MODEL_PENALTY", "0.25"))
+# Latency assumed for a model until it has answered.
+INITIAL_LATENCY = 2.0
+LATENCY_SMOOTHING = 0.2
+# A model not measured for this long gets the next request, so one that
+# was slow is noticed once it recovers.
+REPROBE_AFTER = float(os.getenv("GEMINI_ROUTE_REPROBE", "30"))
+# Routes tried for one request: the first pick plus failovers.
+MAX_ROUTES = int(os.getenv("GEMINI_ROUTE_ATTEMPTS", "3"))
+
+
+class NoRouteAvailable(CircuitOpenError):
+    pass
+
+
+
+
+# -----------------------------------------------------
+# ROUTES
+# One per (API key, model), each with its own GeminiClient: its own
+# circuit breaker, and no retries of its own, since the router fails
+# over to another route instead. Keys are labelled key0, key1, ... in
+# metrics; the bucket name uses a fingerprint, never the key itself.
+# -----------------------------------------------------
+class Route:
+
+    def __init__(self, key, fingerprint, model, client):
+        self.key = key
+        self.model = model
+        self.client = client
+        self.bucket = f"gemini|{fingerprint}|{model}"
+        self.resting_until = 0.0
+        self.inflight = 0
+        self.picked = 0
+
+    def __repr__(self):
+        return f"<Route {self.key} {self.model}>"
+
+
+
+
+# -----------------------------------------------------
+# ROUTER
+# Same interface as GeminiClient; get_client() returns one when
+# GEMINI_API_KEYS or GEMINI_MODELS lists more than one.
+#
+# Each call goes to the healthy route whose model has the lowest rolling
+# latency (per kind: whole call for generateContent, time to first text
+# for streams), weighted by MODEL_PENALTY so the later models in the
+# list are fallbacks; between keys, to the one with fewer calls in
+# flight, then in turn. A route is skipped while it rests after a 429, while its
+# breaker is open, or when its key is out of KEY_RPM. A 429, 5xx or
+# connect error moves the request to the next route, within the retry
+# budget; a stream only fails over before its first text.
+# -----------------------------------------------------
+class GeminiRouter:
+
+    def __init__(self, keys, models, base_url=None, key_rpm=KEY_RPM, store=None, retry=None):
+        # keys: API keys, or (api_key, base_url) pairs (one local stub
+        # per key in tests).
+        self.models = list(models)
+        self.routes = []
+        for i, key in enumerate(keys):
+            api_key, url = key if isinstance(key, tuple) else (key, base_url)
+            fingerprint = hashlib.sha256(api_key.encode()).hexdigest()[:12]
+            for model in self.models:
+                client = GeminiClient(api_key=api_key, base_url=url,
+                                      retry=RetryPolicy(max_attempts=1))
+                self.routes.append(Route(f"key{i}", fingerprint, model, client))
+        self.key_rpm = key_rpm
+        if store is None:
+            path = getattr(settings, "RATELIMIT_DB", "")
+            store = SQLiteBucketStore(path) if path else LocalBucketStore()
+        self.store = store
+        self.retry = retry or RetryPolicy()
+        self.latency = {}       # (model, kind) -> seconds
+        self.measured = {}      # (model, kind) -> monotonic time of last sample
+        self._handles = {}      # cachedContents name -> (route, instruction)
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------
+    # CHOOSING A ROUTE
+    # -------------------------------------------------
+    def pick(self, preferred, kind, tried=(), model=None):
+        order = self.order(preferred)
+        now = time.monotonic()
+        with self._lock:
+            healthy = [
+                r for r in self.routes
+                if r not in tried and r.resting_until <= now and r.client.breaker.available()
+                and (model is None or r.model == model)]
+            ranked = sorted(healthy, key=lambda r: (
+                self.score(r.model, kind, order), r.inflight, r.picked))
+            stale = self.stale(ranked, kind, now)
+            if stale is not None:
+                self.measured[(stale, kind)] = now
+                ranked.sort(key=lambda r: r.model != stale)
+        if not ranked:
+            raise NoRouteAvailable("No healthy Gemini route")
+        for route in ranked:
+            if self.take_quota(route):
+                with self._lock:
+                    route.inflight += 1
+                    route.picked += 1
+                UPSTREAM_ROUTED.labels(route.key, route.model).inc()
+                return route
+        raise NoRouteAvailable("Every Gemini route is at its quota")
+
+    async def apick(self, preferred, kind, tried=(), model=None):
+        # The shared quota store is SQLite; keep its lock off the loop.
+        if self.key_rpm and isinstance(self.store, SQLiteBucketStore):
+            return await sync_to_async(self.pick, thread_sensitive=False)(
+                preferred, kind, tried, model)
+        return self.pick(preferred, kind, tried, model)
+
+    def order(self, preferred):
+        if preferred in self.models:
+            return [preferred] + [m for m in self.models if m != preferred]
+        return self.models
+
+    def score(self, model, kind, order):
+        latency = self.latency.get((model, kind), INITIAL_LATENCY)
+        return latency * (1 + MODEL_PENALTY * order.index(model))
+
+    def stale(self, ranked, kind, now):
+        # A model that isn't first and hasn't been measured lately (or
+        # ever): one request finds out whether it is faster now. Not
+        # before the first model has been measured itself.
+        if not ranked or (ranked[0].model, kind) not in self.measured:
+            return None
+        for route in ranked[1:]:
+            seen = self.measured.get((route.model, kind))
+            if route.model != ranked[0].model and (seen is None or now - seen > REPROBE_AFTER):
+                return route.model
+        return None
+
+    def take_quota(self, route):
+        if not self.key_rpm:
+            return True
+        try:
+            allowed, _ = self.store.take(route.bucket, self.key_rpm, self.key_rpm / 60.0)
+        except Exception:
+            # Fail open, like the rate limiter: Gemini's 429s still apply.
+            return True
+        return allowed
+
+    def next_route(self, preferred, kind, tried, error):
+        try:
+            return self.pick(preferred, kind, tried)
+        except NoRouteAvailable:
+            if error is not None:
+                raise error
+            raise
+
+    async def anext_route(self, preferred, kind, tried, error):
+        try:
+            return await self.apick(preferred, kind, tried)
+        except NoRouteAvailable:
+            if error is not None:
+                raise error
+            raise
+
+    # -------------------------------------------------
+    # OUTCOMES
+    # -------------------------------------------------
+    def succeeded(self, route, kind, started):
+        self.sample(route.model, kind, time.perf_counter() - started)
+
+    def failed(self, route, kind, started, error):
+        if status_of(error) == 429:
+            rest = retry_after(error)
+            with self._lock:
+                route.resting_until = time.monotonic() + (COOLDOWN if rest is None else rest)
+        elif isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            # A model that times out is at least that slow.
+            self.sample(route.model, kind, time.perf_counter() - started)
+
+    def sample(self, model, kind, seconds):
+        key = (model, kind)
+        with self._lock:
+            previous = self.latency.get(key)
+            if previous is None:
+                self.latency[key] = seconds
+            else:
+                self.latency[key] = previous + LATENCY_SMOOTHING * (seconds - previous)
+            self.measured[key] = time.monotonic()
+
+    def release(self, route):
+        with self._lock:
+            route.inflight -= 1
+
+    def failover(self, error, tried):
+        if len(tried) >= MAX_ROUTES:
+            return False
+        # An open breaker made no call; anything else spends retry budget.
+        if not isinstance(error, CircuitOpenError):
+            if not is_retryable(error) or not self.retry.spend():
+                return False
+        UPSTREAM_FAILOVERS.labels(upstream_status(error)).inc()
+        return True
+
+    # -------------------------------------------------
+    # CACHED INSTRUCTIONS
+    # A cachedContents handle belongs to the key and model that created
+    # it; a request routed elsewhere carries the instruction inline.
+    # -------------------------------------------------
+    def create_cached_content(self, model, system_instruction, ttl):
+        route = self.pick(model, "generate", model=model)
+        try:
+            name = route.client.create_cached_content(route.model, system_instruction, ttl)
+        finally:
+            self.release(route)
+        with self._lock:
+            for old, (owner, text) in list(self._handles.items()):
+                if owner.model == route.model and text == system_instruction:
+                    del self._handles[old]
+            self._handles[name] = (route, system_instruction)
+        return name
+
+    def payload_for(self, route, payload):
+        name = payload.get("cachedContent")
+        owner = self._handles.get(name) if name else None
+        if owner is None or owner[0] is route:
+            return payload
+        payload = dict(payload)
+        del payload["cachedContent"]
+        payload["systemInstruction"] = {"parts": [{"text": owner[1]}]}
+        return payload
+
+    # -------------------------------------------------
+    # REQUEST (GeminiClient's interface)
+    # `model` is the preferred model; another of GEMINI_MODELS may answer.
+    # -------------------------------------------------
+    def build_payload(self, *args, **kwargs):
+        return self.routes[0].client.build_payload(*args, **kwargs)
+
+    def generate_content(self, payload, model=GEMINI_MODEL):
+        self.retry.deposit()
+        tried = []
+        error = None
+        while True:
+            route = self.next_route(model, "generate", tried, error)
+            tried.append(route)
+            started = time.perf_counter()
+            try:
+                data = route.client.generate_content(self.payload_for(route, payload), model=route.model)
+            except Exception as e:
+                self.failed(route, "generate", started, e)
+                if self.failover(e, tried):
+                    error = e
+                    continue
+                raise
+            finally:
+                self.release(route)
+            self.succeeded(route, "generate", started)
+            return data
+
+    def generate(self, prompt, temperature, top_p=0.9, max_output_tokens=1024, model=GEMINI_MODEL):
+        payload = self.build_payload(prompt, temperature, top_p, max_output_tokens)
+        return extract_text(self.generate_content(payload, model=model))
+
+    def stream_generate(self, payload, model=GEMINI_MODEL, on_data=None):
+        self.retry.deposit()
+        tried = []
+        error = None
+        while True:
+            route = self.next_route(model, "stream", tried, error)
+            tried.append(route)
+            started = time.perf_counter()
+            sent = False
+            try:
+                for text in route.client.stream_generate(
+                        self.payload_for(route, payload), model=route.model, on_data=on_data):
+                    if not sent:
+                        sent = True
+                        self.succeeded(route, "stream", started)
+                    yield text
+            except Exception as e:
+                self.failed(route, "stream", started, e)
+                if not sent and self.failover(e, tried):
+                    error = e
+                    continue
+                raise
+            finally:
+                self.release(route)
+            return
+
+    async def agenerate_content(self, payload, model=GEMINI_MODEL):
+        self.retry.deposit()
+        tried = []
+        error = None
+        while True:
+            route = await self.anext_route(model, "generate", tried, error)
+            tried.append(route)
+            started = time.perf_counter()
+            try:
+                data = await route.client.agenerate_content(
+                    self.payload_for(route, payload), model=route.model)
+            except Exception as e:
+                self.failed(route, "generate", started, e)
+                if self.failover(e, tried):
+                    error = e
+                    continue
+                raise
+            finally:
+                self.release(route)
+            self.succeeded(route, "generate", started)
+            return data
+
+    async def agenerate(self, prompt, temperature, top_p=0.9, max_output_tokens=1024, model=GEMINI_MODEL):
+        payload = self.build_payload(prompt, temperature, top_p, max_output_tokens)
+        return extract_text(await self.agenerate_content(payload, model=model))
+
+    async def astream_generate(self, payload, model=GEMINI_MODEL, on_data=None):
+        self.retry.deposit()
+        tried = []
+        error = None
+        while True:
+            route = await self.anext_route(model, "stream", tried, error)
+            tried.append(route)
+            started = time.perf_counter()
+            sent = False
+            try:
+                # Closed here, not left to the garbage collector, when
+                # this stream is cancelled or closed early, so the
+                # route's breaker and connection are settled at once.
+                async with aclosing(route.client.astream_generate(
+                        self.payload_for(route, payload), model=route.model,
+                        on_data=on_data)) as chunks:
+                    async for text in chunks:
+                        if not sent:
+                            sent = True
+                            self.succeeded(route, "stream", started)
+                        yield text
+            except Exception as e:
+                self.failed(route, "stream", started, e)
+                if not sent and self.failover(e, tried):
+                    error = e
+                    continue
+                raise
+            finally:
+                self.release(route)
+            return
+
+    async def aclose(self):
+        for route in self.routes:
+            await route.client.aclose()
@@ -0,0 +1,81 @@
+import json
+import os
+import re
+from pathlib import Path
+
+PATTERNS_FILE = os.getenv(
+    "SAFETY_PATTERNS_FILE",
+    str(Path(__file__).resolve().parent / "data" / "safety_patterns.json"),
+)
+
+BLOCKLIST = "blocklist"
+SELFHARM = "selfharm"
+
+
+
+
+# -----------------------------------------------------
+# TRIE REGEX
+# Patterns sharing a prefix are merged into one branch, e.g.
+# ["kill me", "kill myself"] -> "kill\ m(?:e|yself)". The regex engine
+# then tries one trie path per position instead of every pattern.
+# -----------------------------------------------------
+def trie_regex(patterns):
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Greedy "?" prefers the longer pattern when one is a prefix of another.
+        return group + "?" if terminal else group
+
+    return build(trie)
+
+
+
+
+# -----------------------------------------------------
+# SAFETY FILTER
+# -----------------------------------------------------
+class SafetyFilter:
+
+    def __init__(self, blocklist, selfharm):
+        blocked = {p.lower() for p in blocklist if p}
+        # Abuse wins when a phrase appears in both lists.
+        harmful = {p.lower() for p in selfharm if p} - blocked
+        self.patterns = {BLOCKLIST: sorted(blocked), SELFHARM: sorted(harmful)}
+        self.regexes = [
+            (category, re.compile(trie_regex(patterns)))
+            for category, patterns in self.patterns.items() if patterns
+        ]
+
+    @classmethod
+    def from_file(cls, path=PATTERNS_FILE):
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data.get(BLOCKLIST, []), data.get(SELFHARM, []))
+
+    def scan(self, text):
+        # Returns None, BLOCKLIST or SELFHARM; abusive language takes
+        # priority over self-harm, as before. One search per list: in a
+        # single combined pass a self-harm match could consume the text
+        # of an overlapping blocklist phrase.
+        text = (text or "").lower()
+        for category, regex in self.regexes:
+            if regex.search(text):
+                return category
+        return None
+
+
+safety = SafetyFilter.from_file()
@@ -0,0 +1,260 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from .gemini_client import ASYNC_POOL_SIZE
+from .metrics import UPSTREAM_ACTIVE, UPSTREAM_QUEUED, UPSTREAM_QUEUE_WAIT, UPSTREAM_SHED
+from .timing import current as current_timings, span
+
+# Gemini calls (streams included) running at once in one process. A
+# WSGI process spends a thread on each, so it allows 8; an ASGI process
+# (HEARTNOTE_ASYNC=1) only holds a connection, so it allows as many as
+# the async pool has (GEMINI_ASYNC_POOL_SIZE).
+UPSTREAM_CONCURRENCY = int(os.getenv(
+    "HEARTNOTE_UPSTREAM_CONCURRENCY",
+    ASYNC_POOL_SIZE if os.getenv("HEARTNOTE_ASYNC", "") == "1" else 8))
+# Seconds from the start of a request by which its Gemini call must have
+# started; later than that it gets the fallback instead.
+UPSTREAM_DEADLINE = float(os.getenv("HEARTNOTE_UPSTREAM_DEADLINE", "8"))
+# Turns each kind of client gets per round: a logged-in session is
+# served two calls for every one of an anonymous visitor.
+WEIGHTS = {"u": 2, "ip": 1}
+# Starting guess for how long a call holds its slot, until measured.
+INITIAL_SERVICE_TIME = 2.0
+SERVICE_TIME_SMOOTHING = 0.2
+
+STILL_FORMING = "The thoughts are still forming.\n\nPlease try again in a moment."
+
+_client = contextvars.ContextVar("heartnote_upstream_client", default="")
+
+
+class Overloaded(Exception):
+    pass
+
+
+
+
+# -----------------------------------------------------
+# CLIENT
+# UpstreamClientMiddleware names the session (or IP) a request belongs
+# to; queued jobs run under the client that submitted them (jobs.py),
+# and other calls made outside a request share the "" client.
+# -----------------------------------------------------
+def current_client():
+    return _client.get()
+
+
+@contextmanager
+def acting_for(client):
+    # Also re-enters a request's client while its streaming body is
+    # consumed, after the middleware has already returned.
+    previous = _client.get()
+    _client.set(client)
+    try:
+        yield
+    finally:
+        _client.set(previous)
+
+
+
+
+# -----------------------------------------------------
+# FAIR-SHARE SCHEDULER
+# At most `concurrency` calls hold a slot. The rest wait in one queue
+# per client, and a freed slot goes to the next client in weighted
+# round-robin order, so one busy session can't starve the others.
+#
+# A request is shed (Overloaded, which the services turn into the
+# "still forming" fallback) when its expected wait would run past its
+# deadline, or when the deadline passes while it waits. Waiting is
+# bounded by the deadline, so under overload latency stays flat and the
+# excess is refused quickly instead of every request timing out.
+#
+# Threads wait on an Event, coroutines on a Future of their own loop;
+# both kinds share the same slots.
+# -----------------------------------------------------
+class _Waiter:
+
+    def __init__(self, client, loop=None):
+        self.client = client
+        self.loop = loop
+        self.granted = False
+        self.enqueued = time.perf_counter()
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class FairScheduler:
+
+    def __init__(self, concurrency=UPSTREAM_CONCURRENCY, deadline=UPSTREAM_DEADLINE,
+                 weights=WEIGHTS):
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.weights = weights
+        self.service_time = INITIAL_SERVICE_TIME
+        self.measured = False
+        self.active = 0
+        self.queued = 0
+        self._queues = OrderedDict()    # client -> [turns left, deque of waiters]
+        self._lock = threading.Lock()
+
+    def weight(self, client):
+        return self.weights.get(client.partition(":")[0], 1)
+
+    @contextmanager
+    def slot(self, service, deadline=None):
+        deadline_at = self.deadline_at(deadline)
+        waiter = self.admit(service, deadline_at)
+        if waiter is not None:
+            with span("queue"):
+                waiter.event.wait(max(0.0, deadline_at - time.perf_counter()))
+            self.settle(service, waiter)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aslot(self, service, deadline=None):
+        deadline_at = self.deadline_at(deadline)
+        waiter = self.admit(service, deadline_at, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                with span("queue"):
+                    await asyncio.wait_for(asyncio.shield(waiter.future),
+                                           max(0.0, deadline_at - time.perf_counter()))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # The client went away: give back the slot if it came.
+                if self.withdraw(waiter):
+                    self.release(None)
+                raise
+            self.settle(service, waiter)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def deadline_at(self, deadline):
+        # Counted from the start of the request when there is one, so
+        # time already spent (a single-flight wait, say) counts too.
+        timings = current_timings()
+        start = timings.started if timings is not None else time.perf_counter()
+        return start + (self.deadline if deadline is None else deadline)
+
+    # -------------------------------------------------
+    # ADMISSION
+    # -------------------------------------------------
+    def admit(self, service, deadline_at, loop=None):
+        # Returns None with a slot taken, or a waiter to wait on.
+        client = current_client()
+        with self._lock:
+            if self.active < self.concurrency and not self.queued:
+                self.active += 1
+                UPSTREAM_ACTIVE.inc()
+                UPSTREAM_QUEUE_WAIT.labels(service).observe(0)
+                return None
+            if time.perf_counter() + self.expected_wait(client) > deadline_at:
+                UPSTREAM_SHED.labels(service, "expected_wait").inc()
+                raise Overloaded(service)
+            waiter = _Waiter(client, loop)
+            entry = self._queues.get(client)
+            if entry is None:
+                entry = self._queues[client] = [self.weight(client), deque()]
+            entry[1].append(waiter)
+            self.queued += 1
+            UPSTREAM_QUEUED.inc()
+            return waiter
+
+    def expected_wait(self, client):
+        # Requests served before this one: the client's own queue, plus
+        # what every other client gets in the rounds it takes to reach it.
+        own = self._queues.get(client)
+        own_queued = len(own[1]) if own else 0
+        rounds = own_queued // self.weight(client) + 1
+        ahead = own_queued + sum(
+            min(len(queue), rounds * self.weight(other))
+            for other, (_, queue) in self._queues.items() if other != client)
+        return (ahead + 1) / self.concurrency * self.service_time
+
+    def settle(self, service, waiter):
+        # After waiting: proceed with the slot, or shed if none came in time.
+        if self.withdraw(waiter):
+            UPSTREAM_QUEUE_WAIT.labels(service).observe(time.perf_counter() - waiter.enqueued)
+            return
+        UPSTREAM_SHED.labels(service, "deadline").inc()
+        raise Overloaded(service)
+
+    def withdraw(self, waiter):
+        # True if the waiter was granted a slot; otherwise takes it out
+        # of its queue.
+        with self._lock:
+            if waiter.granted:
+                return True
+            entry = self._queues.get(waiter.client)
+            if entry is not None and waiter in entry[1]:
+                entry[1].remove(waiter)
+                if not entry[1]:
+                    del self._queues[waiter.client]
+                self.queued -= 1
+                UPSTREAM_QUEUED.dec()
+            return False
+
+    # -------------------------------------------------
+    # RELEASE: hand the slot to the next waiter
+    # -------------------------------------------------
+    def release(self, held):
+        with self._lock:
+            if held is None:
+                pass
+            elif self.measured:
+                self.service_time += SERVICE_TIME_SMOOTHING * (held - self.service_time)
+            else:
+                self.service_time = held
+                self.measured = True
+            waiter = self.next_waiter()
+            if waiter is None:
+                self.active -= 1
+                UPSTREAM_ACTIVE.dec()
+                return
+            waiter.granted = True
+        waiter.wake()
+
+    def next_waiter(self):
+        # Weighted round-robin: the client at the front is served until
+        # its turns run out (or its queue empties), then goes to the back.
+        if not self._queues:
+            return None
+        client, entry = next(iter(self._queues.items()))
+        waiter = entry[1].popleft()
+        self.queued -= 1
+        UPSTREAM_QUEUED.dec()
+        entry[0] -= 1
+        if not entry[1]:
+            del self._queues[client]
+        elif entry[0] == 0:
+            entry[0] = self.weight(client)
+            self._queues.move_to_end(client)
+        return waiter
+
+
+scheduler = FairScheduler()
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: coalesce within the process only
+    fcntl = None
+
+# Longest a worker waits on another worker's lock for the same key; after
+# that it rechecks the cache and calls Gemini itself.
+LOCK_TIMEOUT = float(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "10"))
+LOCK_POLL = 0.05
+
+
+
+
+# -----------------------------------------------------
+# SINGLE-FLIGHT
+# While one upstream call for a key is in flight, identical requests
+# wait for it and share its result instead of calling Gemini again.
+#
+# - threads in one worker share an in-memory call record
+# - workers on the same host serialise on a per-key flock; the worker
+#   that waited then re-reads the shared response cache (recheck).
+#   Without a recheck (regenerate) there is nothing to share across
+#   workers, so no lock is taken.
+# - coroutines on one event loop await one task running the call
+#
+# Regenerates fly under their own key (flight_key), so they never take
+# an ordinary request's answer, which may be the one the cache holds.
+# -----------------------------------------------------
+def flight_key(key, use_cache=True):
+    return key if use_cache else f"{key}|regenerate"
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self, lock_dir=None, lock_timeout=LOCK_TIMEOUT):
+        self._lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def lock_dir(self):
+        if self._lock_dir is None:
+            self._lock_dir = getattr(settings, "SINGLEFLIGHT_LOCK_DIR", "")
+        return self._lock_dir
+
+    # -------------------------------------------------
+    # THREADS (+ other worker processes)
+    # -------------------------------------------------
+    def do(self, key, fn, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if recheck is None:
+                call.result = fn()
+            else:
+                with self.process_lock(key) as waited:
+                    value = recheck() if waited else None
+                    call.result = value if value is not None else fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @contextmanager
+    def process_lock(self, key):
+        # Yields True when another worker held the key and we had to wait
+        # (up to lock_timeout; past it we go ahead without the lock).
+        if fcntl is None or not self.lock_dir:
+            yield False
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock"
+        path = os.path.join(self.lock_dir, name)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            waited = False
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if time.monotonic() >= deadline:
+                        yield True
+                        return
+                    time.sleep(LOCK_POLL)
+            try:
+                yield waited
+            finally:
+                # Unlink before unlocking: anyone still queued on this inode
+                # rechecks the cache, newcomers start from a fresh file.
+                # Leave the path alone if it already names someone else's file.
+                try:
+                    if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    # -------------------------------------------------
+    # ASYNCIO (one event loop per process)
+    # -------------------------------------------------
+    async def ado(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        call = self._async_calls.get(key)
+        if call is not None and call.task.get_loop() is loop:
+            self.coalesced += 1
+        else:
+            # The call runs as a task of its own, so the request that
+            # started it can go away (ASGI cancels a view whose client
+            # disconnects) without taking the result from the others.
+            call = self._async_calls[key] = _AsyncCall(loop.create_task(coro_fn()))
+            call.task.add_done_callback(lambda task: self._async_done(key, call))
+            self.leaders += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # Cancel the upstream call only once nobody is left waiting.
+            if call.waiters == 1:
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _async_done(self, key, call):
+        if self._async_calls.get(key) is call:
+            del self._async_calls[key]
+        # Mark retrieved so a failure nobody awaited doesn't log a warning.
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+flights = SingleFlight()
@@ -0,0 +1,7 @@
+from django.test import override_settings
+
+# Pages link fingerprinted bundles; tests run without collectstatic.
+plain_static = override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
@@ -0,0 +1,175 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import requests
+from django.test import SimpleTestCase
+
+from write.gemini_client import GeminiClient, extract_text
+from write.gemini_stub import GeminiStub
+from write.management.commands.loadtest import ENDPOINTS, Command, percentile
+from write.resilience import RetryPolicy, status_of
+
+
+def client_for(stub):
+    return GeminiClient(api_key="test", base_url=stub.base_url,
+                        retry=RetryPolicy(max_attempts=1))
+
+
+class GeminiStubTests(SimpleTestCase):
+
+    def test_answers_with_text_and_usage(self):
+        with GeminiStub(latency=0) as stub:
+            client = client_for(stub)
+            data = client.generate_content(client.build_payload("rain", 0.5))
+        self.assertEqual(extract_text(data), stub.text)
+        usage = data["usageMetadata"]
+        self.assertEqual(usage["totalTokenCount"],
+                         usage["promptTokenCount"] + usage["candidatesTokenCount"])
+        self.assertEqual(stub.requests, 1)
+
+    def test_cuts_answer_at_max_output_tokens(self):
+        with GeminiStub(latency=0) as stub:
+            client = client_for(stub)
+            data = client.generate_content(client.build_payload("rain", 0.5, max_output_tokens=3))
+        candidate = data["candidates"][0]
+        self.assertEqual(candidate["finishReason"], "MAX_TOKENS")
+        self.assertLess(len(extract_text(data)), len(stub.text))
+
+    def test_streams_word_by_word(self):
+        with GeminiStub(latency=0) as stub:
+            client = client_for(stub)
+            chunks = list(client.stream_generate(client.build_payload("rain", 0.5)))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), stub.text)
+
+    def test_error_rate_answers_503(self):
+        with GeminiStub(latency=0, error_rate=1.0, seed=1) as stub:
+            client = client_for(stub)
+            with self.assertRaises(requests.exceptions.HTTPError) as raised:
+                client.generate_content(client.build_payload("rain", 0.5))
+        self.assertEqual(status_of(raised.exception), 503)
+        self.assertEqual(stub.errors, 1)
+
+    def test_burst_answers_429_with_retry_after(self):
+        with GeminiStub(latency=0, burst_every=60, burst_length=60, retry_after=7) as stub:
+            client = client_for(stub)
+            with self.assertRaises(requests.exceptions.HTTPError) as raised:
+                client.generate_content(client.build_payload("rain", 0.5))
+        self.assertEqual(status_of(raised.exception), 429)
+        self.assertEqual(raised.exception.response.headers["Retry-After"], "7")
+        self.assertEqual(stub.throttled, 1)
+
+    def test_model_latency_and_counts(self):
+        with GeminiStub(latency=0, model_latency={"slow": 0.2}) as stub:
+            client = client_for(stub)
+            payload = client.build_payload("rain", 0.5)
+            client.generate_content(payload, model="slow")
+            client.generate_content(payload, model="fast")
+        self.assertEqual(stub.by_model, {"slow": 1, "fast": 1})
+        self.assertEqual(stub.delay("slow"), 0.2)
+        self.assertEqual(stub.delay("fast"), 0)
+
+    def test_distributions(self):
+        stub = GeminiStub(latency=1.0, distribution="uniform", spread=0.5, seed=3)
+        samples = [stub.delay() for _ in range(200)]
+        self.assertTrue(all(0.5 <= s <= 1.5 for s in samples))
+        stub = GeminiStub(latency=0.1, distribution="normal", spread=1.0, seed=3)
+        self.assertTrue(all(stub.delay() >= 0 for _ in range(200)))
+        with self.assertRaises(ValueError):
+            GeminiStub(distribution="poisson")
+
+    def test_cached_content(self):
+        with GeminiStub(latency=0, cache_min_tokens=5) as stub:
+            client = client_for(stub)
+            with self.assertRaises(requests.exceptions.HTTPError) as raised:
+                client.create_cached_content("m", "short", 60)
+            self.assertEqual(status_of(raised.exception), 400)
+            name = client.create_cached_content("m", "a system instruction long enough", 60)
+            data = client.generate_content(client.build_payload("rain", 0.5, cached_content=name))
+            self.assertIn("cachedContentTokenCount", data["usageMetadata"])
+            with self.assertRaises(requests.exceptions.HTTPError) as raised:
+                client.generate_content(client.build_payload(
+                    "rain", 0.5, cached_content="cachedContents/gone"))
+            self.assertEqual(status_of(raised.exception), 404)
+
+
+class LoadTestHelperTests(SimpleTestCase):
+
+    def test_percentile(self):
+        ordered = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(ordered, 50), 50.0)
+        self.assertEqual(percentile(ordered, 99), 99.0)
+        self.assertEqual(percentile(ordered, 100), 100.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_params_are_unique_unless_repeated(self):
+        command = Command()
+        for path in ENDPOINTS.values():
+            first = command.params(path, "1-0", {"repeat_inputs": False})
+            second = command.params(path, "1-1", {"repeat_inputs": False})
+            self.assertNotEqual(first, second)
+            first = command.params(path, "1-0", {"repeat_inputs": True})
+            second = command.params(path, "1-1", {"repeat_inputs": True})
+            self.assertEqual(first, second)
+
+    def test_outcomes(self):
+        answers = {
+            "/ok": (200, {"response": "A letter."}),
+            "/fallback": (200, {"response": "⚠️ The thoughts are still forming."}),
+            "/dashboard": (200, {"response": {"response": "...", "is_fallback": True}}),
+            "/limited": (429, {}),
+            "/broken": (500, {}),
+        }
+
+        def handler(request):
+            status, body = answers[request.url.path]
+            return httpx.Response(status, json=body)
+
+        async def outcomes():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler),
+                                         base_url="http://test") as client:
+                return [await Command().one(client, path, {}) for path in answers]
+
+        self.assertEqual(asyncio.run(outcomes()), ["ok", "fallback", "fallback", "429", "error"])
+
+    def test_job_mode_and_unparseable_outcomes(self):
+        polls = Counter()
+        answers = {
+            "/queued": (202, {"job": "1", "status": "queued", "result": "/jobs/1/"}),
+            "/jobs/1/": [(200, {"job": "1", "status": "running"}),
+                         (200, {"job": "1", "status": "done", "response": "A letter."})],
+            "/failed": (202, {"job": "2", "status": "queued", "result": "/jobs/2/"}),
+            "/jobs/2/": (200, {"job": "2", "status": "failed",
+                               "response": {"response": "...", "is_fallback": True}}),
+            "/expired": (202, {"job": "3", "status": "queued", "result": "/jobs/3/"}),
+            "/jobs/3/": (404, {"error": "Unknown or expired job"}),
+            "/html": (200, "<html>"),
+            "/list": (200, ["A letter."]),
+        }
+
+        def handler(request):
+            answer = answers[request.url.path]
+            if isinstance(answer, list):
+                answer = answer[polls[request.url.path]]
+                polls[request.url.path] += 1
+            status, body = answer
+            if isinstance(body, str):
+                return httpx.Response(status, text=body)
+            return httpx.Response(status, json=body)
+
+        async def outcomes():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler),
+                                         base_url="http://test") as client:
+                paths = ["/queued", "/failed", "/expired", "/html", "/list"]
+                return [await Command().one(client, path, {}) for path in paths]
+
+        self.assertEqual(asyncio.run(outcomes()), ["ok", "fallback", "error", "error", "error"])
+        self.assertEqual(polls["/jobs/1/"], 2)
+
+    def test_format_row(self):
+        row = {"latencies": [0.1, 0.2, 0.3], "outcomes": Counter(ok=3), "elapsed": 1.5}
+        line = Command().format_row("generate", 8, row)
+        self.assertTrue(line.startswith("generate"))
+        self.assertIn("300.0", line)
+        self.assertTrue(line.endswith("2.0"))
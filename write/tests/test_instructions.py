@@ -0,0 +1,109 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from write import instructions
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.instructions import SystemInstructions
+from write.llm_service import INSTRUCTIONS, LLM_Service
+from write.resilience import RetryPolicy
+from write.scheduler import FairScheduler
+from write.singleflight import SingleFlight
+
+TEXTS = {"poem": "Write a short poem about what the user gives."}
+
+
+class SystemInstructionTests(SimpleTestCase):
+
+    def serve(self, **stub):
+        self.stub = self.enterContext(GeminiStub(latency=0, **stub))
+        self.client = GeminiClient(api_key="test", base_url=self.stub.base_url,
+                                   retry=RetryPolicy(max_attempts=1))
+        self.creates = self.enterContext(mock.patch.object(
+            self.client, "create_cached_content", wraps=self.client.create_cached_content))
+
+    def settle(self, system):
+        # Handles are created on a background thread.
+        deadline = time.monotonic() + 5
+        while system._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(system._pending)
+
+    def test_inline_without_cached_content(self):
+        self.serve()
+        system = SystemInstructions(TEXTS, self.client, cached=False)
+        self.assertEqual(system.fields("m", "poem"), {"system_instruction": TEXTS["poem"]})
+        self.assertEqual(self.creates.call_count, 0)
+
+    def test_handle_is_created_once_and_reused(self):
+        self.serve()
+        system = SystemInstructions(TEXTS, self.client, cached=True)
+        # Inline until the handle exists; the request never waits for it.
+        self.assertEqual(system.fields("m", "poem"), {"system_instruction": TEXTS["poem"]})
+        self.settle(system)
+        fields = [system.fields("m", "poem") for _ in range(5)]
+        self.assertEqual(fields, [{"cached_content": "cachedContents/stub-1"}] * 5)
+        self.assertEqual(self.creates.call_count, 1)
+        self.assertEqual(self.stub.cached, {"cachedContents/stub-1": TEXTS["poem"]})
+
+    def test_failed_create_stays_inline(self):
+        self.serve(cache_min_tokens=10000)
+        system = SystemInstructions(TEXTS, self.client, cached=True)
+        with self.assertLogs("write.instructions", "WARNING"):
+            system.fields("m", "poem")
+            self.settle(system)
+        for _ in range(3):
+            self.assertEqual(system.fields("m", "poem"), {"system_instruction": TEXTS["poem"]})
+        # No retry before RETRY_AFTER.
+        self.assertEqual(self.creates.call_count, 1)
+
+    def test_refreshes_before_expiry(self):
+        self.serve()
+        system = SystemInstructions(TEXTS, self.client, cached=True, ttl=1)
+        with mock.patch.object(instructions, "REFRESH_AT", 0.05):
+            system.fields("m", "poem")
+            self.settle(system)
+            time.sleep(0.06)
+            # The old handle is used while its replacement is created.
+            self.assertEqual(system.fields("m", "poem"), {"cached_content": "cachedContents/stub-1"})
+            self.settle(system)
+        self.assertEqual(system.fields("m", "poem"), {"cached_content": "cachedContents/stub-2"})
+
+
+class CachedInstructionServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = self.enterContext(GeminiStub(latency=0))
+        client = GeminiClient(api_key="test", base_url=self.stub.base_url,
+                              retry=RetryPolicy(max_attempts=1))
+        self.calls = self.enterContext(mock.patch.object(
+            client, "generate_content", wraps=client.generate_content))
+        self.service = LLM_Service(client=client, cache=None, flights=SingleFlight(lock_dir=""),
+                                   scheduler=FairScheduler())
+        self.service.instructions = SystemInstructions(INSTRUCTIONS, client, cached=True)
+
+    def generate(self):
+        answer = self.service.generate("poem", "rain on glass")
+        payload = self.calls.call_args.args[0]
+        return answer, payload.get("cachedContent"), "systemInstruction" in payload
+
+    def settle(self):
+        deadline = time.monotonic() + 5
+        while self.service.instructions._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_handle_reused_then_inline_when_it_is_gone(self):
+        self.assertEqual(self.generate(), (self.stub.text, None, True))
+        self.settle()
+        for _ in range(2):
+            self.assertEqual(self.generate(), (self.stub.text, "cachedContents/stub-1", False))
+        # Evicted upstream: that request fails once, the next goes inline
+        # and a new handle is created for the ones after it.
+        self.stub.cached.clear()
+        answer, _, _ = self.generate()
+        self.assertTrue(answer.startswith("⚠️ Gemini error"))
+        self.assertEqual(self.generate(), (self.stub.text, None, True))
+        self.settle()
+        self.assertEqual(self.generate(), (self.stub.text, "cachedContents/stub-2", False))
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from write import jobs
+from write.models import GenerationJob
+from write.scheduler import acting_for, current_client
+
+
+class QueueTests(TestCase):
+
+    def test_enqueue_records_the_client(self):
+        with acting_for("u:7"):
+            job = jobs.enqueue("generate", {"mode": "poem", "text": "rain"})
+        self.assertEqual((job.status, job.client), (GenerationJob.QUEUED, "u:7"))
+
+    def test_queue_limit(self):
+        jobs.enqueue("generate", {})
+        with mock.patch.object(jobs, "JOB_QUEUE_LIMIT", 1):
+            with self.assertRaises(jobs.QueueFull):
+                jobs.enqueue("generate", {})
+
+    def test_claim_takes_the_oldest_once(self):
+        first = jobs.enqueue("generate", {})
+        second = jobs.enqueue("dashboard", {})
+        GenerationJob.objects.filter(pk=second.pk).update(
+            created=first.created - timedelta(seconds=1))
+        claimed = [jobs.claim(), jobs.claim(), jobs.claim()]
+        self.assertEqual([job.pk for job in claimed[:2]], [second.pk, first.pk])
+        self.assertIsNone(claimed[2])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), (GenerationJob.RUNNING, 1))
+        self.assertIsNotNone(claimed[0].started)
+
+    def test_finish_only_a_running_job(self):
+        job = jobs.enqueue("generate", {})
+        jobs.finish(job, GenerationJob.DONE, {"response": "late"})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (GenerationJob.QUEUED, None))
+
+
+class MaintainTests(TestCase):
+
+    def running(self, attempts, started_ago):
+        job = jobs.enqueue("dashboard", {})
+        GenerationJob.objects.filter(pk=job.pk).update(
+            status=GenerationJob.RUNNING, attempts=attempts,
+            started=timezone.now() - timedelta(seconds=started_ago))
+        return job
+
+    def test_requeues_an_expired_lease(self):
+        expired = self.running(1, jobs.JOB_LEASE + 5)
+        fresh = self.running(1, 5)
+        jobs.maintain()
+        expired.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((expired.status, expired.started), (GenerationJob.QUEUED, None))
+        self.assertEqual(fresh.status, GenerationJob.RUNNING)
+
+    def test_fails_a_job_out_of_attempts(self):
+        job = self.running(jobs.JOB_ATTEMPTS, jobs.JOB_LEASE + 5)
+        jobs.maintain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.FAILED)
+        self.assertTrue(job.result["response"]["is_fallback"])
+
+    def test_deletes_old_finished_jobs(self):
+        old = jobs.enqueue("generate", {})
+        recent = jobs.enqueue("generate", {})
+        now = timezone.now()
+        GenerationJob.objects.filter(pk=old.pk).update(
+            status=GenerationJob.DONE, finished=now - timedelta(seconds=jobs.JOB_RETENTION + 5))
+        GenerationJob.objects.filter(pk=recent.pk).update(status=GenerationJob.DONE, finished=now)
+        jobs.maintain()
+        self.assertEqual(list(GenerationJob.objects.values_list("pk", flat=True)), [recent.pk])
+
+
+class WorkerTests(TestCase):
+
+    def work(self, runners):
+        # What serve() does on its pool threads, on this thread, so the
+        # test's transaction sees the results.
+        worker = jobs.JobWorker(concurrency=1, runners=runners)
+        while (job := jobs.claim()) is not None:
+            worker.run(job)
+
+    def test_runs_jobs_under_their_client(self):
+        seen = []
+
+        def generate(**params):
+            seen.append((current_client(), params))
+            return {"response": "A letter."}
+
+        with acting_for("ip:1.2.3.4"):
+            job = jobs.enqueue("generate", {"mode": "poem"})
+        self.work({"generate": generate})
+        job.refresh_from_db()
+        self.assertEqual(seen, [("ip:1.2.3.4", {"mode": "poem"})])
+        self.assertEqual((job.status, job.result), (GenerationJob.DONE, {"response": "A letter."}))
+
+    def test_failed_runner_is_retried_then_fails(self):
+        calls = []
+
+        def broken(**params):
+            calls.append(1)
+            raise RuntimeError("upstream exploded")
+
+        job = jobs.enqueue("generate", {})
+        with self.assertLogs("write.jobs", "ERROR"):
+            self.work({"generate": broken})
+        job.refresh_from_db()
+        self.assertEqual(len(calls), jobs.JOB_ATTEMPTS)
+        self.assertEqual(job.status, GenerationJob.FAILED)
+        self.assertEqual(job.result, jobs.failure_result("generate"))
@@ -0,0 +1,73 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from prometheus_client.parser import text_string_to_metric_families
+
+from write import views
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.llm_service import LLM_Service
+from write.resilience import RetryPolicy
+from write.scheduler import FairScheduler
+from write.singleflight import SingleFlight
+
+
+@override_settings(RATELIMITS={}, METRICS_TOKEN="")
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        stub = self.enterContext(GeminiStub(latency=0))
+        client = GeminiClient(api_key="test", base_url=stub.base_url,
+                              retry=RetryPolicy(max_attempts=1))
+        self.enterContext(mock.patch.object(views, "llm_simple", LLM_Service(
+            client=client, cache=None, flights=SingleFlight(lock_dir=""),
+            scheduler=FairScheduler())))
+
+    def samples(self):
+        response = self.client.get("/metrics", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return {
+            (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(response.content.decode())
+            for sample in family.samples
+        }
+
+    def changes(self, series, request):
+        before = self.samples()
+        request()
+        after = self.samples()
+        return [after.get(s, 0) - before.get(s, 0) for s in series]
+
+    def get(self, params):
+        return lambda: self.client.get("/api/generate/", params, secure=True)
+
+    def test_counts_a_generation(self):
+        series = [
+            ("heartnote_responses_total", (("endpoint", "generate_text"), ("status", "200"))),
+            ("heartnote_request_duration_seconds_count",
+             (("endpoint", "generate_text"), ("mode", "poem"))),
+            ("heartnote_upstream_responses_total",
+             (("method", "generateContent"), ("model", views.llm_simple.model), ("status", "200"))),
+            ("heartnote_tokens_total", (("kind", "output"), ("mode", "poem"), ("service", "generate"))),
+            ("heartnote_upstream_queue_wait_seconds_count", (("service", "generate"),)),
+        ]
+        changes = self.changes(series, self.get({"mode": "poem", "text": "rain on glass"}))
+        self.assertEqual(changes[:3], [1, 1, 1])
+        self.assertGreater(changes[3], 0)
+        self.assertEqual(changes[4], 1)
+
+    def test_counts_safety_blocks_and_fallbacks(self):
+        series = [
+            ("heartnote_safety_blocks_total", (("category", "selfharm"), ("service", "generate"))),
+            ("heartnote_fallbacks_total", (("reason", "unknown_mode"), ("service", "generate"))),
+        ]
+        self.assertEqual(self.changes(series, self.get({"mode": "poem", "text": "i want to die"})), [1, 0])
+        self.assertEqual(self.changes(series, self.get({"mode": "sonnet", "text": "rain"})), [0, 1])
+
+    def test_token(self):
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics", secure=True).status_code, 403)
+            response = self.client.get("/metrics", secure=True,
+                                       headers={"Authorization": "Bearer secret"})
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+from importlib import import_module
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, override_settings
+
+from write import profiling, views
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.llm_service import LLM_Service
+from write.middleware import UpstreamClientMiddleware
+from write.resilience import RetryPolicy
+from write.scheduler import FairScheduler, current_client
+from write.singleflight import SingleFlight
+from write.tests import plain_static
+
+SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+
+@plain_static
+class UpstreamClientTests(TestCase):
+
+    async def test_stale_session_cookie_under_asgi(self):
+        # Not in the session cache, so reading it queries the database.
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = "stale" + "0" * 27
+        for path in ("/", "/aiwrite/", "/dashboard/", "/metrics"):
+            response = await client.get(path, secure=True)
+            self.assertLess(response.status_code, 500, path)
+
+    async def test_names_the_signed_in_user_under_asgi(self):
+        session = SessionStore()
+        session["user_id"] = 7
+        await sync_to_async(session.save)()
+        request = AsyncRequestFactory().get("/api/generate/")
+        request.session = SessionStore(session.session_key)
+        seen = []
+
+        async def view(request):
+            seen.append(current_client())
+
+        await UpstreamClientMiddleware(view)(request)
+        self.assertEqual(seen, ["u:7"])
+
+
+@override_settings(RATELIMITS={})
+class StubbedTestCase(TestCase):
+
+    def setUp(self):
+        stub = self.enterContext(GeminiStub(latency=0.05))
+        client = GeminiClient(api_key="test", base_url=stub.base_url,
+                              retry=RetryPolicy(max_attempts=1))
+        self.enterContext(mock.patch.object(views, "llm_simple", LLM_Service(
+            client=client, cache=None, flights=SingleFlight(lock_dir=""),
+            scheduler=FairScheduler())))
+
+
+class ServerTimingTests(StubbedTestCase):
+
+    def spans(self, response):
+        spans = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, duration = entry.split(";dur=")
+            spans[name] = float(duration)
+        return spans
+
+    def test_generation_phases(self):
+        params = {"mode": "poem", "text": "rain on glass"}
+        response = self.client.get("/api/generate/", params, secure=True)
+        spans = self.spans(response)
+        self.assertEqual(list(spans), ["parse", "safety", "prompt", "upstream", "encode", "total"])
+        self.assertGreaterEqual(spans["upstream"], 50)
+        self.assertGreaterEqual(spans["total"], spans["upstream"])
+
+    async def test_generation_phases_under_asgi(self):
+        params = {"mode": "poem", "text": "rain on glass"}
+        response = await AsyncClient().get("/api/generate/", params, secure=True)
+        self.assertIn("upstream", self.spans(response))
+
+    def test_every_response_gets_a_total(self):
+        response = self.client.get("/api/generate/", {"text": "rain"}, secure=True)
+        self.assertEqual(list(self.spans(response)), ["parse", "total"])
+
+    @override_settings(TIMING_LOG=True)
+    def test_stream_logs_all_phases_when_it_ends(self):
+        params = {"mode": "poem", "text": "rain on glass"}
+        with self.assertLogs("write.timing") as logs:
+            response = self.client.get("/api/generate/stream/", params, secure=True)
+            # Only the phases before the first byte fit in the header.
+            self.assertNotIn("upstream", self.spans(response))
+            self.assertEqual(logs.output, [])
+            b"".join(response.streaming_content)
+            response.close()
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line["path"], line["mode"], line["streamed"]),
+                         ("/api/generate/stream/", "poem", True))
+        self.assertIn("upstream", line["ms"])
+
+
+class ProfilingTests(StubbedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROFILE_DIR=self.directory, PROFILE_SECRET="secret",
+                                            PROFILE_SAMPLE_RATE=0.0))
+
+    def generate(self, token=None):
+        headers = {profiling.HEADER: token} if token else {}
+        return self.client.get("/api/generate/", {"mode": "poem", "text": "rain on glass"},
+                               secure=True, headers=headers)
+
+    def dumps(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_signed_header_writes_collapsed_stacks(self):
+        response = self.generate(profiling.make_token())
+        name = response[profiling.HEADER + "-File"]
+        self.assertEqual(self.dumps(), [name])
+        with open(os.path.join(self.directory, name)) as fh:
+            lines = fh.read().splitlines()
+        stacks = {}
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            stacks[stack] = int(count)
+        self.assertTrue(all(count > 0 for count in stacks.values()))
+        # The request's own thread, from the middleware down into the view.
+        self.assertTrue(any("write/middleware.py:ProfilingMiddleware.__call__" in stack
+                            and "write/views.py:generate_text" in stack for stack in stacks))
+
+    def test_unprofiled_requests_leave_nothing(self):
+        for token in (None, "forged", profiling.make_token() + "x"):
+            response = self.generate(token)
+            self.assertFalse(response.has_header(profiling.HEADER + "-File"))
+        with override_settings(PROFILE_SECRET=""):
+            self.generate(profiling.make_token())
+        self.assertEqual(self.dumps(), [])
+
+    def test_sample_rate(self):
+        with override_settings(PROFILE_SAMPLE_RATE=1.0):
+            response = self.client.get("/api/generate/", {"mode": "poem", "text": "rain"}, secure=True)
+        self.assertFalse(response.has_header(profiling.HEADER + "-File"))
+        self.assertEqual(len(self.dumps()), 1)
+
+    def test_keeps_the_newest_dumps(self):
+        for i in range(4):
+            with open(os.path.join(self.directory, f"{1000 + i}-1-1-x.folded"), "w") as fh:
+                fh.write("a;b 1\n")
+        profiling.prune_dumps(self.directory, 2)
+        self.assertEqual(self.dumps(), ["1002-1-1-x.folded", "1003-1-1-x.folded"])
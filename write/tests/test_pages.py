@@ -0,0 +1,75 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from write import pages
+from write.tests import plain_static
+
+
+class PageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.write("<p>{{ 2|add:2 }} quiet lines</p>")
+        self.enterContext(override_settings(TEMPLATES=[{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "DIRS": [str(self.directory)],
+            "OPTIONS": {"loaders": ["django.template.loaders.filesystem.Loader"]},
+        }]))
+        self.enterContext(mock.patch.dict(pages._pages, clear=True))
+
+    def write(self, source):
+        (self.directory / "page.html").write_text(source)
+
+    def get(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return pages.serve(RequestFactory().get("/", headers=headers), "page.html")
+
+    def test_serves_the_page_with_an_etag(self):
+        response = self.get()
+        self.assertEqual(response.content, b"<p>4 quiet lines</p>")
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+    def test_matching_etag_gets_a_bodyless_304(self):
+        etag = self.get()["ETag"]
+        response = self.get(etag)
+        self.assertEqual((response.status_code, response.content), (304, b""))
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get('"stale"').status_code, 200)
+
+    @override_settings(PAGE_CACHE=False)
+    def test_template_change_shows_up_without_the_page_cache(self):
+        etag = self.get()["ETag"]
+        self.write("<p>new lines</p>")
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"<p>new lines</p>")
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(PAGE_CACHE=True)
+    def test_page_cache_keeps_the_render_until_restart(self):
+        etag = self.get()["ETag"]
+        self.write("<p>new lines</p>")
+        self.assertEqual(self.get(etag).status_code, 304)
+        # A new process (deploy) renders the new template.
+        pages._pages.clear()
+        response = self.get(etag)
+        self.assertEqual(response.content, b"<p>new lines</p>")
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@plain_static
+class PageViewTests(TestCase):
+
+    def setUp(self):
+        self.enterContext(mock.patch.dict(pages._pages, clear=True))
+
+    def test_pages_and_service_worker_revalidate(self):
+        for path in ("/", "/aiwrite/", "/service-worker.js"):
+            response = self.client.get(path, secure=True)
+            self.assertEqual(response.status_code, 200, path)
+            response = self.client.get(path, secure=True, headers={"If-None-Match": response["ETag"]})
+            self.assertEqual(response.status_code, 304, path)
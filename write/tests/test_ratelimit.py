@@ -0,0 +1,90 @@
+import os
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from write.ratelimit import LocalBucketStore, SQLiteBucketStore, find_limit
+
+LIMITS = {
+    "/api/generate/": {"*": (10, 20), "journal": (2, 4)},
+    "/api/generate/stream/": {"poem": (5, 10)},
+    "/api/dashboard/": {"letters": (3, 6)},
+}
+
+
+class BucketStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "buckets", "ratelimit.sqlite3")
+
+    def test_spends_and_refills(self):
+        for store in (SQLiteBucketStore(self.path), LocalBucketStore()):
+            self.assertEqual(store.take("k", 2, 1.0, now=100), (True, 1))
+            self.assertEqual(store.take("k", 2, 1.0, now=100), (True, 0))
+            self.assertEqual(store.take("k", 2, 1.0, now=100), (False, 0))
+            self.assertEqual(store.take("k", 2, 1.0, now=100.5), (False, 0.5))
+            self.assertEqual(store.take("k", 2, 1.0, now=101), (True, 0))
+            # Never refills past capacity.
+            self.assertEqual(store.take("k", 2, 1.0, now=1000), (True, 1))
+
+    def test_stores_on_one_file_share_buckets(self):
+        first, second = SQLiteBucketStore(self.path), SQLiteBucketStore(self.path)
+        self.assertTrue(first.take("k", 1, 0.001, now=100)[0])
+        self.assertFalse(second.take("k", 1, 0.001, now=100)[0])
+
+    def test_concurrent_takes_never_double_spend(self):
+        store = SQLiteBucketStore(self.path)
+        allowed = []
+
+        def take():
+            for _ in range(10):
+                allowed.append(store.take("k", 25, 0.0, now=100)[0])
+
+        threads = [threading.Thread(target=take) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(allowed.count(True), 25)
+
+    def test_prune_drops_old_buckets(self):
+        store = SQLiteBucketStore(self.path)
+        store.take("old", 1, 1.0, now=100)
+        store.take("new", 1, 1.0, now=100 + store.PRUNE_AGE)
+        store.prune(now=100 + store.PRUNE_AGE + 1)
+        keys = [row[0] for row in store.conn.execute("SELECT key FROM buckets")]
+        self.assertEqual(keys, ["new"])
+
+
+class FindLimitTests(SimpleTestCase):
+
+    def test_longest_prefix_and_mode(self):
+        limit = find_limit(LIMITS, "/api/generate/stream/", "Poem ")
+        self.assertEqual((limit.endpoint, limit.mode, limit.burst), ("/api/generate/stream/", "poem", 5))
+        limit = find_limit(LIMITS, "/api/generate/", "journal")
+        self.assertEqual((limit.mode, limit.burst), ("journal", 2))
+
+    def test_falls_back_to_wildcard(self):
+        limit = find_limit(LIMITS, "/api/generate/", "poem")
+        self.assertEqual((limit.mode, limit.burst, limit.rate), ("*", 10, 20 / 60))
+
+    def test_unlimited(self):
+        self.assertIsNone(find_limit(LIMITS, "/login/", "poem"))
+        self.assertIsNone(find_limit(LIMITS, "/api/dashboard/", "poems"))
+        # A more specific prefix without the mode doesn't fall back to
+        # the shorter one.
+        self.assertIsNone(find_limit(LIMITS, "/api/generate/stream/", "journal"))
+
+    def test_headers(self):
+        limit = find_limit(LIMITS, "/api/generate/", "poem")
+        self.assertEqual(limit.headers(4.5), {
+            "RateLimit-Limit": "10",
+            "RateLimit-Remaining": "4",
+            "RateLimit-Reset": "17",
+            "RateLimit-Policy": "10;w=30",
+        })
+        self.assertEqual(limit.retry_after(0.5), 2)
+        self.assertEqual(limit.retry_after(0.99), 1)
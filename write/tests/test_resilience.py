@@ -0,0 +1,187 @@
+import asyncio
+import socket
+import time
+from email.utils import formatdate
+
+import requests
+from django.test import SimpleTestCase
+
+from write.gemini_client import GeminiClient
+from write.ratelimit import LocalBucketStore
+from write.resilience import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable, retry_after,
+)
+from write.router import GeminiRouter
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f"{status} Error", response=response)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record(http_error(503))
+        breaker.allow()
+        breaker.record(http_error(503))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.available())
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+    def test_client_errors_and_successes_reset_the_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record(http_error(503))
+        breaker.record(http_error(400))
+        breaker.record(http_error(503))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_probes=1)
+        breaker.record(requests.exceptions.ConnectionError())
+        time.sleep(0.06)
+        self.assertTrue(breaker.available())
+        breaker.allow()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one probe at a time.
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record(http_error(500))
+        time.sleep(0.06)
+        breaker.allow()
+        breaker.record(http_error(500))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_released_probe_goes_to_the_next_caller(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record(http_error(503))
+        breaker.allow()
+        breaker.release()
+        breaker.allow()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_lost_probe_times_out(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, probe_timeout=0.05)
+        breaker.record(http_error(503))
+        time.sleep(0.06)
+        breaker.allow()
+        time.sleep(0.06)
+        # Back to open, then half-open again once reset_timeout passes.
+        self.assertFalse(breaker.available())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        breaker.allow()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class CancelledProbeTests(SimpleTestCase):
+
+    def setUp(self):
+        # Accepts connections and never answers, so every call is
+        # cancelled before its response headers.
+        silent = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(silent.close)
+        self.base_url = f"http://127.0.0.1:{silent.getsockname()[1]}/v1beta"
+        self.payload = GeminiClient.build_payload(None, "rain", 0.5)
+
+    def half_open(self, breaker):
+        breaker.record(http_error(503))
+        self.assertTrue(breaker.available())
+
+    def cancel(self, call):
+        async def main():
+            task = asyncio.ensure_future(call())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(main())
+
+    def test_cancelled_client_call(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client = GeminiClient(api_key="test", base_url=self.base_url, breaker=breaker)
+        self.half_open(breaker)
+        self.cancel(lambda: client.agenerate_content(self.payload, model="m"))
+        breaker.allow()
+
+    def test_cancelled_client_stream(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client = GeminiClient(api_key="test", base_url=self.base_url, breaker=breaker)
+        self.half_open(breaker)
+
+        async def consume():
+            async for _ in client.astream_generate(self.payload, model="m"):
+                pass
+
+        self.cancel(consume)
+        breaker.allow()
+
+    def test_cancelled_routed_calls(self):
+        router = GeminiRouter([("key", self.base_url)], ["m"], store=LocalBucketStore())
+        route = router.routes[0]
+        route.client.breaker = breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+
+        async def consume():
+            async for _ in router.astream_generate(self.payload, model="m"):
+                pass
+
+        for call in (lambda: router.agenerate_content(self.payload, model="m"), consume):
+            self.half_open(breaker)
+            self.cancel(call)
+            self.assertEqual(breaker.probes, 0)
+            self.assertEqual(route.inflight, 0)
+            self.assertIs(router.pick("m", "generate"), route)
+            router.release(route)
+
+
+class RetryPolicyTests(SimpleTestCase):
+
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(http_error(429)))
+        self.assertTrue(is_retryable(http_error(503)))
+        self.assertTrue(is_retryable(requests.exceptions.ConnectionError()))
+        self.assertFalse(is_retryable(http_error(400)))
+        self.assertFalse(is_retryable(requests.exceptions.ReadTimeout()))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(http_error(429, {"Retry-After": "3"})), 3.0)
+        date = formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(retry_after(http_error(429, {"Retry-After": date})), 30, delta=2)
+        self.assertIsNone(retry_after(http_error(429, {"Retry-After": "soon"})))
+        self.assertIsNone(retry_after(http_error(429)))
+
+    def test_backoff_is_jittered_and_bounded(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=1.0, budget_cap=100)
+        for attempt in range(4):
+            delay = policy.backoff(attempt, http_error(503))
+            self.assertTrue(0 <= delay <= min(1.0, 0.5 * 2 ** attempt))
+        self.assertIsNone(policy.backoff(4, http_error(503)))
+
+    def test_backoff_honours_retry_after(self):
+        policy = RetryPolicy(max_attempts=3, max_delay=4)
+        self.assertEqual(policy.backoff(0, http_error(429, {"Retry-After": "2"})), 2.0)
+        # Longer than we are willing to wait: give up instead.
+        self.assertIsNone(policy.backoff(0, http_error(429, {"Retry-After": "30"})))
+
+    def test_gives_up_on_non_retryable(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertIsNone(policy.backoff(0, http_error(400)))
+        self.assertIsNone(policy.backoff(0, requests.exceptions.ReadTimeout()))
+
+    def test_budget_limits_retries(self):
+        policy = RetryPolicy(max_attempts=3, budget_ratio=0.5, budget_cap=1)
+        self.assertIsNotNone(policy.backoff(0, http_error(503)))
+        self.assertIsNone(policy.backoff(0, http_error(503)))
+        policy.deposit()
+        policy.deposit()
+        self.assertIsNotNone(policy.backoff(0, http_error(503)))
@@ -0,0 +1,129 @@
+import asyncio
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.llm_service import LLM_Service
+from write.metrics import CACHE_LOOKUPS
+from write.resilience import RetryPolicy
+from write.response_cache import ResponseCache, make_key
+from write.scheduler import FairScheduler
+from write.singleflight import SingleFlight
+
+
+def lookups(result):
+    return CACHE_LOOKUPS.labels(result)._value.get()
+
+
+class SharedCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "responses": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": directory,
+            },
+        }))
+
+
+class ResponseCacheTests(SharedCacheTestCase):
+
+    def test_keys_ignore_case_and_spacing(self):
+        self.assertEqual(make_key("generate", "Rain  on glass "), make_key("generate", "rain on glass"))
+        self.assertNotEqual(make_key("generate", "rain"), make_key("dashboard", "rain"))
+        self.assertNotEqual(make_key("generate", "a", "b c"), make_key("generate", "a b", "c"))
+
+    def test_miss_then_memory_then_file(self):
+        cache = ResponseCache()
+        before = {r: lookups(r) for r in ("local", "shared", "miss")}
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", "A letter.")
+        self.assertEqual(cache.get("k"), "A letter.")
+        # Another worker has only the file tier, and fills its memory tier.
+        other = ResponseCache()
+        self.assertEqual(other.get("k"), "A letter.")
+        self.assertEqual(other.get("k"), "A letter.")
+        after = {r: lookups(r) - before[r] for r in before}
+        self.assertEqual(after, {"local": 2, "shared": 1, "miss": 1})
+
+    def test_entries_expire(self):
+        cache = ResponseCache(local_ttl=0.05, shared_ttl=0.2)
+        cache.set("k", "A letter.")
+        time.sleep(0.1)
+        # Gone from memory, still on file.
+        self.assertNotIn("k", cache.local)
+        self.assertEqual(cache.get("k"), "A letter.")
+        time.sleep(0.15)
+        self.assertIsNone(cache.get_shared("k"))
+
+    def test_async(self):
+        cache = ResponseCache()
+
+        async def main():
+            self.assertIsNone(await cache.aget("k"))
+            await cache.aset("k", "A letter.")
+            return await ResponseCache().aget("k")
+
+        self.assertEqual(asyncio.run(main()), "A letter.")
+
+    @override_settings(CACHES={"responses": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": "/dev/null/responses",
+    }})
+    def test_broken_file_tier_is_ignored(self):
+        cache = ResponseCache()
+        cache.set("k", "A letter.")
+        self.assertEqual(cache.get("k"), "A letter.")
+        self.assertIsNone(ResponseCache().get("k"))
+
+
+class ServiceCacheTests(SharedCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stub = GeminiStub(latency=0.2).start()
+        self.addCleanup(self.stub.stop)
+        client = GeminiClient(api_key="test", base_url=self.stub.base_url,
+                              retry=RetryPolicy(max_attempts=1))
+        self.service = LLM_Service(client=client, cache=ResponseCache(),
+                                   flights=SingleFlight(lock_dir=""),
+                                   scheduler=FairScheduler())
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.service.generate("poem", "rain on glass")
+        self.assertEqual(self.service.generate("poem", "Rain on  glass"), first)
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_regenerate_bypasses_the_cache(self):
+        self.service.generate("poem", "rain on glass")
+        self.service.generate("poem", "rain on glass", use_cache=False)
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_regenerate_does_not_join_a_request_in_flight(self):
+        threads = [
+            threading.Thread(target=self.service.generate, args=("poem", "rain on glass")),
+            threading.Thread(target=self.service.generate, args=("poem", "rain on glass"),
+                             kwargs={"use_cache": False}),
+        ]
+        threads[0].start()
+        time.sleep(0.05)
+        threads[1].start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_async_regenerate_does_not_join_a_request_in_flight(self):
+        async def main():
+            normal = asyncio.ensure_future(self.service.agenerate("poem", "rain on glass"))
+            await asyncio.sleep(0.05)
+            await self.service.agenerate("poem", "rain on glass", use_cache=False)
+            await normal
+
+        asyncio.run(main())
+        self.assertEqual(self.stub.requests, 2)
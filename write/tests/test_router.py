@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import requests
+from django.test import SimpleTestCase
+
+from write.gemini_client import GeminiClient, payload_for_model
+from write.gemini_stub import GeminiStub
+from write.ratelimit import LocalBucketStore
+from write.resilience import status_of
+from write.router import GeminiRouter, NoRouteAvailable
+
+PAYLOAD = GeminiClient.build_payload(None, "rain on glass", 0.5)
+
+
+class GeminiRouterTests(SimpleTestCase):
+
+    def stubs(self, first=None, second=None):
+        stubs = [GeminiStub(latency=0, **(first or {})).start(),
+                 GeminiStub(latency=0, **(second or {})).start()]
+        for stub in stubs:
+            self.addCleanup(stub.stop)
+        return stubs
+
+    def router(self, stubs, models=("m",), **kwargs):
+        keys = [(f"key-{i}", stub.base_url) for i, stub in enumerate(stubs)]
+        return GeminiRouter(keys, models, store=LocalBucketStore(), **kwargs)
+
+    def test_prefers_the_faster_model(self):
+        router = self.router(self.stubs(), models=("slow", "fast"))
+        self.assertEqual(router.pick("slow", "generate").model, "slow")
+        router.sample("slow", "generate", 1.0)
+        router.sample("fast", "generate", 0.5)
+        self.assertEqual(router.pick("slow", "generate").model, "fast")
+        # Not fast enough to beat the penalty for being listed later.
+        router.sample("fast", "generate", 5.0)
+        self.assertEqual(router.pick("slow", "generate").model, "slow")
+
+    def test_reprobes_a_model_not_measured_lately(self):
+        router = self.router(self.stubs(), models=("first", "second"))
+        router.sample("first", "generate", 0.1)
+        self.assertEqual(router.pick("first", "generate").model, "second")
+        self.assertEqual(router.pick("first", "generate").model, "first")
+
+    def test_spreads_calls_between_keys(self):
+        router = self.router(self.stubs())
+        keys = {router.pick("m", "generate").key for _ in range(2)}
+        self.assertEqual(keys, {"key0", "key1"})
+
+    def test_fails_over_on_429_and_rests_the_route(self):
+        throttled, healthy = self.stubs(
+            first={"burst_every": 60, "burst_length": 60, "retry_after": 30})
+        router = self.router([throttled, healthy])
+        router.routes[1].picked = 1     # key0 goes first
+        for _ in range(2):
+            router.generate_content(PAYLOAD, model="m")
+        self.assertEqual(throttled.throttled, 1)
+        self.assertEqual(healthy.requests, 2)
+        self.assertGreater(router.routes[0].resting_until, time.monotonic() + 20)
+        self.assertEqual([r.inflight for r in router.routes], [0, 0])
+
+    def test_does_not_fail_over_client_errors(self):
+        stubs = self.stubs()
+        router = self.router(stubs)
+        payload = dict(PAYLOAD, cachedContent="cachedContents/gone")
+        with self.assertRaises(requests.exceptions.HTTPError) as raised:
+            router.generate_content(payload, model="m")
+        self.assertEqual(status_of(raised.exception), 404)
+        self.assertEqual(sum(stub.requests for stub in stubs), 1)
+
+    def test_stream_fails_over_before_the_first_text(self):
+        broken, healthy = self.stubs(first={"error_rate": 1.0})
+        router = self.router([broken, healthy])
+        router.routes[1].picked = 1
+        text = "".join(router.stream_generate(PAYLOAD, model="m"))
+        self.assertEqual(text, healthy.text)
+        self.assertEqual((broken.errors, healthy.requests), (1, 1))
+
+    def test_async_fails_over(self):
+        broken, healthy = self.stubs(first={"error_rate": 1.0})
+        router = self.router([broken, healthy])
+        router.routes[1].picked = 1
+
+        async def main():
+            try:
+                return await router.agenerate_content(PAYLOAD, model="m")
+            finally:
+                await router.aclose()
+
+        data = asyncio.run(main())
+        self.assertEqual(data["candidates"][0]["content"]["parts"][0]["text"], healthy.text)
+        self.assertEqual(broken.errors, 1)
+
+    def test_key_quota(self):
+        router = self.router(self.stubs(), key_rpm=1)
+        for _ in range(2):
+            router.release(router.pick("m", "generate"))
+        with self.assertRaises(NoRouteAvailable):
+            router.pick("m", "generate")
+
+    def test_cached_instruction_goes_inline_elsewhere(self):
+        router = self.router(self.stubs())
+        name = router.create_cached_content("m", "Write softly.", 60)
+        payload = dict(PAYLOAD, cachedContent=name)
+        owner = router._handles[name][0]
+        other = next(r for r in router.routes if r is not owner)
+        self.assertIs(router.payload_for(owner, payload), payload)
+        inline = router.payload_for(other, payload)
+        self.assertNotIn("cachedContent", inline)
+        self.assertEqual(inline["systemInstruction"], {"parts": [{"text": "Write softly."}]})
+
+
+class ThinkingBudgetTests(SimpleTestCase):
+
+    def test_flash_keeps_budget_zero(self):
+        payload = GeminiClient.build_payload(None, "rain", 0.5, max_output_tokens=200,
+                                             thinking_budget=0)
+        self.assertIs(payload_for_model(payload, "gemini-2.5-flash"), payload)
+
+    def test_pro_gets_its_minimum_budget(self):
+        payload = GeminiClient.build_payload(None, "rain", 0.5, max_output_tokens=200,
+                                             thinking_budget=0)
+        config = payload_for_model(payload, "gemini-2.5-pro")["generationConfig"]
+        self.assertEqual(config["thinkingConfig"], {"thinkingBudget": 128})
+        self.assertEqual(config["maxOutputTokens"], 328)
+        # The shared payload is left alone for the other routes.
+        self.assertEqual(payload["generationConfig"]["thinkingConfig"], {"thinkingBudget": 0})
+
+    def test_dynamic_budget_is_left_alone(self):
+        payload = GeminiClient.build_payload(None, "rain", 0.5, thinking_budget=-1)
+        self.assertIs(payload_for_model(payload, "gemini-2.5-pro"), payload)
@@ -0,0 +1,50 @@
+import re
+
+from django.test import SimpleTestCase
+
+from write.safety import BLOCKLIST, SELFHARM, SafetyFilter, safety, trie_regex
+
+
+class TrieRegexTests(SimpleTestCase):
+
+    def test_shared_prefixes_are_merged(self):
+        self.assertEqual(trie_regex(["kill me", "kill myself"]), r"kill\ m(?:e|yself)")
+
+    def test_longer_pattern_preferred(self):
+        regex = re.compile(trie_regex(["die", "die now"]))
+        self.assertEqual(regex.search("i want to die now").group(), "die now")
+
+
+class SafetyFilterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.filter = SafetyFilter(["you idiot", "Shut up"], ["hurt you", "end it all"])
+
+    def test_clean_text(self):
+        self.assertIsNone(self.filter.scan("rain on the window"))
+        self.assertIsNone(self.filter.scan(""))
+        self.assertIsNone(self.filter.scan(None))
+
+    def test_categories(self):
+        self.assertEqual(self.filter.scan("I just want to END IT ALL"), SELFHARM)
+        self.assertEqual(self.filter.scan("oh shut up"), BLOCKLIST)
+
+    def test_matches_inside_words_like_substring_scan(self):
+        self.assertEqual(self.filter.scan("pretend it allows"), SELFHARM)
+
+    def test_blocklist_wins_when_matches_overlap(self):
+        # "hurt you" and "you idiot" share "you"; a single left-to-right
+        # pass would consume it for the self-harm phrase.
+        self.assertEqual(self.filter.scan("i will hurt you idiot"), BLOCKLIST)
+
+    def test_blocklist_wins_when_both_lists_hold_a_phrase(self):
+        both = SafetyFilter(["kill you"], ["kill you", "die"])
+        self.assertEqual(both.scan("kill you"), BLOCKLIST)
+        self.assertEqual(both.patterns[SELFHARM], ["die"])
+
+    def test_empty_lists(self):
+        self.assertIsNone(SafetyFilter([], []).scan("anything"))
+
+    def test_shipped_patterns_load(self):
+        self.assertTrue(safety.patterns[BLOCKLIST])
+        self.assertTrue(safety.patterns[SELFHARM])
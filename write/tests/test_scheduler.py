@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from write.scheduler import FairScheduler, Overloaded, acting_for, current_client
+
+
+class FairSchedulerTests(SimpleTestCase):
+
+    def queue(self, scheduler, client):
+        with acting_for(client):
+            waiter = scheduler.admit("test", time.perf_counter() + 60)
+        self.assertIsNotNone(waiter)
+        return waiter
+
+    def test_acting_for_restores_the_client(self):
+        with acting_for("u:1"):
+            with acting_for("ip:1.2.3.4"):
+                self.assertEqual(current_client(), "ip:1.2.3.4")
+            self.assertEqual(current_client(), "u:1")
+        self.assertEqual(current_client(), "")
+
+    def test_slots_up_to_concurrency(self):
+        scheduler = FairScheduler(concurrency=2, deadline=60)
+        self.assertIsNone(scheduler.admit("test", time.perf_counter() + 60))
+        self.assertIsNone(scheduler.admit("test", time.perf_counter() + 60))
+        waiter = self.queue(scheduler, "ip:a")
+        self.assertEqual((scheduler.active, scheduler.queued), (2, 1))
+        scheduler.release(0.1)
+        self.assertTrue(waiter.granted)
+        self.assertEqual((scheduler.active, scheduler.queued), (2, 0))
+        scheduler.release(0.1)
+        scheduler.release(0.1)
+        self.assertEqual(scheduler.active, 0)
+
+    def test_weighted_round_robin(self):
+        scheduler = FairScheduler(concurrency=1, deadline=60)
+        scheduler.admit("test", time.perf_counter() + 60)
+        # One busy session queues first; an anonymous visitor still gets
+        # a turn after every two of its calls.
+        for client in ["u:1"] * 4 + ["ip:a"] * 2:
+            self.queue(scheduler, client)
+        served = []
+        for _ in range(6):
+            front = next(iter(scheduler._queues))
+            scheduler.release(0.1)
+            served.append(front)
+        self.assertEqual(served, ["u:1", "u:1", "ip:a", "u:1", "u:1", "ip:a"])
+
+    def test_sheds_when_expected_wait_passes_the_deadline(self):
+        scheduler = FairScheduler(concurrency=1, deadline=60)
+        scheduler.admit("test", time.perf_counter() + 60)
+        scheduler.service_time = 5.0
+        with self.assertRaises(Overloaded):
+            scheduler.admit("test", time.perf_counter() + 1)
+        self.assertEqual(scheduler.queued, 0)
+
+    def test_sheds_when_the_deadline_passes_while_waiting(self):
+        scheduler = FairScheduler(concurrency=1, deadline=0.1)
+        scheduler.service_time = 0.01
+        held = threading.Event()
+        done = threading.Event()
+
+        def hold():
+            with scheduler.slot("test"):
+                held.set()
+                done.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        with self.assertRaises(Overloaded):
+            with scheduler.slot("test"):
+                pass
+        done.set()
+        holder.join()
+        self.assertEqual((scheduler.active, scheduler.queued), (0, 0))
+
+    def test_measures_service_time(self):
+        scheduler = FairScheduler(concurrency=1)
+        with scheduler.slot("test"):
+            time.sleep(0.05)
+        self.assertTrue(scheduler.measured)
+        self.assertAlmostEqual(scheduler.service_time, 0.05, delta=0.04)
+
+    def test_threads_and_coroutines_share_slots(self):
+        scheduler = FairScheduler(concurrency=1, deadline=5)
+        scheduler.service_time = 0.01
+        order = []
+
+        async def call(name):
+            async with scheduler.aslot("test"):
+                order.append(name)
+                await asyncio.sleep(0.02)
+
+        async def main():
+            with scheduler.slot("test"):
+                tasks = [asyncio.ensure_future(call(i)) for i in range(3)]
+                await asyncio.sleep(0.05)
+                self.assertEqual(scheduler.queued, 3)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual((scheduler.active, scheduler.queued), (0, 0))
+
+    def test_cancelled_waiter_gives_its_place_back(self):
+        scheduler = FairScheduler(concurrency=1, deadline=5)
+        scheduler.service_time = 0.01
+
+        async def main():
+            with scheduler.slot("test"):
+                async def wait():
+                    async with scheduler.aslot("test"):
+                        pass
+                task = asyncio.ensure_future(wait())
+                await asyncio.sleep(0.02)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                self.assertEqual(scheduler.queued, 0)
+
+        asyncio.run(main())
+        self.assertEqual(scheduler.active, 0)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from write.tests import plain_static
+
+
+@plain_static
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SessionBackendTests(TestCase):
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "sessions": {
+                "BACKEND": "write.cache_backends.UnculledFileBasedCache",
+                "LOCATION": self.directory,
+            },
+        }))
+
+    def round_trip(self, stored):
+        self.assertRedirects(self.client.get("/dashboard/", secure=True), "/",
+                             fetch_redirect_response=False)
+        response = self.client.post("/api/signup/", {
+            "username": "mira", "email": "mira@example.com", "password": "quiet rain"},
+            secure=True)
+        self.assertEqual(response.json(), {"status": "ok"})
+        self.assertEqual(self.client.get("/dashboard/", secure=True).status_code, 200)
+        self.assertRedirects(self.client.get("/", secure=True), "/dashboard/",
+                             fetch_redirect_response=False)
+        self.assertEqual(Session.objects.exists(), stored)
+        response = self.client.post("/api/delete-account/", secure=True)
+        self.assertEqual(response.json(), {"status": "deleted"})
+        self.assertFalse(Session.objects.exists())
+        self.assertRedirects(self.client.get("/dashboard/", secure=True), "/",
+                             fetch_redirect_response=False)
+
+    def test_each_backend_keeps_a_login(self):
+        for name, engine in settings.SESSION_ENGINES.items():
+            with self.subTest(name), override_settings(SESSION_ENGINE=engine):
+                # A fresh client loads SessionMiddleware with this engine.
+                self.client = self.client_class()
+                self.round_trip(stored=name != "signed_cookies")
+
+    @override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["cached_db"])
+    def test_cached_db_writes_through(self):
+        self.client.post("/api/signup/", {
+            "username": "mira", "email": "mira@example.com", "password": "quiet rain"},
+            secure=True)
+        key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertTrue(Session.objects.filter(session_key=key).exists())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        # A warm page load reads the cache only.
+        with self.assertNumQueries(0):
+            self.client.get("/dashboard/", secure=True)
+
+    @override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["signed_cookies"])
+    def test_signed_cookies_keep_no_server_state(self):
+        self.client.post("/api/signup/", {
+            "username": "mira", "email": "mira@example.com", "password": "quiet rain"},
+            secure=True)
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["cached_db"])
+    def test_cleanup_removes_expired_cache_files(self):
+        cache = caches["sessions"]
+        cache.set("old", "x", timeout=1)
+        cache.set("new", "y", timeout=60)
+        time.sleep(1.1)
+        call_command("cleanup_sessions", stdout=StringIO())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(cache.get("new"), "y")
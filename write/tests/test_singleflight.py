@@ -0,0 +1,168 @@
+import asyncio
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from write.singleflight import SingleFlight
+
+
+class SingleFlightThreadTests(SimpleTestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight(lock_dir="")
+        calls = []
+        started = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "letter"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do("k", fetch)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flights.do("k", fetch)))
+                     for _ in range(3)]
+        for t in followers:
+            t.start()
+        for t in [leader] + followers:
+            t.join()
+        self.assertEqual(results, ["letter"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.coalesced, 3)
+
+    def test_error_reaches_followers(self):
+        flights = SingleFlight(lock_dir="")
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("upstream")
+
+        errors = []
+
+        def run():
+            try:
+                flights.do("k", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run)]
+        threads[0].start()
+        started.wait()
+        threads.append(threading.Thread(target=run))
+        threads[1].start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(errors), 2)
+
+    def test_waiting_worker_rechecks_cache(self):
+        lock_dir = tempfile.mkdtemp()
+        first, second = SingleFlight(lock_dir=lock_dir), SingleFlight(lock_dir=lock_dir)
+        cache = {}
+
+        def slow():
+            time.sleep(0.2)
+            cache["k"] = "shared"
+            return "shared"
+
+        t = threading.Thread(target=lambda: first.do("k", slow, lambda: cache.get("k")))
+        t.start()
+        time.sleep(0.05)
+        result = second.do("k", lambda: "called again", lambda: cache.get("k"))
+        t.join()
+        self.assertEqual(result, "shared")
+
+    def test_lock_wait_is_bounded(self):
+        lock_dir = tempfile.mkdtemp()
+        first = SingleFlight(lock_dir=lock_dir)
+        second = SingleFlight(lock_dir=lock_dir, lock_timeout=0.2)
+        t = threading.Thread(target=lambda: first.do("k", lambda: time.sleep(1), lambda: None))
+        t.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        self.assertEqual(second.do("k", lambda: "own", lambda: None), "own")
+        self.assertLess(time.monotonic() - started, 0.6)
+        t.join()
+
+    def test_no_recheck_skips_the_process_lock(self):
+        lock_dir = tempfile.mkdtemp()
+        first, second = SingleFlight(lock_dir=lock_dir), SingleFlight(lock_dir=lock_dir)
+        t = threading.Thread(target=lambda: first.do("k", lambda: time.sleep(1), lambda: None))
+        t.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        self.assertEqual(second.do("k", lambda: "regenerated"), "regenerated")
+        self.assertLess(time.monotonic() - started, 0.5)
+        t.join()
+
+
+class SingleFlightAsyncTests(SimpleTestCase):
+
+    def test_followers_share_the_call(self):
+        flights = SingleFlight(lock_dir="")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "poem"
+
+        async def main():
+            return await asyncio.gather(*(flights.ado("k", fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ["poem"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_leader_cancelled_follower_still_gets_result(self):
+        flights = SingleFlight(lock_dir="")
+
+        async def fetch():
+            await asyncio.sleep(0.1)
+            return "poem"
+
+        async def main():
+            leader = asyncio.create_task(flights.ado("k", fetch))
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(flights.ado("k", fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), "poem")
+
+    def test_call_cancelled_when_nobody_waits(self):
+        flights = SingleFlight(lock_dir="")
+        finished = []
+
+        async def fetch():
+            await asyncio.sleep(0.1)
+            finished.append(1)
+
+        async def main():
+            waiter = asyncio.create_task(flights.ado("k", fetch))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.sleep(0.15)
+
+        asyncio.run(main())
+        self.assertEqual(finished, [])
+        self.assertEqual(flights._async_calls, {})
+
+    def test_error_reaches_every_waiter(self):
+        flights = SingleFlight(lock_dir="")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream")
+
+        async def main():
+            return await asyncio.gather(
+                *(flights.ado("k", fail) for _ in range(3)), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, ValueError) for r in asyncio.run(main())))
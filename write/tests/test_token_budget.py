@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+
+from write.token_budget import (
+    MAX_OUTPUT_TOKENS, OUTPUT_OVERHEAD, REJECTED, TRIMMED, estimate_tokens, fit_text,
+    output_budget, script_language, words_for,
+)
+
+
+class EstimateTests(SimpleTestCase):
+
+    def test_latin_and_devanagari(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        # Devanagari runs shorter per token, so the same length costs more.
+        self.assertEqual(estimate_tokens("नमस्ते"), 3)
+        self.assertGreater(estimate_tokens("बारिश की बूँदें"), estimate_tokens("rain drops here"))
+
+    def test_script_language(self):
+        self.assertEqual(script_language("rain on glass"), "English")
+        self.assertEqual(script_language("बारिश की बूँदें"), "Hindi")
+        self.assertEqual(script_language("", default="Hindi"), "Hindi")
+
+    def test_output_budget(self):
+        self.assertEqual(output_budget(100), 210 + OUTPUT_OVERHEAD)
+        self.assertGreater(output_budget(100, "Hindi"), output_budget(100))
+        self.assertEqual(output_budget(100, "Klingon"), output_budget(100))
+        self.assertEqual(output_budget(10_000), MAX_OUTPUT_TOKENS)
+
+    def test_words_for(self):
+        self.assertEqual(words_for(300), 210)
+        self.assertEqual(words_for(1), 10)
+
+
+class FitTextTests(SimpleTestCase):
+
+    def test_fits(self):
+        self.assertEqual(fit_text("rain on glass", 10), ("rain on glass", None))
+
+    def test_trims_at_a_word_boundary(self):
+        text = "the rain kept tracing slow lines down the window all evening long"
+        fitted, action = fit_text(text, 8)
+        self.assertEqual(action, TRIMMED)
+        self.assertTrue(fitted.endswith("…"))
+        self.assertLessEqual(estimate_tokens(fitted), 8)
+        self.assertTrue(text.startswith(fitted[:-1]))
+        self.assertNotEqual(fitted[-2], " ")
+
+    def test_rejects_far_over_unless_told_not_to(self):
+        text = "word " * 200
+        self.assertEqual(fit_text(text, 10), (text, REJECTED))
+        fitted, action = fit_text(text, 10, reject=False)
+        self.assertEqual(action, TRIMMED)
+        self.assertLessEqual(estimate_tokens(fitted), 10)
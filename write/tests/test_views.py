@@ -0,0 +1,278 @@
+import json
+import threading
+from unittest import mock
+
+import httpx
+import requests
+from django.contrib.auth.hashers import check_password
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import path
+
+from write import views
+from write.dashboard_llm_service import Dashboard_LLM_Service
+from write.gemini_client import GeminiClient
+from write.gemini_stub import GeminiStub
+from write.hashing import HashingPool
+from write.llm_service import LLM_Service
+from write.models import HeartUser
+from write.resilience import RetryPolicy
+from write.scheduler import FairScheduler
+from write.singleflight import SingleFlight
+
+# The async views, which write/urls.py only routes under HEARTNOTE_ASYNC=1,
+# next to the sync streams, batch and signup.
+urlpatterns = [
+    path("api/generate/", views.agenerate_text),
+    path("api/dashboard/", views.agenerate_dashboard),
+    path("api/generate/stream/", views.agenerate_text_stream),
+    path("api/dashboard/stream/", views.agenerate_dashboard_stream),
+    path("sync/api/generate/stream/", views.generate_text_stream),
+    path("sync/api/dashboard/stream/", views.generate_dashboard_stream),
+    path("api/dashboard/batch/", views.agenerate_dashboard_batch),
+    path("sync/api/dashboard/batch/", views.generate_dashboard_batch),
+    path("api/signup/", views.asignup_api),
+    path("sync/api/signup/", views.signup_api),
+]
+
+FEELING = {"mode": "poems", "name": "Rain", "desc": "a quiet evening"}
+
+
+class CutOffClient(GeminiClient):
+    # Sends the first words, then loses the connection.
+
+    def stream_generate(self, payload, model=None, on_data=None):
+        yield "A quiet"
+        raise requests.exceptions.ChunkedEncodingError("connection lost")
+
+    async def astream_generate(self, payload, model=None, on_data=None):
+        yield "A quiet"
+        raise httpx.RemoteProtocolError("connection lost")
+
+
+class FailsJournals(GeminiClient):
+    # Journal prompts carry a date; every other mode gets through.
+
+    def generate_content(self, payload, model=None):
+        if "Date:" in json.dumps(payload):
+            raise requests.exceptions.ConnectionError("connection refused")
+        return super().generate_content(payload, model=model)
+
+    async def agenerate_content(self, payload, model=None):
+        if "Date:" in json.dumps(payload):
+            raise httpx.ConnectError("connection refused")
+        return await super().agenerate_content(payload, model=model)
+
+
+@override_settings(ROOT_URLCONF=__name__, RATELIMITS={})
+class ViewTestCase(TestCase):
+
+    def serve(self, client_class=GeminiClient, **stub):
+        self.stub = GeminiStub(latency=0, **stub).start()
+        self.addCleanup(self.stub.stop)
+        client = client_class(api_key="test", base_url=self.stub.base_url,
+                              retry=RetryPolicy(max_attempts=1))
+        shared = {"client": client, "cache": None, "flights": SingleFlight(lock_dir=""),
+                  "scheduler": FairScheduler()}
+        self.enterContext(mock.patch.object(views, "llm_simple", LLM_Service(**shared)))
+        self.enterContext(mock.patch.object(views, "dashboard_llm", Dashboard_LLM_Service(**shared)))
+
+    async def get(self, url, params):
+        return await AsyncClient().get(url, params, secure=True)
+
+
+class AsyncViewTests(ViewTestCase):
+
+    async def test_generates_text(self):
+        self.serve()
+        response = await self.get("/api/generate/", {"mode": "poem", "text": "rain on glass"})
+        self.assertEqual(response.json(), {"response": self.stub.text})
+
+    async def test_validates_text_input(self):
+        self.serve()
+        response = await self.get("/api/generate/", {"text": "rain on glass"})
+        self.assertEqual(response.json(), {"response": "⚠️ Mode is missing."})
+        response = await self.get("/api/generate/", {"mode": "poem"})
+        self.assertEqual(response.json(), {"response": "⚠️ Please enter text."})
+        self.assertEqual(self.stub.requests, 0)
+
+    async def test_generates_for_the_dashboard(self):
+        self.serve()
+        response = await self.get("/api/dashboard/", FEELING)
+        self.assertEqual(response.json(), {"response": {
+            "response": self.stub.text, "blocked": False, "is_fallback": False}})
+
+    async def test_dashboard_upstream_error_falls_back(self):
+        self.serve(error_rate=1.0)
+        result = (await self.get("/api/dashboard/", FEELING)).json()["response"]
+        self.assertEqual((result["blocked"], result["is_fallback"]), (False, True))
+        self.assertEqual(self.stub.errors, 1)
+
+
+class StreamTests(ViewTestCase):
+
+    async def events(self, url, params):
+        response = await self.get(url, params)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        if response.is_async:
+            body = b"".join([part async for part in response.streaming_content])
+        else:
+            body = b"".join(response.streaming_content)
+        events = []
+        for message in body.decode().split("\n\n")[:-1]:
+            event, data = message.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    async def both(self, url, params):
+        # The async view, then the sync one.
+        return [await self.events(url, params), await self.events("/sync" + url, params)]
+
+    def split(self, events):
+        *chunks, (last, done) = events
+        self.assertEqual(last, "done")
+        self.assertEqual({event for event, _ in chunks}, {"chunk"})
+        return "".join(text for _, text in chunks), done
+
+    async def test_streams_text_then_done(self):
+        self.serve()
+        for events in await self.both("/api/generate/stream/", {"mode": "poem", "text": "rain"}):
+            self.assertGreater(len(events), 2)
+            self.assertEqual(self.split(events), (self.stub.text, {"complete": True}))
+
+    async def test_streams_the_dashboard_with_flags(self):
+        self.serve()
+        for events in await self.both("/api/dashboard/stream/", FEELING):
+            self.assertEqual(self.split(events), (self.stub.text, {
+                "blocked": False, "is_fallback": False, "complete": True}))
+
+    async def test_blocked_input(self):
+        self.serve()
+        params = dict(FEELING, desc="i want to die")
+        for events in await self.both("/api/dashboard/stream/", params):
+            text, done = self.split(events)
+            self.assertIn("You are not alone", text)
+            self.assertEqual(done, {"blocked": True, "is_fallback": False, "complete": True})
+        self.assertEqual(self.stub.requests, 0)
+
+    async def test_missing_input_falls_back(self):
+        self.serve()
+        for events in await self.both("/api/dashboard/stream/", {"mode": "poems"}):
+            self.assertEqual(self.split(events), ("Please write something.", {
+                "blocked": False, "is_fallback": True, "complete": True}))
+
+    async def test_upstream_error_before_any_text(self):
+        self.serve(error_rate=1.0)
+        for events in await self.both("/api/dashboard/stream/", FEELING):
+            _, done = self.split(events)
+            self.assertEqual(done, {"blocked": False, "is_fallback": True, "complete": True})
+        for events in await self.both("/api/generate/stream/", {"mode": "poem", "text": "rain"}):
+            text, done = self.split(events)
+            self.assertTrue(text.startswith("⚠️ Gemini error"))
+            self.assertEqual(done, {"complete": False})
+
+    async def test_upstream_error_mid_stream(self):
+        self.serve(CutOffClient)
+        for events in await self.both("/api/dashboard/stream/", FEELING):
+            self.assertEqual(self.split(events), ("A quiet", {
+                "blocked": False, "is_fallback": False, "complete": False}))
+        for events in await self.both("/api/generate/stream/", {"mode": "poem", "text": "rain"}):
+            self.assertEqual(self.split(events), ("A quiet", {"complete": False}))
+
+
+class BatchTests(ViewTestCase):
+
+    async def both(self, params):
+        # The async view, then the sync one.
+        return [await self.get(url, dict(FEELING, **params))
+                for url in ("/api/dashboard/batch/", "/sync/api/dashboard/batch/")]
+
+    async def test_answers_each_mode_once(self):
+        self.serve()
+        for response in await self.both({"modes": "poems, Letters,poems"}):
+            results = response.json()["response"]
+            self.assertEqual(list(results), ["poems", "letters"])
+            for result in results.values():
+                self.assertEqual(result, {
+                    "response": self.stub.text, "blocked": False, "is_fallback": False})
+        self.assertEqual(self.stub.requests, 4)
+
+    async def test_unknown_mode_falls_back_alone(self):
+        self.serve()
+        for response in await self.both({"modes": "poems,sonnets"}):
+            results = response.json()["response"]
+            self.assertEqual(results["poems"]["response"], self.stub.text)
+            self.assertEqual(results["sonnets"], {
+                "response": "This writing mode is not available right now.",
+                "blocked": False, "is_fallback": True})
+        self.assertEqual(self.stub.requests, 2)
+
+    async def test_one_failing_mode_keeps_the_others(self):
+        self.serve(FailsJournals)
+        for response in await self.both({"modes": "journal,poems,story"}):
+            results = response.json()["response"]
+            self.assertTrue(results["journal"]["is_fallback"])
+            self.assertEqual([results[m]["response"] for m in ("poems", "story")],
+                             [self.stub.text] * 2)
+
+    async def test_rejects_too_many_modes(self):
+        self.serve()
+        modes = ",".join(f"mode{i}" for i in range(6))
+        for response in await self.both({"modes": modes}):
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stub.requests, 0)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SignupTests(ViewTestCase):
+
+    async def signup(self, url, **fields):
+        fields = dict({"username": "mira", "email": "mira@example.com",
+                       "password": "quiet rain"}, **fields)
+        client = AsyncClient()
+        response = await client.post(url, fields, secure=True)
+        return response, client
+
+    async def test_signs_up_and_starts_a_session(self):
+        for url, name in (("/api/signup/", "mira"), ("/sync/api/signup/", "noor")):
+            response, client = await self.signup(url, username=name, email=f"{name}@example.com")
+            self.assertEqual(response.json(), {"status": "ok"})
+            user = await HeartUser.objects.aget(username=name)
+            self.assertTrue(check_password("quiet rain", user.password))
+            session = await client.asession()
+            self.assertEqual(await session.aget("user_id"), user.id)
+
+    async def test_duplicate_username_or_email(self):
+        await HeartUser.objects.acreate(username="mira", email="mira@example.com", password="x")
+        for url in ("/api/signup/", "/sync/api/signup/"):
+            response, _ = await self.signup(url, email="other@example.com")
+            self.assertEqual((response.status_code, response.json()),
+                             (400, {"error": "Username already taken"}))
+            response, _ = await self.signup(url, username="other")
+            self.assertEqual((response.status_code, response.json()),
+                             (400, {"error": "Email already exists"}))
+        self.assertEqual(await HeartUser.objects.acount(), 1)
+
+    async def test_busy_hashing_pool_answers_503(self):
+        with mock.patch("write.hashing.pool", HashingPool(1, 0)):
+            for url in ("/api/signup/", "/sync/api/signup/"):
+                response, _ = await self.signup(url)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response["Retry-After"], "2")
+        self.assertFalse(await HeartUser.objects.aexists())
+
+    async def test_hashes_on_the_pool(self):
+        threads = []
+
+        def make_password(password):
+            threads.append(threading.current_thread().name)
+            return f"plain${password}"
+
+        with mock.patch("write.hashing.pool", HashingPool(1, 1)), \
+                mock.patch("write.hashing.make_password", make_password):
+            for url, name in (("/api/signup/", "mira"), ("/sync/api/signup/", "noor")):
+                response, _ = await self.signup(url, username=name, email=f"{name}@example.com")
+                self.assertEqual(response.json(), {"status": "ok"})
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith("hashing") for name in threads))
+        user = await HeartUser.objects.aget(username="noor")
+        self.assertEqual(user.password, "plain$quiet rain")
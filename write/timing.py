@@ -0,0 +1,76 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("heartnote_timings", default=None)
+
+
+
+
+# -----------------------------------------------------
+# REQUEST PHASE TIMING
+# ServerTimingMiddleware starts a Timings per request; code on the
+# request path wraps each phase in span("name"). Outside a request
+# span() is a no-op. Spans with the same name add up, and so do spans
+# from concurrent work (batch fan-out), so they can exceed the total.
+# -----------------------------------------------------
+class Timings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_ms(self):
+        out = {name: round(seconds * 1e3, 2) for name, seconds in self.spans.items()}
+        out["total"] = round(self.total() * 1e3, 2)
+        return out
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_ms().items())
+
+
+def start():
+    timings = Timings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+@contextmanager
+def use(timings):
+    # Re-enters a request's Timings while its streaming body is consumed,
+    # after the middleware has already returned.
+    previous = _current.get()
+    _current.set(timings)
+    try:
+        yield
+    finally:
+        _current.set(previous)
@@ -0,0 +1,105 @@
+import math
+import os
+import re
+
+# Input fields longer than this (estimated tokens) are trimmed to fit;
+# ones more than INPUT_REJECT_FACTOR times over are refused instead.
+INPUT_TOKENS = int(os.getenv("HEARTNOTE_INPUT_TOKENS", "300"))
+NAME_TOKENS = int(os.getenv("HEARTNOTE_NAME_TOKENS", "40"))
+INPUT_REJECT_FACTOR = 4
+
+# Output budget = words the template asks for x tokens per word x
+# headroom, plus a little for the "Dear You," / "Date:" opening line.
+# Never above the old fixed limit.
+OUTPUT_HEADROOM = float(os.getenv("HEARTNOTE_OUTPUT_HEADROOM", "1.5"))
+OUTPUT_OVERHEAD = 24
+MAX_OUTPUT_TOKENS = 1024
+
+# gemini-2.5-flash "thinks" by default and thought tokens count against
+# maxOutputTokens, so a tight budget could be spent before any text is
+# written. These short pieces don't need it.
+THINKING_BUDGET = int(os.getenv("HEARTNOTE_THINKING_BUDGET", "0"))
+
+TRIMMED = "trimmed"
+REJECTED = "rejected"
+
+
+
+
+# -----------------------------------------------------
+# ESTIMATION
+# No countTokens round trip: Latin text runs about four characters per
+# token, Devanagari about two and a half. The estimate leans high, so
+# an input cap costs at most a few extra words and an output cap
+# doesn't cut a letter off mid-sentence.
+# -----------------------------------------------------
+LATIN_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.5
+
+TOKENS_PER_WORD = {
+    "English": 1.4,
+    "Hindi": 3.0,
+}
+
+DEVANAGARI = re.compile("[\u0900-\u097f]")
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    # Every non-ASCII character in these scripts is 2-3 UTF-8 bytes, so
+    # the byte surplus counts them without a Python-level loop.
+    other = (len(text.encode("utf-8")) - len(text)) // 2
+    latin = len(text) - other
+    return math.ceil(latin / LATIN_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN)
+
+
+def script_language(text, default="English"):
+    # Free-text modes have no language field; Devanagari input gets a
+    # Devanagari-sized answer.
+    if text and len(DEVANAGARI.findall(text)) * 3 > len(text):
+        return "Hindi"
+    return default
+
+
+def output_budget(words, language="English"):
+    per_word = TOKENS_PER_WORD.get(language, TOKENS_PER_WORD["English"])
+    tokens = math.ceil(words * per_word * OUTPUT_HEADROOM) + OUTPUT_OVERHEAD
+    return min(MAX_OUTPUT_TOKENS, tokens)
+
+
+def words_for(tokens):
+    # Rough word count for a token limit, for messages to the user.
+    return max(10, int(tokens / TOKENS_PER_WORD["English"]) // 10 * 10)
+
+
+
+
+# -----------------------------------------------------
+# FITTING INPUT
+# Returns (text, action): action is None when the text fits, TRIMMED
+# when it was cut at a word boundary to fit, REJECTED when it is too far
+# over to trim without losing what it was about (unless reject=False,
+# for short fields like a name, which are always trimmed).
+# -----------------------------------------------------
+def fit_text(text, limit, reject=True):
+    tokens = estimate_tokens(text)
+    if tokens <= limit:
+        return text, None
+    if reject and tokens > limit * INPUT_REJECT_FACTOR:
+        return text, REJECTED
+    return trim(text, limit, tokens), TRIMMED
+
+
+def trim(text, limit, tokens):
+    keep = int(len(text) * limit / tokens)
+    while keep > 0:
+        cut = text[:keep]
+        space = cut.rfind(" ")
+        if space > keep // 2:
+            cut = cut[:space]
+        cut = cut.rstrip() + "…"
+        if estimate_tokens(cut) <= limit:
+            return cut
+        keep = int(keep * 0.9)
+    return ""
@@ -1,14 +1,58 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_GENERATION:
+    generate_text = views.agenerate_text
+    generate_dashboard = views.agenerate_dashboard
+    generate_text_stream = views.agenerate_text_stream
+    generate_dashboard_stream = views.agenerate_dashboard_stream
+    generate_dashboard_batch = views.agenerate_dashboard_batch
+    signup_api = views.asignup_api
+else:
+    generate_text = views.generate_text
+    generate_dashboard = views.generate_dashboard
+    generate_text_stream = views.generate_text_stream
+    generate_dashboard_stream = views.generate_dashboard_stream
+    generate_dashboard_batch = views.generate_dashboard_batch
+    signup_api = views.signup_api
+
+# Job mode: the four generation endpoints queue a job (write/jobs.py);
+# batch requests are still answered directly.
+if settings.GENERATION_JOBS:
+    if settings.ASYNC_GENERATION:
+        generate_text = views.aqueue_text
+        generate_dashboard = views.aqueue_dashboard
+        generate_text_stream = views.aqueue_text_stream
+        generate_dashboard_stream = views.aqueue_dashboard_stream
+    else:
+        generate_text = views.queue_text
+        generate_dashboard = views.queue_dashboard
+        generate_text_stream = views.queue_text_stream
+        generate_dashboard_stream = views.queue_dashboard_stream
+
+if settings.ASYNC_GENERATION:
+    job_result = views.ajob_result
+    job_events = views.ajob_events
+else:
+    job_result = views.job_result
+    job_events = views.job_events
+
 urlpatterns = [
     path("",views.home,name="home"),
     path("aiwrite/", views.aiwrite, name="aiwrite"),
     path("dashboard/",views.dashboard,name="dashboard"),
-    path("api/generate/", views.generate_text, name="generate_text"),
-    path("api/dashboard/", views.generate_dashboard, name="generate_dashboard"),
-    path("api/signup/", views.signup_api),
+    path("service-worker.js", views.service_worker, name="service_worker"),
+    path("api/generate/", generate_text, name="generate_text"),
+    path("api/dashboard/", generate_dashboard, name="generate_dashboard"),
+    path("api/generate/stream/", generate_text_stream, name="generate_text_stream"),
+    path("api/dashboard/stream/", generate_dashboard_stream, name="generate_dashboard_stream"),
+    path("api/dashboard/batch/", generate_dashboard_batch, name="generate_dashboard_batch"),
+    path("api/jobs/<uuid:job_id>/", job_result, name="job_result"),
+    path("api/jobs/<uuid:job_id>/events/", job_events, name="job_events"),
+    path("api/signup/", signup_api),
 path("api/delete-account/", views.logout_and_delete),
+    path("metrics", views.metrics, name="metrics"),
 
 ]
 
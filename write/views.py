@@ -1,9 +1,20 @@
-from django.http import JsonResponse
-from django.shortcuts import render,redirect
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
 from .llm_service import LLM_Service
 from .dashboard_llm_service import Dashboard_LLM_Service
+from .hashing import HashingBusy, ahash_password, hash_password
+from .metrics import render as render_metrics
+from . import jobs, pages
+from .scheduler import acting_for, current_client
 from .models import HeartUser
-from django.contrib.auth.hashers import make_password
+from .timing import current as current_timings, span, use as use_timings
 from django.views.decorators.csrf import csrf_exempt
 
 
@@ -11,17 +22,21 @@ def home(request):
     # If logged-in, go to dashboard
     if request.session.get("user_id"):
         return redirect("/dashboard/")
-    return render(request, "home.html")
+    return pages.serve(request, "home.html")
 
 
 def aiwrite(request):
-    return render(request,'aiwrite.html')
+    return pages.serve(request, "aiwrite.html")
 
 def dashboard(request):
     # If NOT logged in → go to home
     if not request.session.get("user_id"):
         return redirect("/")
-    return render(request, "dashboard.html")
+    return pages.serve(request, "dashboard.html")
+
+
+def service_worker(request):
+    return pages.service_worker(request)
 
 
 
@@ -29,10 +44,22 @@ def dashboard(request):
 llm_simple = LLM_Service()
 dashboard_llm = Dashboard_LLM_Service()
 
+
+def encoded(data):
+    with span("encode"):
+        return JsonResponse(data)
+
+
+def wants_regenerate(request):
+    # ?regenerate=1 skips the cached answer and asks Gemini again.
+    return request.GET.get("regenerate", "").lower() in ("1", "true", "yes")
+
+
 def generate_text(request):
-    mode = request.GET.get("mode", "").strip()
-    text = request.GET.get("text", "").strip()
-    tone = request.GET.get("tone", "soft").strip()  # default tone = soft
+    with span("parse"):
+        mode = request.GET.get("mode", "").strip()
+        text = request.GET.get("text", "").strip()
+        tone = request.GET.get("tone", "soft").strip()  # default tone = soft
 
     # --- Validation ---
     if not mode:
@@ -42,12 +69,281 @@ def generate_text(request):
         return JsonResponse({"response": "⚠️ Please enter text."})
 
     # --- Generate output ---
-    response_text = llm_simple.generate(mode, text, tone)
+    response_text = llm_simple.generate(
+        mode, text, tone, use_cache=not wants_regenerate(request))
 
-    return JsonResponse({"response": response_text})
+    return encoded({"response": response_text})
 
 
 def generate_dashboard(request):
+    with span("parse"):
+        mode = request.GET.get("mode")
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not mode or not desc:
+        return JsonResponse({"response": "Please write something."})
+
+    result = dashboard_llm.generate(
+        mode, name, desc, depth, language,
+        use_cache=not wants_regenerate(request))
+
+    # ✅ RETURN STRING ONLY
+    return encoded({"response": result})
+
+
+# ---------------------------------------------------------
+# ASYNC VARIANTS
+# Routed instead of the two views above when the app is served
+# through hearnoteai/asgi.py (settings.ASYNC_GENERATION), so a slow
+# Gemini call parks a coroutine instead of a whole worker thread.
+# ---------------------------------------------------------
+async def agenerate_text(request):
+    with span("parse"):
+        mode = request.GET.get("mode", "").strip()
+        text = request.GET.get("text", "").strip()
+        tone = request.GET.get("tone", "soft").strip()
+
+    if not mode:
+        return JsonResponse({"response": "⚠️ Mode is missing."})
+
+    if not text:
+        return JsonResponse({"response": "⚠️ Please enter text."})
+
+    response_text = await llm_simple.agenerate(
+        mode, text, tone, use_cache=not wants_regenerate(request))
+
+    return encoded({"response": response_text})
+
+
+async def agenerate_dashboard(request):
+    with span("parse"):
+        mode = request.GET.get("mode")
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not mode or not desc:
+        return JsonResponse({"response": "Please write something."})
+
+    result = await dashboard_llm.agenerate(
+        mode, name, desc, depth, language,
+        use_cache=not wants_regenerate(request))
+
+    return encoded({"response": result})
+
+
+# ---------------------------------------------------------
+# BATCH: /api/dashboard/batch/?modes=reflection,poems,letters&...
+# One name/desc/depth/language, several modes, one response.
+# ---------------------------------------------------------
+def batch_modes(request):
+    raw = request.GET.get("modes", "")
+    modes = []
+    for mode in raw.split(","):
+        mode = mode.strip().lower()
+        if mode and mode not in modes:
+            modes.append(mode)
+    return modes
+
+
+def generate_dashboard_batch(request):
+    with span("parse"):
+        modes = batch_modes(request)
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not modes or not desc:
+        return JsonResponse({"response": "Please write something."})
+
+    if len(modes) > len(dashboard_llm.modes()):
+        return JsonResponse({"response": "Too many modes."}, status=400)
+
+    results = dashboard_llm.generate_many(
+        modes, name, desc, depth, language,
+        use_cache=not wants_regenerate(request))
+
+    return encoded({"response": results})
+
+
+async def agenerate_dashboard_batch(request):
+    with span("parse"):
+        modes = batch_modes(request)
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not modes or not desc:
+        return JsonResponse({"response": "Please write something."})
+
+    if len(modes) > len(dashboard_llm.modes()):
+        return JsonResponse({"response": "Too many modes."}, status=400)
+
+    results = await dashboard_llm.agenerate_many(
+        modes, name, desc, depth, language,
+        use_cache=not wants_regenerate(request))
+
+    return encoded({"response": results})
+
+
+# ---------------------------------------------------------
+# STREAMING (server-sent events)
+# Each chunk is sent as "event: chunk" and the stream always ends with
+# one "event: done" carrying the result flags.
+# ---------------------------------------------------------
+def sse(event, data, prefix=""):
+    with span("encode"):
+        return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def event_stream(events, event_id=None, retry=None):
+    # The body runs after the view has returned, so phase timings and
+    # the scheduler's client are re-attached while it is consumed.
+    # event_id / retry (ms) set the SSE id and reconnection delay; a
+    # reconnecting EventSource sends the id back as Last-Event-ID.
+    timings = current_timings()
+    client = current_client()
+    prefix = ""
+    if retry is not None:
+        prefix += f"retry: {retry}\n"
+    if event_id is not None:
+        prefix += f"id: {event_id}\n"
+    if hasattr(events, "__aiter__"):
+        async def encode():
+            with use_timings(timings), acting_for(client):
+                async for event, data in events:
+                    yield sse(event, data, prefix)
+    else:
+        def encode():
+            with use_timings(timings), acting_for(client):
+                for event, data in events:
+                    yield sse(event, data, prefix)
+    body = encode()
+
+    response = StreamingHttpResponse(body, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def single_event(text, **flags):
+    yield "chunk", text
+    yield "done", {"complete": True, **flags}
+
+
+def generate_text_stream(request):
+    with span("parse"):
+        mode = request.GET.get("mode", "").strip()
+        text = request.GET.get("text", "").strip()
+        tone = request.GET.get("tone", "soft").strip()
+
+    if not mode:
+        return event_stream(single_event("⚠️ Mode is missing."))
+
+    if not text:
+        return event_stream(single_event("⚠️ Please enter text."))
+
+    return event_stream(llm_simple.stream(
+        mode, text, tone, use_cache=not wants_regenerate(request)))
+
+
+def generate_dashboard_stream(request):
+    with span("parse"):
+        mode = request.GET.get("mode")
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not mode or not desc:
+        return event_stream(single_event(
+            "Please write something.", blocked=False, is_fallback=True))
+
+    return event_stream(dashboard_llm.stream(
+        mode, name, desc, depth, language,
+        use_cache=not wants_regenerate(request)))
+
+
+async def agenerate_text_stream(request):
+    with span("parse"):
+        mode = request.GET.get("mode", "").strip()
+        text = request.GET.get("text", "").strip()
+        tone = request.GET.get("tone", "soft").strip()
+
+    if not mode:
+        return event_stream(single_event("⚠️ Mode is missing."))
+
+    if not text:
+        return event_stream(single_event("⚠️ Please enter text."))
+
+    return event_stream(llm_simple.astream(
+        mode, text, tone, use_cache=not wants_regenerate(request)))
+
+
+async def agenerate_dashboard_stream(request):
+    with span("parse"):
+        mode = request.GET.get("mode")
+        name = request.GET.get("name", "")
+        desc = request.GET.get("desc", "")
+        depth = request.GET.get("depth", "light")
+        language = request.GET.get("language", "en")
+
+    if not mode or not desc:
+        return event_stream(single_event(
+            "Please write something.", blocked=False, is_fallback=True))
+
+    return event_stream(dashboard_llm.astream(
+        mode, name, desc, depth, language,
+        use_cache=not wants_regenerate(request)))
+
+
+
+
+
+
+
+# ---------------------------------------------------------
+# JOB MODE (settings.GENERATION_JOBS)
+# Routed instead of the generation views above: the request is queued
+# (write/jobs.py) and answered at once, and `manage.py runjobs` makes
+# the Gemini call, so a slow answer holds no web worker. The plain
+# endpoints return 202 with the job id; the stream endpoints redirect
+# to the job's SSE, which sends the same events they do. Results come
+# from /api/jobs/<id>/?wait=<seconds> (long-poll) or .../events/.
+#
+# Under WSGI those wait at most jobs.JOB_SYNC_WAIT, so no worker thread
+# is pinned for a whole job: a pending long-poll answers with
+# Retry-After, and the SSE connection ends and is reconnected. The
+# reconnect may come back to the stream endpoint; its Last-Event-ID
+# (the job id) sends it to the same job instead of queueing another.
+# ---------------------------------------------------------
+def text_job(request, stream):
+    # Returns (params, None), or (None, response) for a bad request.
+    mode = request.GET.get("mode", "").strip()
+    text = request.GET.get("text", "").strip()
+    tone = request.GET.get("tone", "soft").strip()
+
+    problem = None
+    if not mode:
+        problem = "⚠️ Mode is missing."
+    elif not text:
+        problem = "⚠️ Please enter text."
+    if problem is not None:
+        if stream:
+            return None, event_stream(single_event(problem))
+        return None, JsonResponse({"response": problem})
+
+    return {"mode": mode, "text": text, "tone": tone,
+            "use_cache": not wants_regenerate(request)}, None
+
+
+def dashboard_job(request, stream):
     mode = request.GET.get("mode")
     name = request.GET.get("name", "")
     desc = request.GET.get("desc", "")
@@ -55,12 +351,158 @@ def generate_dashboard(request):
     language = request.GET.get("language", "en")
 
     if not mode or not desc:
-        return JsonResponse({"response": "Please write something."})
+        if stream:
+            return None, event_stream(single_event(
+                "Please write something.", blocked=False, is_fallback=True))
+        return None, JsonResponse({"response": "Please write something."})
 
-    result = dashboard_llm.generate(mode, name, desc, depth, language)
+    return {"mode": mode, "name": name, "desc": desc, "depth": depth,
+            "language": language, "use_cache": not wants_regenerate(request)}, None
 
-    # ✅ RETURN STRING ONLY
-    return JsonResponse({"response": result})
+
+JOB_PARAMS = {
+    "generate": text_job,
+    "dashboard": dashboard_job,
+}
+
+
+def queue_generation(request, kind, stream=False):
+    job_id = resumed_job(request) if stream else None
+    if job_id is not None:
+        return redirect("job_events", job_id=job_id)
+    with span("parse"):
+        params, response = JOB_PARAMS[kind](request, stream)
+    if response is not None:
+        return response
+    try:
+        job = jobs.enqueue(kind, params)
+    except jobs.QueueFull:
+        return queue_full(kind, stream)
+    return job_created(job, stream)
+
+
+async def aqueue_generation(request, kind, stream=False):
+    job_id = resumed_job(request) if stream else None
+    if job_id is not None:
+        return redirect("job_events", job_id=job_id)
+    with span("parse"):
+        params, response = JOB_PARAMS[kind](request, stream)
+    if response is not None:
+        return response
+    try:
+        job = await sync_to_async(jobs.enqueue)(kind, params)
+    except jobs.QueueFull:
+        return queue_full(kind, stream)
+    return job_created(job, stream)
+
+
+def resumed_job(request):
+    try:
+        return uuid.UUID(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        return None
+
+
+def job_created(job, stream):
+    if stream:
+        return redirect("job_events", job_id=job.id)
+    result = reverse("job_result", args=[job.id])
+    response = JsonResponse({
+        "job": str(job.id),
+        "status": job.status,
+        "result": result,
+        "events": reverse("job_events", args=[job.id]),
+    }, status=202)
+    response["Location"] = result
+    return response
+
+
+def queue_full(kind, stream):
+    message = "⚠️ Too many requests. Please wait a moment and try again."
+    if stream:
+        return event_stream(single_event(message, blocked=True, is_fallback=False))
+    if kind == "dashboard":
+        body = {"response": {"response": message, "blocked": True, "is_fallback": False}}
+    else:
+        body = {"response": message}
+    response = JsonResponse(body, status=503)
+    response["Retry-After"] = "5"
+    return response
+
+
+def queue_text(request):
+    return queue_generation(request, "generate")
+
+
+def queue_text_stream(request):
+    return queue_generation(request, "generate", stream=True)
+
+
+def queue_dashboard(request):
+    return queue_generation(request, "dashboard")
+
+
+def queue_dashboard_stream(request):
+    return queue_generation(request, "dashboard", stream=True)
+
+
+async def aqueue_text(request):
+    return await aqueue_generation(request, "generate")
+
+
+async def aqueue_text_stream(request):
+    return await aqueue_generation(request, "generate", stream=True)
+
+
+async def aqueue_dashboard(request):
+    return await aqueue_generation(request, "dashboard")
+
+
+async def aqueue_dashboard_stream(request):
+    return await aqueue_generation(request, "dashboard", stream=True)
+
+
+def job_wait(request):
+    try:
+        return min(max(float(request.GET.get("wait", "0")), 0.0), jobs.JOB_WAIT_MAX)
+    except ValueError:
+        return 0.0
+
+
+def unknown_job():
+    return JsonResponse({"error": "Unknown or expired job"}, status=404)
+
+
+def job_result(request, job_id):
+    job = jobs.wait(job_id, min(job_wait(request), jobs.JOB_SYNC_WAIT))
+    if job is None:
+        return unknown_job()
+    response = encoded(jobs.describe(job))
+    if job.status not in jobs.FINISHED:
+        response["Retry-After"] = "1"
+    return response
+
+
+async def ajob_result(request, job_id):
+    job = await jobs.await_job(job_id, job_wait(request))
+    if job is None:
+        return unknown_job()
+    return encoded(jobs.describe(job))
+
+
+def job_events(request, job_id):
+    kind = jobs.GenerationJob.objects.filter(pk=job_id).values_list("kind", flat=True).first()
+    if kind is None:
+        return unknown_job()
+    return event_stream(jobs.events(job_id, kind, lifetime=jobs.JOB_SYNC_WAIT),
+                        event_id=job_id, retry=1000)
+
+
+async def ajob_events(request, job_id):
+    kind = await jobs.GenerationJob.objects.filter(pk=job_id).values_list("kind", flat=True).afirst()
+    if kind is None:
+        return unknown_job()
+    return event_stream(jobs.aevents(job_id, kind), event_id=job_id)
 
 
 
@@ -80,17 +522,50 @@ def signup_api(request):
     if not username or not email or not password:
         return JsonResponse({"error": "Missing fields"}, status=400)
 
-    if HeartUser.objects.filter(username=username).exists():
-        return JsonResponse({"error": "Username already taken"}, status=400)
+    # Hashing runs on the bounded pool in write/hashing.py; this thread
+    # waits for it (asignup_api doesn't).
+    try:
+        encoded = hash_password(password)
+    except HashingBusy:
+        return signup_busy()
 
-    if HeartUser.objects.filter(email=email).exists():
-        return JsonResponse({"error": "Email already exists"}, status=400)
+    return create_account(request, username, email, encoded)
 
-    user = HeartUser.objects.create(
-        username=username,
-        email=email,
-        password=make_password(password),
-    )
+
+@csrf_exempt
+async def asignup_api(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=400)
+
+    username = request.POST.get("username")
+    email = request.POST.get("email")
+    password = request.POST.get("password")
+
+    if not username or not email or not password:
+        return JsonResponse({"error": "Missing fields"}, status=400)
+
+    try:
+        encoded = await ahash_password(password)
+    except HashingBusy:
+        return signup_busy()
+
+    return await sync_to_async(create_account)(request, username, email, encoded)
+
+
+def create_account(request, username, email, encoded):
+    # One INSERT; the unique constraints on username and email decide.
+    # Only a rejected signup pays for the query that says which one.
+    try:
+        with transaction.atomic():
+            user = HeartUser.objects.create(
+                username=username,
+                email=email,
+                password=encoded,
+            )
+    except IntegrityError:
+        if HeartUser.objects.filter(username=username).exists():
+            return JsonResponse({"error": "Username already taken"}, status=400)
+        return JsonResponse({"error": "Email already exists"}, status=400)
 
     request.session["user_id"] = user.id     # VERY IMPORTANT
     request.session["username"] = user.username
@@ -98,6 +573,13 @@ def signup_api(request):
     return JsonResponse({"status": "ok"})
 
 
+def signup_busy():
+    response = JsonResponse(
+        {"error": "Too many signups right now. Please try again in a moment."}, status=503)
+    response["Retry-After"] = "2"
+    return response
+
+
 @csrf_exempt
 def logout_and_delete(request):
     if request.method != "POST":
@@ -120,6 +602,12 @@ def logout_and_delete(request):
 
 
 
-
-
-
+# ---------------------------------------------------------
+# PROMETHEUS SCRAPE ENDPOINT
+# ---------------------------------------------------------
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return HttpResponse(status=403)
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)